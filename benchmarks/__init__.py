@@ -0,0 +1,7 @@
+"""
+Offline benchmarks for LightGPT.
+
+The modules in this package run the real MCP server and client against local
+stand-ins for Groq, Tavily, Firecrawl and Pollinations, so performance can be
+measured without paid API keys or network access.
+"""
@@ -0,0 +1,183 @@
+"""
+Local stand-ins for the upstream APIs used by the MCP server and client.
+
+One Starlette app serves fake versions of:
+    - Groq chat completions (POST /openai/v1/chat/completions)
+    - Tavily search (POST /search)
+    - Firecrawl deep research (POST /v1/deep-research, GET /v1/deep-research/{id})
+    - Pollinations image generation (GET /prompt/{prompt})
+
+Every endpoint waits for a configurable base latency. Chat completions also
+"generate" their completion at a configurable token rate and report token
+usage like the real API. Routing prompts from src/mcp/client.py are answered
+with a tool call: "[tool:<name>]" in the user's question picks the tool,
+otherwise general_qa is chosen.
+
+Usage:
+    python -m benchmarks.fake_upstreams --port 9100 --latency-ms 50 --tokens-per-second 400
+"""
+
+import argparse
+import asyncio
+import json
+import re
+import time
+import uuid
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+ROUTING_MARKER = "Choose the most appropriate tool"
+TOOL_DIRECTIVE = re.compile(r"\[tool:(\w+)\]")
+QUESTION_PATTERN = re.compile(r"User's Question: (.*)")
+PDF_PATH_PATTERN = re.compile(r"\(path: ([^)]+)\)")
+
+FILLER = (
+    "This is a synthetic answer produced by the offline benchmark stub. It has roughly the "
+    "shape of a real model response, with a short summary, a few key points and some detail. "
+)
+
+
+class UpstreamConfig:
+    def __init__(self, latency_ms=50.0, tokens_per_second=400.0, completion_tokens=250, research_seconds=2.0,
+                 image_bytes=60_000):
+        self.latency = latency_ms / 1000
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.research_seconds = research_seconds
+        # JPEG start/end markers around filler, sized like a typical generated image
+        self.image = b"\xff\xd8\xff\xe0" + bytes(max(0, image_bytes - 6)) + b"\xff\xd9"
+
+
+def _routing_answer(prompt):
+    question_match = QUESTION_PATTERN.search(prompt)
+    question = question_match.group(1).strip() if question_match else "benchmark question"
+    directive = TOOL_DIRECTIVE.search(question)
+    tool = directive.group(1) if directive else "general_qa"
+    arguments = {
+        "general_qa": {"question": question},
+        "generate_code": {"code_request": question, "language": "python"},
+        "math_solver": {"expression": "sqrt(16) + 2 ** 10"},
+        "tavily_search": {"query": question},
+        "chat_with_assistant": {"message": question},
+        "generate_prompt": {"topic": question, "purpose": "general"},
+        "generate_image": {"prompt": question},
+        "pdf_qa": {"query": question, "pdf_path": (PDF_PATH_PATTERN.search(prompt) or [None, ""])[1]},
+    }.get(tool, {"question": question})
+    return json.dumps({"tool": tool, "arguments": arguments})
+
+
+def _estimate_tokens(messages):
+    return sum(len(str(m.get("content", ""))) for m in messages) // 4 + 1
+
+
+def create_app(config):
+    """
+    Build the fake upstream app.
+
+    Args:
+        config (UpstreamConfig): Latency and generation settings
+
+    Returns:
+        Starlette: The application
+    """
+    research_jobs = {}
+
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        prompt = str(messages[-1].get("content", "")) if messages else ""
+        if ROUTING_MARKER in prompt:
+            content = _routing_answer(prompt)
+            completion_tokens = len(content) // 4 + 1
+        else:
+            completion_tokens = min(int(body.get("max_tokens") or config.completion_tokens), config.completion_tokens)
+            words = (FILLER * (completion_tokens // 20 + 1)).split()
+            content = " ".join(words[: int(completion_tokens * 0.75)])
+        await asyncio.sleep(config.latency + completion_tokens / config.tokens_per_second)
+        prompt_tokens = _estimate_tokens(messages)
+        return JSONResponse({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake-model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+    async def tavily_search(request: Request):
+        body = await request.json()
+        await asyncio.sleep(config.latency)
+        query = body.get("query", "")
+        results = [
+            {
+                "title": f"Result {i} for {query}",
+                "url": f"https://example.com/{i}",
+                "content": FILLER * 2,
+                "score": 1.0 - i / 20,
+            }
+            for i in range(int(body.get("max_results", 5)))
+        ]
+        return JSONResponse({"query": query, "results": results, "response_time": config.latency})
+
+    async def start_deep_research(request: Request):
+        await request.body()
+        await asyncio.sleep(config.latency)
+        job_id = uuid.uuid4().hex
+        research_jobs[job_id] = time.monotonic() + config.research_seconds
+        return JSONResponse({"success": True, "id": job_id})
+
+    async def deep_research_status(request: Request):
+        await asyncio.sleep(config.latency)
+        job_id = request.path_params["job_id"]
+        ready_at = research_jobs.get(job_id)
+        if ready_at is None:
+            return JSONResponse({"success": False, "error": "Unknown job"}, status_code=404)
+        if time.monotonic() < ready_at:
+            return JSONResponse({"success": True, "status": "processing", "data": {"activities": [], "sources": []}})
+        sources = [{"url": f"https://example.com/source/{i}", "title": f"Source {i}"} for i in range(5)]
+        data = {"finalAnalysis": FILLER * 10, "activities": [], "sources": sources}
+        return JSONResponse({"success": True, "status": "completed", "data": data, **data})
+
+    async def pollinations(request: Request):
+        await asyncio.sleep(config.latency)
+        return Response(config.image, media_type="image/jpeg")
+
+    return Starlette(routes=[
+        Route("/openai/v1/chat/completions", endpoint=chat_completions, methods=["POST"]),
+        Route("/search", endpoint=tavily_search, methods=["POST"]),
+        Route("/v1/deep-research", endpoint=start_deep_research, methods=["POST"]),
+        Route("/v1/deep-research/{job_id}", endpoint=deep_research_status, methods=["GET"]),
+        Route("/prompt/{prompt:path}", endpoint=pollinations, methods=["GET"]),
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run fake Groq/Tavily/Firecrawl/Pollinations endpoints")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Base latency of every response")
+    parser.add_argument("--tokens-per-second", type=float, default=400.0, help="Completion generation speed")
+    parser.add_argument("--completion-tokens", type=int, default=250, help="Completion length cap")
+    parser.add_argument("--research-seconds", type=float, default=2.0, help="Time until deep research completes")
+    parser.add_argument("--image-bytes", type=int, default=60_000, help="Size of generated images")
+    args = parser.parse_args()
+    config = UpstreamConfig(
+        args.latency_ms, args.tokens_per_second, args.completion_tokens, args.research_seconds, args.image_bytes
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Shared helpers for the offline benchmarks: starting the fake upstreams and
+the real MCP server as subprocesses, sampling process memory and summarising
+latencies.
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_DIR = os.path.join(PROJECT_ROOT, "server")
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def summarize_latencies(latencies):
+    """
+    Summarise latencies given in seconds.
+
+    Returns:
+        dict: p50/p95/p99/mean/max in milliseconds
+    """
+    if not latencies:
+        return {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "mean_ms": 0.0, "max_ms": 0.0}
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2),
+    }
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=60.0, process=None):
+    """Block until something listens on the local port, or raise on timeout."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Process exited with code {process.returncode} before listening on {port}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"Nothing listening on port {port} after {timeout}s")
+
+
+def _proc_children():
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    return children
+
+
+def process_tree(pid):
+    """Return the pid and all descendant pids (Linux only; just the pid elsewhere)."""
+    if not os.path.isdir("/proc"):
+        return [pid]
+    children = _proc_children()
+    pids, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        pids.append(current)
+        stack.extend(children.get(current, []))
+    return pids
+
+
+def _read_status_kb(pid, field):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def rss_mb(pid):
+    """Resident memory of a process and its descendants, in MB (0 if unavailable)."""
+    return sum(_read_status_kb(p, "VmRSS") for p in process_tree(pid)) / 1024
+
+
+def open_fds(pid):
+    """Open file descriptors of a process and its descendants (0 if unavailable)."""
+    total = 0
+    for p in process_tree(pid):
+        try:
+            total += len(os.listdir(f"/proc/{p}/fd"))
+        except OSError:
+            pass
+    return total
+
+
+class RssSampler:
+    """Samples the RSS of a process tree on a background thread and keeps the peak."""
+
+    def __init__(self, pid, interval=0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_mb = max(self.peak_mb, rss_mb(self.pid))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+class BenchmarkStack:
+    """
+    Runs the fake upstreams and the MCP server as subprocesses.
+
+    Args:
+        latency_ms (float): Base latency of the fake upstreams
+        tokens_per_second (float): Completion speed of the fake Groq
+        workers (int): MCP_WORKERS for the server
+        extra_env (dict, optional): Additional environment for the server
+    """
+
+    def __init__(self, latency_ms=50.0, tokens_per_second=400.0, workers=1, extra_env=None):
+        self.latency_ms = latency_ms
+        self.tokens_per_second = tokens_per_second
+        self.workers = workers
+        self.extra_env = extra_env or {}
+        self.upstream_port = free_port()
+        self.server_port = free_port()
+        self.work_dir = tempfile.mkdtemp(prefix="lightgpt-bench-")
+        self.upstream = None
+        self.server = None
+
+    @property
+    def upstream_url(self):
+        return f"http://127.0.0.1:{self.upstream_port}"
+
+    @property
+    def server_url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def client_env(self):
+        """Environment the in-process client needs to reach the stack."""
+        return {
+            "SERVER_URL": f"{self.server_url}/sse",
+            "MCP_HTTP_URL": f"{self.server_url}/mcp/",
+            "MCP_STREAM_URL": f"{self.server_url}/mcp-stream/",
+            "GROQ_BASE_URL": self.upstream_url,
+            "GROQ_API_KEY": "benchmark",
+            "LOG_DIR": os.path.join(self.work_dir, "logs"),
+        }
+
+    def server_env(self):
+        env = dict(os.environ)
+        env.update({
+            "MCP_PORT": str(self.server_port),
+            "MCP_WORKERS": str(self.workers),
+            "GROQ_API_KEY": "benchmark",
+            "GROQ_BASE_URL": self.upstream_url,
+            "TAVILY_API_KEY": "tvly-benchmark",
+            "TAVILY_BASE_URL": self.upstream_url,
+            "FIRECRAWL_API_KEY": "fc-benchmark",
+            "FIRECRAWL_API_URL": self.upstream_url,
+            "POLLINATIONS_URL": self.upstream_url,
+            "PDF_EMBED_MODEL": "mock",
+            "LOG_DIR": os.path.join(self.work_dir, "logs"),
+        })
+        env.update(self.extra_env)
+        return env
+
+    def start(self):
+        self.upstream = subprocess.Popen(
+            [
+                sys.executable, "-m", "benchmarks.fake_upstreams",
+                "--port", str(self.upstream_port),
+                "--latency-ms", str(self.latency_ms),
+                "--tokens-per-second", str(self.tokens_per_second),
+            ],
+            cwd=PROJECT_ROOT,
+        )
+        wait_for_port(self.upstream_port, process=self.upstream)
+        # The server writes images and PDF indexes relative to its working directory
+        server_cwd = os.path.join(self.work_dir, "server")
+        os.makedirs(server_cwd, exist_ok=True)
+        self.server = subprocess.Popen(
+            [sys.executable, os.path.join(SERVER_DIR, "mcp_server_sse.py")],
+            cwd=server_cwd,
+            env=self.server_env(),
+        )
+        wait_for_port(self.server_port, process=self.server)
+        return self
+
+    def stop(self):
+        for process in (self.server, self.upstream):
+            if process is not None and process.poll() is None:
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,326 @@
+"""
+Many-client load generator and soak test for the MCP server.
+
+Simulated users each hold an MCP session open and loop over: think (an
+exponentially distributed pause), pick a tool from a weighted mix, call it.
+The number of users ramps up stage by stage; the last stage can be held for
+hours as a soak test. While it runs, the generator samples the server's event
+loop lag (from /metrics), open file descriptors and RSS, plus its own loop
+lag, and records latency and error rates per stage.
+
+The output is a saturation curve (one row per stage: users, throughput,
+latency percentiles, error rate, lag, memory) as JSON and CSV, a time series
+of samples, and the RSS growth rate over the soak period.
+
+Usage:
+    python -m benchmarks.loadgen --stages 50,200,500,1000 --stage-seconds 60
+    python -m benchmarks.loadgen --stages 200 --soak-hours 4 --sample-interval 30
+    python -m benchmarks.loadgen --server-url http://localhost:8000 --server-pid 12345 --stages 100,500
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import re
+import sys
+import time
+from datetime import datetime
+
+import httpx
+
+from benchmarks.harness import PROJECT_ROOT, BenchmarkStack, open_fds, rss_mb, summarize_latencies
+
+sys.path.insert(0, PROJECT_ROOT)
+
+DEFAULT_MIX = "general_qa:4,chat_with_assistant:3,tavily_search:2,math_solver:2,generate_code:1,generate_image:1"
+RESULTS_DIR = os.path.join(PROJECT_ROOT, "benchmarks", "results")
+LAG_METRIC = re.compile(r"^lightgpt_event_loop_lag_seconds (\S+)$", re.MULTILINE)
+
+TOOL_ARGUMENTS = {
+    "math_solver": lambda i: {"expression": f"sqrt({i % 1000}) + 2 ** 10"},
+    "chat_with_assistant": lambda i: {"message": f"Hello number {i}"},
+    "general_qa": lambda i: {"question": f"Load test question {i}"},
+    "generate_code": lambda i: {"code_request": f"Function number {i}", "language": "python"},
+    "generate_prompt": lambda i: {"topic": f"Topic {i}", "purpose": "general"},
+    "tavily_search": lambda i: {"query": f"Load test search {i}"},
+    "generate_image": lambda i: {"prompt": f"Load test image {i}"},
+}
+
+
+def parse_mix(mix):
+    tools, weights = [], []
+    for item in mix.split(","):
+        name, _, weight = item.partition(":")
+        tools.append(name.strip())
+        weights.append(float(weight or 1))
+    return tools, weights
+
+
+def raise_fd_limit():
+    """Raise the soft open-file limit to the hard limit; thousands of sessions need it."""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+def rss_growth_per_hour(samples):
+    """Least-squares slope of RSS over time, in MB per hour."""
+    points = [(s["elapsed_s"], s["server_rss_mb"]) for s in samples if s["server_rss_mb"]]
+    if len(points) < 2:
+        return 0.0
+    n = len(points)
+    mean_t = sum(t for t, _ in points) / n
+    mean_r = sum(r for _, r in points) / n
+    variance = sum((t - mean_t) ** 2 for t, _ in points)
+    if not variance:
+        return 0.0
+    slope = sum((t - mean_t) * (r - mean_r) for t, r in points) / variance
+    return round(slope * 3600, 2)
+
+
+class StageStats:
+    def __init__(self, users):
+        self.users = users
+        self.latencies = []
+        self.calls = 0
+        self.errors = 0
+        self.session_errors = 0
+        self.server_lag_max = 0.0
+        self.client_lag_max = 0.0
+        self.started = time.perf_counter()
+
+
+class LoadGenerator:
+    def __init__(self, args, server_url, server_pid):
+        self.args = args
+        self.server_url = server_url
+        self.server_pid = server_pid
+        self.tools, self.weights = parse_mix(args.mix)
+        self.stats = StageStats(0)
+        self.users = []
+        self.open_sessions = 0
+        self.samples = []
+        self.client_lag = 0.0
+        self.started = time.perf_counter()
+        self.sample_file = None
+
+    async def user(self, user_id):
+        from src.mcp.client import open_session, call_tool
+
+        counter = 0
+        while True:
+            try:
+                async with open_session(transport=self.args.transport) as session:
+                    self.open_sessions += 1
+                    try:
+                        while True:
+                            await asyncio.sleep(random.expovariate(1 / self.args.think_time))
+                            tool = random.choices(self.tools, self.weights)[0]
+                            counter += 1
+                            stats = self.stats
+                            start = time.perf_counter()
+                            try:
+                                result = await call_tool(
+                                    tool, TOOL_ARGUMENTS[tool](user_id * 100000 + counter), session=session
+                                )
+                                failed = bool(getattr(result, "isError", False))
+                            except Exception:
+                                failed = True
+                            stats.latencies.append(time.perf_counter() - start)
+                            stats.calls += 1
+                            if failed:
+                                stats.errors += 1
+                                break
+                    finally:
+                        self.open_sessions -= 1
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.stats.session_errors += 1
+                await asyncio.sleep(1.0)
+
+    async def monitor_client_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(0.5)
+            self.client_lag = max(0.0, loop.time() - start - 0.5)
+            self.stats.client_lag_max = max(self.stats.client_lag_max, self.client_lag)
+
+    async def scrape_server_lag(self, client):
+        paths = ["/metrics"] if self.args.workers <= 1 else [
+            f"/metrics/worker/{i}" for i in range(self.args.workers)
+        ]
+        lag = 0.0
+        for path in paths:
+            try:
+                response = await client.get(f"{self.server_url}{path}", timeout=5)
+                match = LAG_METRIC.search(response.text)
+                if match:
+                    lag = max(lag, float(match.group(1)))
+            except httpx.HTTPError:
+                pass
+        return lag
+
+    async def monitor(self):
+        async with httpx.AsyncClient() as client:
+            next_sample = 0.0
+            while True:
+                server_lag = await self.scrape_server_lag(client)
+                self.stats.server_lag_max = max(self.stats.server_lag_max, server_lag)
+                elapsed = time.perf_counter() - self.started
+                if elapsed >= next_sample:
+                    next_sample = elapsed + self.args.sample_interval
+                    sample = {
+                        "elapsed_s": round(elapsed, 1),
+                        "users": len(self.users),
+                        "open_sessions": self.open_sessions,
+                        "server_rss_mb": round(rss_mb(self.server_pid), 1) if self.server_pid else None,
+                        "server_open_fds": open_fds(self.server_pid) if self.server_pid else None,
+                        "server_loop_lag_ms": round(server_lag * 1000, 2),
+                        "client_loop_lag_ms": round(self.client_lag * 1000, 2),
+                        "calls": self.stats.calls,
+                        "errors": self.stats.errors + self.stats.session_errors,
+                    }
+                    self.samples.append(sample)
+                    if self.sample_file:
+                        self.sample_file.write(json.dumps(sample) + "\n")
+                        self.sample_file.flush()
+                await asyncio.sleep(1.0)
+
+    async def ramp_to(self, target):
+        """Start users until ``target`` are running, spread over the ramp period."""
+        missing = target - len(self.users)
+        if missing <= 0:
+            return
+        delay = self.args.ramp_seconds / missing
+        for _ in range(missing):
+            self.users.append(asyncio.create_task(self.user(len(self.users))))
+            await asyncio.sleep(delay)
+
+    def close_stage(self):
+        stats = self.stats
+        elapsed = time.perf_counter() - stats.started
+        attempts = stats.calls + stats.session_errors
+        row = {
+            "users": stats.users,
+            "duration_s": round(elapsed, 1),
+            "calls": stats.calls,
+            "throughput_per_s": round(stats.calls / elapsed, 2) if elapsed else 0.0,
+            "error_rate": round((stats.errors + stats.session_errors) / attempts, 4) if attempts else 0.0,
+            "session_errors": stats.session_errors,
+            "server_loop_lag_max_ms": round(stats.server_lag_max * 1000, 2),
+            "client_loop_lag_max_ms": round(stats.client_lag_max * 1000, 2),
+            "server_rss_mb": round(rss_mb(self.server_pid), 1) if self.server_pid else None,
+            "server_open_fds": open_fds(self.server_pid) if self.server_pid else None,
+            **summarize_latencies(stats.latencies),
+        }
+        print(json.dumps(row))
+        return row
+
+    async def run(self, stages, sample_path):
+        background = [
+            asyncio.create_task(self.monitor_client_lag()),
+            asyncio.create_task(self.monitor()),
+        ]
+        curve = []
+        soak = None
+        with open(sample_path, "w") as self.sample_file:
+            try:
+                for users in stages:
+                    self.stats = StageStats(users)
+                    await self.ramp_to(users)
+                    # Measure the stage only once every user is running
+                    self.stats = StageStats(users)
+                    await asyncio.sleep(self.args.stage_seconds)
+                    curve.append(self.close_stage())
+                if self.args.soak_hours > 0:
+                    self.stats = StageStats(stages[-1])
+                    soak_start = len(self.samples)
+                    await asyncio.sleep(self.args.soak_hours * 3600)
+                    soak = self.close_stage()
+                    soak["rss_growth_mb_per_hour"] = rss_growth_per_hour(self.samples[soak_start:])
+            finally:
+                for task in self.users + background:
+                    task.cancel()
+                await asyncio.gather(*self.users, *background, return_exceptions=True)
+        return curve, soak
+
+
+def max_users_within_slo(curve, p95_ms, max_error_rate):
+    within = [row["users"] for row in curve if row["p95_ms"] <= p95_ms and row["error_rate"] <= max_error_rate]
+    return max(within) if within else 0
+
+
+async def main_async(args):
+    raise_fd_limit()
+    stages = [int(s) for s in args.stages.split(",")]
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    prefix = os.path.join(RESULTS_DIR, f"loadgen-{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+
+    stack = None
+    if args.server_url:
+        server_url, server_pid = args.server_url.rstrip("/"), args.server_pid
+        os.environ.setdefault("SERVER_URL", f"{server_url}/sse")
+        os.environ.setdefault("MCP_HTTP_URL", f"{server_url}/mcp/")
+        os.environ.setdefault("MCP_STREAM_URL", f"{server_url}/mcp-stream/")
+    else:
+        stack = BenchmarkStack(args.latency_ms, args.tokens_per_second, args.workers).start()
+        os.environ.update(stack.client_env())
+        server_url, server_pid = stack.server_url, stack.server.pid
+
+    try:
+        generator = LoadGenerator(args, server_url, server_pid)
+        curve, soak = await generator.run(stages, f"{prefix}-samples.jsonl")
+    finally:
+        if stack:
+            stack.stop()
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": vars(args),
+        "saturation_curve": curve,
+        "max_users_within_slo": max_users_within_slo(curve, args.slo_p95_ms, args.slo_error_rate),
+        "soak": soak,
+        "samples": generator.samples,
+    }
+    with open(f"{prefix}.json", "w") as f:
+        json.dump(report, f, indent=2)
+    if curve:
+        with open(f"{prefix}-curve.csv", "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(curve[0].keys()))
+            writer.writeheader()
+            writer.writerows(curve)
+    print(f"Max users within SLO: {report['max_users_within_slo']}")
+    print(f"Results written to {prefix}.json and {prefix}-curve.csv")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MCP server load generator and soak test")
+    parser.add_argument("--stages", default="10,50,100,250,500,1000", help="Comma-separated user counts")
+    parser.add_argument("--stage-seconds", type=float, default=60.0, help="Measured time per stage")
+    parser.add_argument("--ramp-seconds", type=float, default=10.0, help="Time to start a stage's new users")
+    parser.add_argument("--soak-hours", type=float, default=0.0, help="Hold the last stage this long")
+    parser.add_argument("--sample-interval", type=float, default=10.0, help="Seconds between resource samples")
+    parser.add_argument("--think-time", type=float, default=5.0, help="Mean pause between a user's calls")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Weighted tool mix, e.g. general_qa:4,math_solver:1")
+    parser.add_argument("--transport", choices=["sse", "streamable-http"], default="sse")
+    parser.add_argument("--server-url", help="Use a running server instead of starting the offline stack")
+    parser.add_argument("--server-pid", type=int, help="Pid of the running server for RSS/FD sampling")
+    parser.add_argument("--workers", type=int, default=1, help="MCP_WORKERS of the server")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Fake upstream base latency")
+    parser.add_argument("--tokens-per-second", type=float, default=400.0, help="Fake Groq completion speed")
+    parser.add_argument("--slo-p95-ms", type=float, default=2000.0, help="p95 latency objective")
+    parser.add_argument("--slo-error-rate", type=float, default=0.01, help="Error rate objective")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
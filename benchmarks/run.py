@@ -0,0 +1,193 @@
+"""
+Offline end-to-end benchmark of the MCP server and client.
+
+Starts the fake upstreams and the real MCP server, then calls every tool
+through src/mcp/client.py at the requested concurrency. "routed_query" goes
+through run_query(), including the routing LLM call. For each tool the run
+reports p50/p95/p99 latency, throughput, error count and the peak RSS of the
+server process tree, and writes everything to a JSON file that later runs
+can be compared against.
+
+Usage:
+    python -m benchmarks.run --calls 40 --concurrency 8
+    python -m benchmarks.run --tools general_qa,routed_query --compare benchmarks/results/baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+from benchmarks.harness import PROJECT_ROOT, BenchmarkStack, RssSampler, summarize_latencies
+from benchmarks.sample_pdfs import create_sample_pdfs
+
+sys.path.insert(0, PROJECT_ROOT)
+
+DEFAULT_TOOLS = [
+    "math_solver",
+    "chat_with_assistant",
+    "general_qa",
+    "generate_code",
+    "generate_prompt",
+    "tavily_search",
+    "generate_image",
+    "deep_research",
+    "pdf_qa",
+    "routed_query",
+]
+RESULTS_DIR = os.path.join(PROJECT_ROOT, "benchmarks", "results")
+
+
+def tool_arguments(tool, index, pdf_path):
+    question = f"Benchmark question number {index}"
+    return {
+        "math_solver": {"expression": f"sqrt({index * index}) + 2 ** 10"},
+        "chat_with_assistant": {"message": question},
+        "general_qa": {"question": question},
+        "generate_code": {"code_request": question, "language": "python"},
+        "generate_prompt": {"topic": question, "purpose": "general"},
+        "tavily_search": {"query": question},
+        "generate_image": {"prompt": question},
+        "deep_research": {"query": question, "depth": "1"},
+        "pdf_qa": {"query": question, "pdf_path": pdf_path},
+    }[tool]
+
+
+async def bench_tool(tool, calls, concurrency, server_pid, pdf_path):
+    from src.mcp.client import call_tool, run_query, SERVER_URL
+
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_call(index):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                if tool == "routed_query":
+                    _, tool_used = await run_query(SERVER_URL, f"[tool:general_qa] Benchmark question {index}")
+                    failed = tool_used is None
+                else:
+                    result = await call_tool(tool, tool_arguments(tool, index, pdf_path))
+                    failed = bool(getattr(result, "isError", False))
+            except Exception:
+                failed = True
+            latencies.append(time.perf_counter() - start)
+            if failed:
+                errors += 1
+
+    with RssSampler(server_pid) as sampler:
+        start = time.perf_counter()
+        await asyncio.gather(*(one_call(i) for i in range(calls)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "tool": tool,
+        "calls": calls,
+        "concurrency": concurrency,
+        "errors": errors,
+        "throughput_per_s": round(calls / elapsed, 2) if elapsed else 0.0,
+        "peak_rss_mb": round(sampler.peak_mb, 1),
+        **summarize_latencies(latencies),
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare a run with a baseline run.
+
+    Args:
+        results (dict): Current run
+        baseline (dict): Earlier run loaded from JSON
+        threshold (float): Allowed relative slowdown, e.g. 0.1 for 10%
+
+    Returns:
+        list: Human-readable regression descriptions
+    """
+    previous = {r["tool"]: r for r in baseline.get("results", [])}
+    regressions = []
+    for current in results["results"]:
+        before = previous.get(current["tool"])
+        if not before:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if before[key] and current[key] > before[key] * (1 + threshold):
+                regressions.append(f"{current['tool']}: {key} {before[key]} -> {current[key]}")
+        if before["throughput_per_s"] and current["throughput_per_s"] < before["throughput_per_s"] * (1 - threshold):
+            regressions.append(
+                f"{current['tool']}: throughput {before['throughput_per_s']} -> {current['throughput_per_s']}"
+            )
+        if current["errors"] > before["errors"]:
+            regressions.append(f"{current['tool']}: errors {before['errors']} -> {current['errors']}")
+    return regressions
+
+
+async def run(args):
+    tools = args.tools.split(",") if args.tools else DEFAULT_TOOLS
+    stack = BenchmarkStack(args.latency_ms, args.tokens_per_second, args.workers)
+    os.environ.update(stack.client_env())
+    os.environ["MCP_TRANSPORT"] = args.transport
+    pdf_path = create_sample_pdfs(os.path.join(stack.work_dir, "pdfs"), sizes=(args.pdf_pages,))[0]
+
+    with stack:
+        results = []
+        for tool in tools:
+            result = await bench_tool(tool, args.calls, args.concurrency, stack.server.pid, pdf_path)
+            print(json.dumps(result))
+            results.append(result)
+
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "calls": args.calls,
+            "concurrency": args.concurrency,
+            "latency_ms": args.latency_ms,
+            "tokens_per_second": args.tokens_per_second,
+            "workers": args.workers,
+            "transport": args.transport,
+            "pdf_pages": args.pdf_pages,
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark")
+    parser.add_argument("--tools", help=f"Comma-separated subset of: {','.join(DEFAULT_TOOLS)}")
+    parser.add_argument("--calls", type=int, default=40, help="Calls per tool")
+    parser.add_argument("--concurrency", type=int, default=8, help="Calls in flight at once")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Base latency of the fake upstreams")
+    parser.add_argument("--tokens-per-second", type=float, default=400.0, help="Fake Groq completion speed")
+    parser.add_argument("--workers", type=int, default=1, help="MCP_WORKERS for the server")
+    parser.add_argument("--transport", choices=["sse", "streamable-http"], default="sse")
+    parser.add_argument("--pdf-pages", type=int, default=10, help="Pages in the pdf_qa sample document")
+    parser.add_argument("--output", help="Where to write the JSON results (default: benchmarks/results/)")
+    parser.add_argument("--compare", help="Baseline JSON to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative slowdown counted as a regression")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"run-{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
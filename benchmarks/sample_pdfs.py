@@ -0,0 +1,64 @@
+"""
+Generate sample PDFs for the pdf_qa benchmarks.
+
+The PDFs are built with ReportLab at run time instead of being checked in.
+"""
+
+import os
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+PARAGRAPH = (
+    "Section {section}. LightGPT routes each question to a tool running on the MCP server. "
+    "This paragraph is filler text for the offline PDF question answering benchmark, long "
+    "enough to be split into several chunks when the document is indexed."
+)
+
+
+def create_sample_pdf(path, pages=5, paragraphs_per_page=12):
+    """
+    Write a text-only PDF with numbered sections.
+
+    Args:
+        path (str): Output file path
+        pages (int): Number of pages
+        paragraphs_per_page (int): Paragraphs written on each page
+
+    Returns:
+        str: The path of the written file
+    """
+    c = canvas.Canvas(path, pagesize=letter)
+    width, height = letter
+    section = 1
+    for _ in range(pages):
+        y_position = height - 72
+        c.setFont("Helvetica", 10)
+        for _ in range(paragraphs_per_page):
+            text = PARAGRAPH.format(section=section)
+            for start in range(0, len(text), 95):
+                c.drawString(72, y_position, text[start:start + 95])
+                y_position -= 14
+            y_position -= 8
+            section += 1
+        c.showPage()
+    c.save()
+    return path
+
+
+def create_sample_pdfs(directory, sizes=(2, 10, 40)):
+    """
+    Write one sample PDF per requested page count.
+
+    Args:
+        directory (str): Output directory, created if missing
+        sizes (tuple): Page counts of the generated PDFs
+
+    Returns:
+        list: Paths of the generated PDFs, in the order of ``sizes``
+    """
+    os.makedirs(directory, exist_ok=True)
+    return [
+        create_sample_pdf(os.path.join(directory, f"sample_{pages}_pages.pdf"), pages=pages)
+        for pages in sizes
+    ]
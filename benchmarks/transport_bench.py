@@ -0,0 +1,136 @@
+"""
+Compare the SSE and streamable HTTP transports of the MCP server.
+
+The server app is started in-process behind a counting middleware, then the
+same tool call is made repeatedly through src/mcp/client.py over each
+transport. For every transport the script reports call latency, HTTP requests
+per call and the peak number of open HTTP requests and TCP connections.
+
+Usage:
+    python -m benchmarks.transport_bench --calls 50 --concurrency 5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "server"))
+
+import uvicorn
+
+from benchmarks.harness import percentile
+
+
+class RequestCounter:
+    """ASGI middleware counting HTTP requests and how many are open at once."""
+
+    def __init__(self, app):
+        self.app = app
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.open = 0
+        self.peak_open = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        self.requests += 1
+        self.open += 1
+        self.peak_open = max(self.peak_open, self.open)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.open -= 1
+
+
+async def run_transport(transport, counter, server, calls, concurrency, tool, arguments):
+    from src.mcp.client import open_session
+
+    counter.reset()
+    peak_connections = 0
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_call():
+        async with semaphore:
+            start = time.perf_counter()
+            async with open_session(transport=transport) as session:
+                await session.call_tool(tool, arguments=arguments)
+            latencies.append(time.perf_counter() - start)
+
+    async def sample_connections():
+        nonlocal peak_connections
+        while True:
+            peak_connections = max(peak_connections, len(server.server_state.connections))
+            await asyncio.sleep(0.005)
+
+    sampler = asyncio.create_task(sample_connections())
+    start = time.perf_counter()
+    await asyncio.gather(*(one_call() for _ in range(calls)))
+    elapsed = time.perf_counter() - start
+    sampler.cancel()
+
+    return {
+        "transport": transport,
+        "calls": calls,
+        "concurrency": concurrency,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2),
+        "throughput_per_s": round(calls / elapsed, 2),
+        "http_requests_per_call": round(counter.requests / calls, 2),
+        "peak_open_requests": counter.peak_open,
+        "peak_tcp_connections": peak_connections,
+    }
+
+
+async def main(args):
+    os.environ.setdefault("MCP_PORT", str(args.port))
+    import mcp_server_sse
+    import src.mcp.client as client
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    client.SERVER_URL = f"{base_url}/sse"
+    client.MCP_HTTP_URL = f"{base_url}/mcp/"
+    client.MCP_STREAM_URL = f"{base_url}/mcp-stream/"
+
+    counter = RequestCounter(mcp_server_sse.app)
+    server = uvicorn.Server(uvicorn.Config(counter, host="127.0.0.1", port=args.port, log_level="warning"))
+    serve_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    arguments = {"expression": args.expression}
+    results = []
+    try:
+        for transport in ("sse", "streamable-http"):
+            results.append(await run_transport(
+                transport, counter, server, args.calls, args.concurrency, "math_solver", arguments
+            ))
+    finally:
+        server.should_exit = True
+        await serve_task
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark MCP transports")
+    parser.add_argument("--calls", type=int, default=50, help="Tool calls per transport")
+    parser.add_argument("--concurrency", type=int, default=5, help="Calls in flight at once")
+    parser.add_argument("--port", type=int, default=8765, help="Port for the in-process server")
+    parser.add_argument("--expression", default="sqrt(16) + 2 ** 10", help="math_solver expression")
+    parser.add_argument("--output", help="Optional path to write the JSON results")
+    asyncio.run(main(parser.parse_args()))
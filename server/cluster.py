@@ -0,0 +1,341 @@
+"""
+Multi-process deployment for the MCP SSE server.
+
+SseServerTransport keeps its sessions in process memory, so the POST to
+/messages/ for a session has to reach the process that owns the matching
+/sse stream. This module runs the MCP app in several worker processes, each
+listening on its own Unix socket (or loopback port where Unix sockets are not
+available), and puts a small router in front of them. The router spreads new
+/sse streams over the workers, remembers which worker handed out each
+session_id and forwards message posts to that worker. Streamable HTTP
+requests are stateless and go to whichever worker is least busy.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import re
+import socket
+import tempfile
+
+import httpx
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+
+from src.utils.log_utils import get_logger
+
+logger = get_logger("cluster")
+
+SESSION_ID_PATTERN = re.compile(rb"session_id=([0-9a-fA-F]{32})")
+
+# Headers that must not be copied between the client and worker connections
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
+    "host",
+    "content-length",
+}
+
+WORKER_CHECK_INTERVAL = 2.0
+
+
+def _filter_headers(headers):
+    return {k: v for k, v in headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+
+
+def _worker_binds(workers, port):
+    """
+    Pick a listening address for every worker.
+
+    Args:
+        workers (int): Number of worker processes
+        port (int): Public port of the router, used to derive loopback ports
+
+    Returns:
+        list: One dict per worker with either a "uds" path or a "port"
+    """
+    if hasattr(socket, "AF_UNIX"):
+        socket_dir = tempfile.mkdtemp(prefix="mcp-workers-")
+        return [{"uds": os.path.join(socket_dir, f"worker-{i}.sock")} for i in range(workers)]
+    return [{"port": port + 1 + i} for i in range(workers)]
+
+
+def _run_worker(app_path, bind):
+    """Entry point of a worker process: serve the MCP app on its private address."""
+    if "uds" in bind:
+        uvicorn.run(app_path, uds=bind["uds"], log_level="warning")
+    else:
+        uvicorn.run(app_path, host="127.0.0.1", port=bind["port"], log_level="warning")
+
+
+def _worker_log_env(index):
+    """
+    Logging settings of one worker, so each writes its own file and
+    size-based rotation never races between processes.
+    """
+    env = {"LOG_PROCESS_NAME": f"mcp_server-worker{index}"}
+    log_file = os.getenv("LOG_FILE")
+    if log_file:
+        base, ext = os.path.splitext(log_file)
+        env["LOG_FILE"] = f"{base}-worker{index}{ext}"
+    return env
+
+
+class WorkerPool:
+    """Starts the worker processes and restarts any that exit."""
+
+    def __init__(self, app_path, binds):
+        self.app_path = app_path
+        self.binds = binds
+        self.context = multiprocessing.get_context("spawn")
+        self.processes = [None] * len(binds)
+
+    def start(self, index):
+        bind = self.binds[index]
+        if "uds" in bind and os.path.exists(bind["uds"]):
+            os.unlink(bind["uds"])
+        process = self.context.Process(
+            target=_run_worker,
+            args=(self.app_path, bind),
+            name=f"mcp-worker-{index}",
+            daemon=True,
+        )
+        # A spawned child re-imports the server module, which configures logging
+        # before _run_worker runs, so the settings must be in the environment it inherits
+        overrides = _worker_log_env(index)
+        saved = {name: os.environ.get(name) for name in overrides}
+        os.environ.update(overrides)
+        try:
+            process.start()
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+        self.processes[index] = process
+        logger.info(f"Started MCP worker {index} (pid {process.pid})")
+
+    def start_all(self):
+        for index in range(len(self.binds)):
+            self.start(index)
+
+    def dead_workers(self):
+        return [i for i, p in enumerate(self.processes) if p is not None and not p.is_alive()]
+
+    def stop_all(self):
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            if process is not None:
+                process.join(timeout=5)
+
+
+class SessionRouter:
+    """
+    Session-affinity table shared by the router's request handlers.
+
+    New streams go to the worker with the fewest open streams; the session_id
+    announced in the stream's "endpoint" event is then pinned to that worker.
+    """
+
+    def __init__(self, binds):
+        self.clients = [self._make_client(bind) for bind in binds]
+        self.open_streams = [0] * len(binds)
+        self.sessions = {}
+
+    @staticmethod
+    def _make_client(bind):
+        if "uds" in bind:
+            transport = httpx.AsyncHTTPTransport(uds=bind["uds"])
+            base_url = "http://mcp-worker"
+        else:
+            transport = httpx.AsyncHTTPTransport()
+            base_url = f"http://127.0.0.1:{bind['port']}"
+        return httpx.AsyncClient(transport=transport, base_url=base_url, timeout=None)
+
+    def pick(self):
+        index = min(range(len(self.clients)), key=lambda i: self.open_streams[i])
+        self.open_streams[index] += 1
+        return index
+
+    def bind(self, session_id, index):
+        self.sessions[session_id] = index
+
+    def release(self, index, session_id=None):
+        self.open_streams[index] -= 1
+        if session_id is not None:
+            self.sessions.pop(session_id, None)
+
+    def drop_worker(self, index):
+        """Forget every session owned by a worker that has died."""
+        for session_id in [s for s, i in self.sessions.items() if i == index]:
+            del self.sessions[session_id]
+
+    async def aclose(self):
+        for client in self.clients:
+            await client.aclose()
+
+
+def create_router_app(router, pool=None):
+    """
+    Build the public Starlette app that proxies to the worker processes.
+
+    Args:
+        router (SessionRouter): Session-affinity table and worker clients
+        pool (WorkerPool, optional): Worker processes to supervise
+
+    Returns:
+        Starlette: The router application
+    """
+
+    async def handle_sse(request: Request):
+        index = router.pick()
+        client = router.clients[index]
+        try:
+            upstream_request = client.build_request("GET", "/sse", headers=_filter_headers(request.headers))
+            upstream = await client.send(upstream_request, stream=True)
+        except httpx.HTTPError as e:
+            router.release(index)
+            logger.error(f"Worker {index} unavailable for SSE stream: {str(e)}")
+            return Response("MCP worker unavailable", status_code=503)
+
+        async def relay():
+            session_id = None
+            pending = b""
+            try:
+                async for chunk in upstream.aiter_raw():
+                    if session_id is None:
+                        pending += chunk
+                        match = SESSION_ID_PATTERN.search(pending)
+                        if match:
+                            session_id = match.group(1).decode().lower()
+                            router.bind(session_id, index)
+                            pending = b""
+                    yield chunk
+            finally:
+                await upstream.aclose()
+                router.release(index, session_id)
+
+        return StreamingResponse(
+            relay(),
+            status_code=upstream.status_code,
+            headers=_filter_headers(upstream.headers),
+        )
+
+    async def handle_message(request: Request):
+        session_id = (request.query_params.get("session_id") or "").lower()
+        index = router.sessions.get(session_id)
+        if index is None:
+            return Response("Could not find session", status_code=404)
+        try:
+            upstream = await router.clients[index].post(
+                "/messages/",
+                params=request.query_params,
+                content=await request.body(),
+                headers=_filter_headers(request.headers),
+            )
+        except httpx.HTTPError as e:
+            logger.error(f"Worker {index} unavailable for session {session_id}: {str(e)}")
+            return Response("MCP worker unavailable", status_code=503)
+        return Response(upstream.content, status_code=upstream.status_code, headers=_filter_headers(upstream.headers))
+
+    async def handle_streamable_http(request: Request):
+        index = router.pick()
+        client = router.clients[index]
+        try:
+            upstream_request = client.build_request(
+                request.method,
+                request.url.path,
+                params=request.query_params,
+                content=await request.body(),
+                headers=_filter_headers(request.headers),
+            )
+            upstream = await client.send(upstream_request, stream=True)
+        except httpx.HTTPError as e:
+            router.release(index)
+            logger.error(f"Worker {index} unavailable for streamable HTTP request: {str(e)}")
+            return Response("MCP worker unavailable", status_code=503)
+
+        async def relay():
+            try:
+                async for chunk in upstream.aiter_raw():
+                    yield chunk
+            finally:
+                await upstream.aclose()
+                router.release(index)
+
+        return StreamingResponse(
+            relay(),
+            status_code=upstream.status_code,
+            headers=_filter_headers(upstream.headers),
+        )
+
+    async def handle_worker_metrics(request: Request):
+        # Each worker keeps its own registry; expose them one by one for scraping
+        index = request.path_params["index"]
+        if index >= len(router.clients):
+            return Response("Unknown worker", status_code=404)
+        try:
+            upstream = await router.clients[index].get("/metrics")
+        except httpx.HTTPError as e:
+            return Response(f"Worker {index} unavailable: {str(e)}", status_code=503)
+        return Response(upstream.content, status_code=upstream.status_code, headers=_filter_headers(upstream.headers))
+
+    async def supervise():
+        while True:
+            await asyncio.sleep(WORKER_CHECK_INTERVAL)
+            for index in pool.dead_workers():
+                logger.error(f"MCP worker {index} exited, restarting")
+                router.drop_worker(index)
+                pool.start(index)
+
+    async def lifespan(app):
+        supervisor = asyncio.create_task(supervise()) if pool else None
+        try:
+            yield
+        finally:
+            if supervisor:
+                supervisor.cancel()
+            await router.aclose()
+
+    return Starlette(
+        routes=[
+            Route("/sse", endpoint=handle_sse, methods=["GET"]),
+            Route("/messages/", endpoint=handle_message, methods=["POST"]),
+            Route("/metrics/worker/{index:int}", endpoint=handle_worker_metrics, methods=["GET"]),
+            Route("/mcp/{path:path}", endpoint=handle_streamable_http, methods=["GET", "POST", "DELETE"]),
+            Route("/mcp-stream/{path:path}", endpoint=handle_streamable_http, methods=["GET", "POST", "DELETE"]),
+        ],
+        lifespan=lifespan,
+    )
+
+
+def serve_cluster(app_path, host, port, workers):
+    """
+    Run the MCP server as a router plus several worker processes.
+
+    Args:
+        app_path (str): Import string of the worker app, e.g. "mcp_server_sse:app"
+        host (str): Public host for the router
+        port (int): Public port for the router
+        workers (int): Number of worker processes
+    """
+    binds = _worker_binds(workers, port)
+    pool = WorkerPool(app_path, binds)
+    pool.start_all()
+    try:
+        router = SessionRouter(binds)
+        uvicorn.run(create_router_app(router, pool), host=host, port=port)
+    finally:
+        pool.stop_all()
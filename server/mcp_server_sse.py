@@ -6,8 +6,9 @@ from starlette.routing import Route, Mount
 
 from mcp.server.fastmcp import FastMCP
 from mcp.shared.exceptions import McpError
-from mcp.types import ErrorData, INTERNAL_ERROR, INVALID_PARAMS
+from mcp.types import CallToolRequest, ErrorData, INTERNAL_ERROR, INVALID_PARAMS
 from mcp.server.sse import SseServerTransport
+from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
 
 from groq import Groq
 import math
@@ -16,31 +17,167 @@ import requests
 from tavily import TavilyClient
 import urllib.parse
 import os
+import sys
+import time
+import functools
+import asyncio
+import contextlib
+import contextvars
+import anyio
 from datetime import datetime
 from firecrawl import FirecrawlApp
 
 from dotenv import load_dotenv
 load_dotenv()
 
-import logging
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.utils.metrics import (
+    CONTENT_TYPE,
+    counter,
+    gauge,
+    histogram,
+    record_cache_lookup,
+    record_token_usage,
+    render_latest,
+    track_upstream,
+)
+from src.utils.tracing import collect_spans, set_service_name, start_span
+from src.utils.log_utils import configure_logging, get_logger, request_context
+
 import warnings
 warnings.filterwarnings("ignore")
 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 TAVILY_KEY = os.getenv("TAVILY_API_KEY")
 FIRE_CRAWL_API_KEY = os.getenv("FIRECRAWL_API_KEY")
+# Upstream endpoints can be overridden, e.g. to point at the offline benchmark stubs.
+# The Groq SDK reads GROQ_BASE_URL itself.
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL")
+TAVILY_BASE_URL = os.getenv("TAVILY_BASE_URL")
+FIRECRAWL_API_URL = os.getenv("FIRECRAWL_API_URL")
+POLLINATIONS_URL = os.getenv("POLLINATIONS_URL", "https://image.pollinations.ai").rstrip("/")
+PDF_EMBED_MODEL = os.getenv("PDF_EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
 MCP_PORT=int(os.getenv("MCP_PORT"))
-
-logging.basicConfig(
-    filename='C:/Users/darshit/OneDrive/Desktop/Dev-MCP/src/logs/mcp_interactions.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
+MCP_WORKERS = int(os.getenv("MCP_WORKERS", "1"))
+# Sync tools run on worker threads; this caps how many run at once
+TOOL_CONCURRENCY = int(os.getenv("TOOL_CONCURRENCY", "16"))
+
+# Appended to the system prompts of tools whose answers go straight to the chat,
+# so the app can skip its own formatting LLM call (see src/utils/response_shaping.py)
+ANSWER_FORMAT = (
+    " Answer in clean markdown: short paragraphs separated by blank lines, bullet lists for enumerations, "
+    "and fenced code blocks (```language) only for code. Do not wrap the answer in JSON or HTML, "
+    "do not add a preamble about the task, and answer the user's question directly."
 )
 
+configure_logging("mcp_server")
+logger = get_logger("server")
+
 mcp = FastMCP("MCP Assistant")
+set_service_name("mcp-server")
+
+TOOL_REQUESTS = counter("lightgpt_tool_requests_total", "Tool calls received", ("tool",))
+TOOL_ERRORS = counter("lightgpt_tool_errors_total", "Tool calls that raised an error", ("tool",))
+TOOL_LATENCY = histogram("lightgpt_tool_latency_seconds", "Total tool latency (queue + execution)", ("tool",))
+TOOL_QUEUE_TIME = histogram("lightgpt_tool_queue_seconds", "Time a tool call waited for a worker thread", ("tool",))
+TOOL_EXEC_TIME = histogram("lightgpt_tool_execution_seconds", "Time spent executing a tool", ("tool",))
+TOOLS_IN_FLIGHT = gauge("lightgpt_tools_in_flight", "Tool calls queued or running", ("tool",))
+ACTIVE_SSE_SESSIONS = gauge("lightgpt_active_sse_sessions", "Open SSE sessions")
+EVENT_LOOP_LAG = gauge("lightgpt_event_loop_lag_seconds", "Most recent event loop scheduling delay")
+EVENT_LOOP_LAG_HISTOGRAM = histogram(
+    "lightgpt_event_loop_lag_distribution_seconds",
+    "Event loop scheduling delay",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+EVENT_LOOP_LAG_INTERVAL = 0.5
+
+_tool_limiter = None
+
+def _get_tool_limiter():
+    # Created on first use because the limiter must belong to the running event loop
+    global _tool_limiter
+    if _tool_limiter is None:
+        _tool_limiter = anyio.CapacityLimiter(TOOL_CONCURRENCY)
+    return _tool_limiter
+
+def _request_traceparent():
+    """Return the traceparent sent in the current request's _meta, if any."""
+    try:
+        meta = mcp.get_context().request_context.meta
+    except (LookupError, ValueError):
+        return None
+    return getattr(meta, "traceparent", None) if meta is not None else None
+
+def instrument_tool(fn):
+    """
+    Run a sync tool on a worker thread and record its metrics.
+
+    The wrapper keeps the tool's signature and docstring, so FastMCP derives
+    the same schema. Queue time is the wait for a free worker thread. The
+    call becomes a server span continuing the client's _meta.traceparent.
+    """
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        queued_at = time.perf_counter()
+        started = {}
+
+        def run():
+            started["at"] = time.perf_counter()
+            TOOL_QUEUE_TIME.observe(started["at"] - queued_at, tool=name)
+            return fn(*args, **kwargs)
+
+        TOOL_REQUESTS.inc(tool=name)
+        TOOLS_IN_FLIGHT.inc(tool=name)
+        try:
+            with request_context(), start_span(f"tool.{name}", parent=_request_traceparent(), kind="SERVER", tool=name):
+                # Carry the span into the worker thread so upstream calls nest under it
+                context = contextvars.copy_context()
+                return await anyio.to_thread.run_sync(context.run, run, limiter=_get_tool_limiter())
+        except Exception:
+            TOOL_ERRORS.inc(tool=name)
+            raise
+        finally:
+            finished = time.perf_counter()
+            if "at" in started:
+                TOOL_EXEC_TIME.observe(finished - started["at"], tool=name)
+            TOOL_LATENCY.observe(finished - queued_at, tool=name)
+            TOOLS_IN_FLIGHT.dec(tool=name)
+
+    return wrapper
+
+def return_tool_spans():
+    """
+    Send the spans of each traced tool call back in the result's _meta.spans.
+
+    The tool span and its upstream calls finish in this process, so the
+    client's per-message trace would otherwise end at mcp.call_tool.
+    """
+    handlers = mcp._mcp_server.request_handlers
+    handle_call_tool = handlers[CallToolRequest]
+
+    async def handler(request):
+        if getattr(request.params.meta, "traceparent", None) is None:
+            return await handle_call_tool(request)
+        with collect_spans() as spans:
+            result = await handle_call_tool(request)
+        result.root.meta = {**(result.root.meta or {}), "spans": [span.to_zipkin() for span in spans]}
+        return result
+
+    handlers[CallToolRequest] = handler
+
+return_tool_spans()
+
+def groq_chat(groq_client, operation, **kwargs):
+    """Create a Groq chat completion, recording its latency and token usage."""
+    with track_upstream("groq", operation):
+        response = groq_client.chat.completions.create(**kwargs)
+    record_token_usage(kwargs.get("model"), response)
+    return response
 
 @mcp.tool()
+@instrument_tool
 def math_solver(expression: str) -> str:
     """
     Solve mathematical expressions safely with support for various mathematical operations.
@@ -83,6 +220,7 @@ def math_solver(expression: str) -> str:
         raise McpError(ErrorData(INVALID_PARAMS, f"Error evaluating expression: {str(e)}"))
 
 @mcp.tool()
+@instrument_tool
 def generate_code(code_request: str, language: str = "python") -> str:
     """
     Generate code based on natural language description using LLM capabilities.
@@ -121,7 +259,7 @@ def generate_code(code_request: str, language: str = "python") -> str:
         Do NOT use any backticks (`) in this explanation section.
         """
         
-        response = groq_client.chat.completions.create(
+        response = groq_chat(groq_client, "generate_code",
             model="llama-3.3-70b-versatile",
             messages=[
                 {"role": "system", "content": f"You are an expert {language} programmer. Generate clean, efficient, and well-documented code with detailed explanations."},
@@ -136,6 +274,7 @@ def generate_code(code_request: str, language: str = "python") -> str:
         raise McpError(ErrorData(INTERNAL_ERROR, f"Error generating code: {str(e)}"))
 
 @mcp.tool()
+@instrument_tool
 def tavily_search(query: str) -> str:
     """
     Perform web searches using the Tavily API and format results using LLM.
@@ -148,11 +287,14 @@ def tavily_search(query: str) -> str:
     """
     try:
         client = TavilyClient(TAVILY_KEY)
-        response = client.search(
-            query=query,
-            max_results=10,
-            search_depth="advanced",
-        )
+        if TAVILY_BASE_URL:
+            client.base_url = TAVILY_BASE_URL
+        with track_upstream("tavily", "search"):
+            response = client.search(
+                query=query,
+                max_results=10,
+                search_depth="advanced",
+            )
 
         if not response:
             return "No results found."
@@ -177,10 +319,10 @@ def tavily_search(query: str) -> str:
         
         Please format this information in a clear, readable way."""
 
-        llm_response = groq_client.chat.completions.create(
+        llm_response = groq_chat(groq_client, "tavily_search",
             model="llama-3.1-8b-instant",
             messages=[
-                {"role": "system", "content": "You are a helpful research assistant that formats and summarizes search results in a clear, organized way."},
+                {"role": "system", "content": "You are a helpful research assistant that formats and summarizes search results in a clear, organized way." + ANSWER_FORMAT},
                 {"role": "user", "content": llm_prompt}
             ],
             max_tokens=500,
@@ -192,6 +334,7 @@ def tavily_search(query: str) -> str:
         raise McpError(ErrorData(INTERNAL_ERROR, f"Error during search: {str(e)}"))
 
 @mcp.tool()
+@instrument_tool
 def chat_with_assistant(message: str) -> str:
     """
     Engage in conversational interactions with an AI assistant.
@@ -204,10 +347,10 @@ def chat_with_assistant(message: str) -> str:
     """
     try:
         groq_client = Groq(api_key=GROQ_API_KEY)
-        response = groq_client.chat.completions.create(
+        response = groq_chat(groq_client, "chat_with_assistant",
             model="llama-3.1-8b-instant",
             messages=[
-                {"role": "system", "content": "You are a friendly, helpful AI assistant."},
+                {"role": "system", "content": "You are a friendly, helpful AI assistant." + ANSWER_FORMAT},
                 {"role": "user", "content": message}
             ],
             max_tokens=100,
@@ -218,6 +361,7 @@ def chat_with_assistant(message: str) -> str:
         raise McpError(ErrorData(INTERNAL_ERROR, f"Error in chat: {str(e)}"))
 
 @mcp.tool()
+@instrument_tool
 def generate_prompt(topic: str, purpose: str = "general") -> str:
     """
     Generate creative and detailed prompts for various purposes.
@@ -236,10 +380,10 @@ def generate_prompt(topic: str, purpose: str = "general") -> str:
             f"The topic is: '{topic}'. "
             "Make the prompt clear, inspiring, and suitable for the intended use."
         )
-        response = groq_client.chat.completions.create(
+        response = groq_chat(groq_client, "generate_prompt",
             model="llama-3.1-8b-instant",
             messages=[
-                {"role": "system", "content": "You are my prompt expert. You write the best prompts for any purpose."},
+                {"role": "system", "content": "You are my prompt expert. You write the best prompts for any purpose." + ANSWER_FORMAT},
                 {"role": "user", "content": full_prompt}
             ],
             max_tokens=120,
@@ -250,6 +394,7 @@ def generate_prompt(topic: str, purpose: str = "general") -> str:
         raise McpError(ErrorData(INTERNAL_ERROR, f"Error generating prompt: {str(e)}"))
 
 @mcp.tool()
+@instrument_tool
 def generate_image(prompt: str) -> str:
     """
     Generate images based on text prompts using the Pollinations AI API.
@@ -268,10 +413,11 @@ def generate_image(prompt: str) -> str:
         filename = f"image/generated_image_{timestamp}.jpg"
         
         encoded_prompt = urllib.parse.quote(prompt)
-        url = f"https://image.pollinations.ai/prompt/{encoded_prompt}"
+        url = f"{POLLINATIONS_URL}/prompt/{encoded_prompt}"
         
-        response = requests.get(url)
-        response.raise_for_status()
+        with track_upstream("pollinations", "generate_image"):
+            response = requests.get(url)
+            response.raise_for_status()
         
         with open(filename, "wb") as f:
             f.write(response.content)
@@ -282,6 +428,7 @@ def generate_image(prompt: str) -> str:
         raise McpError(ErrorData(INTERNAL_ERROR, f"Error generating image: {str(e)}"))
 
 @mcp.tool()
+@instrument_tool
 def general_qa(question: str) -> str:
     """
     Answer general questions and provide information on various topics using the Groq LLM.
@@ -309,10 +456,10 @@ def general_qa(question: str) -> str:
         
         Keep the response informative but concise."""
         
-        response = groq_client.chat.completions.create(
+        response = groq_chat(groq_client, "general_qa",
             model="llama-3.3-70b-versatile",
             messages=[
-                {"role": "system", "content": "You are a knowledgeable and helpful AI assistant that provides accurate, detailed, and well-structured responses to general questions."},
+                {"role": "system", "content": "You are a knowledgeable and helpful AI assistant that provides accurate, detailed, and well-structured responses to general questions." + ANSWER_FORMAT},
                 {"role": "user", "content": prompt}
             ],
             max_tokens=1000,
@@ -324,6 +471,7 @@ def general_qa(question: str) -> str:
         raise McpError(ErrorData(INTERNAL_ERROR, f"Error in general QA: {str(e)}"))
 
 @mcp.tool()
+@instrument_tool
 def deep_research(query: str , depth : int) -> str:
     """
     Perform deep research on a given query using FirecrawlApp and return a summary and source count.
@@ -335,14 +483,15 @@ def deep_research(query: str , depth : int) -> str:
         str: The final analysis and number of sources found.
     """
     try:
-        firecrawl = FirecrawlApp(api_key=FIRE_CRAWL_API_KEY)
-        results = firecrawl.deep_research(
-                query=query,
-                max_depth=depth,
-                time_limit=180,
-                max_urls=15
-            )
-        logging.info(f"Deep research completed for query: {query}")
+        firecrawl = FirecrawlApp(api_key=FIRE_CRAWL_API_KEY, api_url=FIRECRAWL_API_URL)
+        with track_upstream("firecrawl", "deep_research"):
+            results = firecrawl.deep_research(
+                    query=query,
+                    max_depth=depth,
+                    time_limit=180,
+                    max_urls=15
+                )
+        logger.info(f"Deep research completed for query: {query}")
         final_analysis = results['data']['finalAnalysis']
         num_sources = len(results['data']['sources'])
         return f"Final Analysis: {final_analysis}\n"
@@ -350,6 +499,7 @@ def deep_research(query: str , depth : int) -> str:
         raise McpError(ErrorData(INTERNAL_ERROR, f"Error in deep research: {str(e)}"))
 
 @mcp.tool()
+@instrument_tool
 def pdf_qa(query: str, pdf_path: str) -> str:
     """
     Answer questions about the content of a specific PDF file using LlamaIndex.
@@ -370,11 +520,19 @@ def pdf_qa(query: str, pdf_path: str) -> str:
         
         # Set up Groq LLM and embeddings
         groq_api_key = GROQ_API_KEY
-        llm = Groq(api_key=groq_api_key, model="llama3-70b-8192")
+        if GROQ_BASE_URL:
+            llm = Groq(api_key=groq_api_key, model="llama3-70b-8192", api_base=f"{GROQ_BASE_URL.rstrip('/')}/openai/v1")
+        else:
+            llm = Groq(api_key=groq_api_key, model="llama3-70b-8192")
 
-        embed_model = HuggingFaceEmbedding(
-            model_name="sentence-transformers/all-MiniLM-L6-v2"
-        )
+        if PDF_EMBED_MODEL == "mock":
+            # Deterministic stand-in used by the offline benchmarks
+            from llama_index.core.embeddings import MockEmbedding
+            embed_model = MockEmbedding(embed_dim=384)
+        else:
+            embed_model = HuggingFaceEmbedding(
+                model_name=PDF_EMBED_MODEL
+            )
         Settings.embed_model = embed_model
         Settings.llm = llm
         Settings.chunk_size = 512
@@ -383,9 +541,11 @@ def pdf_qa(query: str, pdf_path: str) -> str:
         persist_dir = f"./database/pdf_{pdf_filename}"
         
         # Check if index already exists for this PDF
-        if not os.path.exists(persist_dir):
+        index_cached = os.path.exists(persist_dir)
+        record_cache_lookup("pdf_index", index_cached)
+        if not index_cached:
             # If index doesn't exist, create it
-            print(f"Creating new index for {pdf_path}...")
+            logger.info(f"Creating new index for {pdf_path}...")
             
             # Load PDF
             if os.path.isfile(pdf_path):
@@ -403,7 +563,7 @@ def pdf_qa(query: str, pdf_path: str) -> str:
             os.makedirs(persist_dir, exist_ok=True)
             index.storage_context.persist(persist_dir=persist_dir)
         else:
-            print(f"Loading existing index for {pdf_path}...")
+            logger.info(f"Loading existing index for {pdf_path}...")
             storage_context = StorageContext.from_defaults(persist_dir=persist_dir)
             index = load_index_from_storage(storage_context)
         
@@ -411,7 +571,8 @@ def pdf_qa(query: str, pdf_path: str) -> str:
         query_engine = index.as_query_engine()
         
         # Process query
-        response = query_engine.query(query)
+        with track_upstream("groq", "pdf_qa"):
+            response = query_engine.query(query)
         
         return str(response)
     
@@ -424,25 +585,75 @@ async def handle_sse(request: Request):
     """Handle SSE connections for MCP communication."""
     try:
         _server = mcp._mcp_server
-        async with sse.connect_sse(
-            request.scope,
-            request.receive,
-            request._send,
-        ) as (reader, writer):
-            await _server.run(reader, writer, _server.create_initialization_options())
+        ACTIVE_SSE_SESSIONS.inc()
+        try:
+            async with sse.connect_sse(
+                request.scope,
+                request.receive,
+                request._send,
+            ) as (reader, writer):
+                await _server.run(reader, writer, _server.create_initialization_options())
+        finally:
+            ACTIVE_SSE_SESSIONS.dec()
         
         return Response("SSE connection closed", status_code=200)
     except Exception as e:
-        logging.error(f"Error in handle_sse: {str(e)}")
+        logger.error(f"Error in handle_sse: {str(e)}")
         return Response(f"Error: {str(e)}", status_code=500)
 
+async def handle_metrics(request: Request):
+    """Expose the process metrics in the Prometheus text format."""
+    return Response(render_latest(), media_type=CONTENT_TYPE)
+
+# Streamable HTTP transport. Both endpoints are stateless so every request can be
+# served on its own (and by any worker). /mcp/ answers each request with a single
+# JSON response; /mcp-stream/ streams the response as SSE for long-running tools.
+http_json_manager = StreamableHTTPSessionManager(app=mcp._mcp_server, json_response=True, stateless=True)
+http_stream_manager = StreamableHTTPSessionManager(app=mcp._mcp_server, json_response=False, stateless=True)
+
+async def handle_streamable_http(scope, receive, send):
+    """Handle streamable HTTP requests answered with a single JSON response."""
+    await http_json_manager.handle_request(scope, receive, send)
+
+async def handle_streamable_http_stream(scope, receive, send):
+    """Handle streamable HTTP requests whose responses are streamed."""
+    await http_stream_manager.handle_request(scope, receive, send)
+
+async def monitor_event_loop_lag():
+    """Measure how late a fixed sleep wakes up; a blocked loop shows up as lag."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(EVENT_LOOP_LAG_INTERVAL)
+        lag = max(0.0, loop.time() - start - EVENT_LOOP_LAG_INTERVAL)
+        EVENT_LOOP_LAG.set(lag)
+        EVENT_LOOP_LAG_HISTOGRAM.observe(lag)
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    lag_monitor = asyncio.create_task(monitor_event_loop_lag())
+    try:
+        async with http_json_manager.run(), http_stream_manager.run():
+            yield
+    finally:
+        lag_monitor.cancel()
+
 app = Starlette(
     debug=True,
     routes=[
         Route("/sse", endpoint=handle_sse, methods=["GET"]),
+        Route("/metrics", endpoint=handle_metrics, methods=["GET"]),
         Mount("/messages/", app=sse.handle_post_message),
+        Mount("/mcp", app=handle_streamable_http),
+        Mount("/mcp-stream", app=handle_streamable_http_stream),
     ],
+    lifespan=lifespan,
 )
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="localhost", port=MCP_PORT)
\ No newline at end of file
+    if MCP_WORKERS > 1:
+        # Sessions live in worker memory, so several workers need the affinity router
+        from cluster import serve_cluster
+        serve_cluster("mcp_server_sse:app", host="localhost", port=MCP_PORT, workers=MCP_WORKERS)
+    else:
+        uvicorn.run(app, host="localhost", port=MCP_PORT)
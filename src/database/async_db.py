@@ -0,0 +1,302 @@
+"""
+Async data-access layer for the server side.
+
+Mirrors the operations of db.py on psycopg 3's AsyncConnectionPool so async
+code (the MCP server, background jobs) can reach PostgreSQL without blocking
+its event loop, and adds bulk variants: batch insert of interactions, batch
+fetch of sessions by id and bulk delete. Large result sets are streamed
+through server-side cursors instead of being fetched into memory at once.
+
+db.py remains the synchronous facade used by the Streamlit app. Both layers
+run the SQL in queries.py against the schema from migrations.py and read the
+same DB_* settings as pool.py.
+
+Unlike db.py, writes go straight to PostgreSQL rather than through the
+write-behind queue, and errors are raised (psycopg.Error) instead of being
+logged and swallowed, so callers can decide how to degrade. Deletes finish
+with db.after_sessions_deleted() like db.py's. Writes invalidate only this
+process's read cache; other processes, e.g. the Streamlit app when this layer
+runs in the MCP server, see them once their cached entries expire after
+DB_CACHE_TTL seconds.
+
+Environment:
+    DB_STREAM_ITERSIZE: Rows fetched per round trip when streaming (default: 500)
+"""
+
+import asyncio
+import os
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+from src.database import queries
+from src.database.cache import invalidate, session_tag, user_tag
+from src.database.compression import decode_response_rows
+from src.database.db import (
+    HEADLINE_OPTIONS, SEARCH_RESULT_LIMIT, SESSION_PAGE_SIZE, TRANSCRIPT_PAGE_SIZE, after_sessions_deleted
+)
+from src.database.pool import (
+    DB_CONNECT_TIMEOUT, DB_HOST, DB_NAME, DB_PASSWORD, DB_POOL_MAX, DB_POOL_MIN, DB_POOL_TIMEOUT, DB_PORT,
+    DB_STATEMENT_TIMEOUT_MS, DB_USER
+)
+from src.utils.log_utils import get_logger
+from src.utils.metrics import histogram
+
+try:
+    import psycopg
+    from psycopg_pool import AsyncConnectionPool
+except ImportError:
+    psycopg = None
+    AsyncConnectionPool = None
+
+DB_STREAM_ITERSIZE = int(os.getenv("DB_STREAM_ITERSIZE", "500"))
+
+BULK_ROWS = histogram(
+    "lightgpt_db_bulk_rows",
+    "Rows handled per bulk database operation",
+    buckets=(1, 10, 50, 100, 500, 1000, 5000, 10000),
+)
+
+logger = get_logger("db")
+
+
+class AsyncRepository:
+    """
+    Chat session and interaction storage on an async connection pool.
+
+    Args:
+        min_size (int): Connections opened up front
+        max_size (int): Upper bound on open connections
+        timeout (float): Seconds to wait for a free connection
+    """
+
+    def __init__(self, min_size=DB_POOL_MIN, max_size=DB_POOL_MAX, timeout=DB_POOL_TIMEOUT):
+        if AsyncConnectionPool is None:
+            raise RuntimeError("The async data-access layer needs psycopg 3: pip install 'psycopg[binary,pool]'")
+        self.pool = AsyncConnectionPool(
+            conninfo=psycopg.conninfo.make_conninfo(
+                host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD, port=DB_PORT,
+                connect_timeout=DB_CONNECT_TIMEOUT,
+                options=f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}",
+            ),
+            min_size=min_size,
+            max_size=max_size,
+            timeout=timeout,
+            check=AsyncConnectionPool.check_connection,
+            open=False,
+        )
+
+    async def open(self):
+        await self.pool.open(wait=True)
+
+    async def close(self):
+        await self.pool.close()
+
+    @asynccontextmanager
+    async def _cursor(self):
+        # The pool commits on a clean exit and rolls back if the block raises
+        async with self.pool.connection() as conn, conn.cursor() as cur:
+            yield cur
+
+    async def create_chat_session(self, user_email):
+        session_id = str(uuid.uuid4())
+        async with self._cursor() as cur:
+            await cur.execute(queries.INSERT_SESSION, (session_id, user_email))
+        invalidate(user_tag(user_email))
+        return session_id
+
+    async def get_chat_sessions(self, user_email, limit=SESSION_PAGE_SIZE, before=None):
+        """
+        Get one page of a user's chat sessions; see db.get_chat_sessions.
+
+        Returns:
+            tuple: (rows, next_cursor)
+        """
+        async with self._cursor() as cur:
+            if before is None:
+                await cur.execute(queries.SELECT_SESSIONS_FIRST_PAGE, (user_email, limit + 1))
+            else:
+                await cur.execute(queries.SELECT_SESSIONS_AFTER, (user_email, before[0], before[1], limit + 1))
+            rows = await cur.fetchall()
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, (rows[-1][3], rows[-1][0])
+
+    async def get_sessions_by_ids(self, session_ids):
+        """
+        Fetch many sessions in one round trip.
+
+        Returns:
+            dict: session_id -> (session_id, title, created_at, last_activity_at,
+            message_count, user_id); unknown ids are left out
+        """
+        session_ids = list(session_ids)
+        if not session_ids:
+            return {}
+        async with self._cursor() as cur:
+            await cur.execute(queries.SELECT_SESSIONS_BY_IDS, (session_ids,))
+            rows = await cur.fetchall()
+        BULK_ROWS.observe(len(session_ids))
+        return {row[0]: row for row in rows}
+
+    async def get_latest_session(self, user_email):
+        async with self._cursor() as cur:
+            await cur.execute(queries.SELECT_LATEST_SESSION, (user_email,))
+            result = await cur.fetchone()
+        return result[0] if result else None
+
+    async def get_session_owner(self, session_id):
+        async with self._cursor() as cur:
+            await cur.execute(queries.SELECT_SESSION_OWNER, (session_id,))
+            result = await cur.fetchone()
+        return result[0] if result else None
+
+    async def get_chat_interactions(self, session_id):
+        """
+        Get a session's full transcript, oldest first.
+
+        Returns:
+            list: (user_question, assistant_response, tool_used, created_at) tuples
+        """
+        async with self._cursor() as cur:
+            await cur.execute(queries.SELECT_TRANSCRIPT, (session_id,))
+            return decode_response_rows(await cur.fetchall(), 1)
+
+    async def get_chat_interactions_page(self, session_id, limit=TRANSCRIPT_PAGE_SIZE, before=None):
+        """
+        Get one page of a transcript walking backwards; see db.get_chat_interactions_page.
+
+        Returns:
+            tuple: (rows, next_cursor)
+        """
+        async with self._cursor() as cur:
+            if before is None:
+                await cur.execute(queries.SELECT_TRANSCRIPT_LATEST, (session_id, limit + 1))
+            else:
+                await cur.execute(queries.SELECT_TRANSCRIPT_BEFORE, (session_id, before[0], before[1], limit + 1))
+            rows = decode_response_rows(await cur.fetchall(), 2)
+        cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            cursor = (rows[-1][4], rows[-1][0])
+        rows.reverse()
+        return rows, cursor
+
+    async def search_chat_history(self, user_email, query, limit=SEARCH_RESULT_LIMIT):
+        """Full-text search over a user's turns; see db.search_chat_history."""
+        if not query or not query.strip():
+            return []
+        async with self._cursor() as cur:
+            await cur.execute(
+                queries.SEARCH_INTERACTIONS,
+                (HEADLINE_OPTIONS, HEADLINE_OPTIONS, query, user_email, limit)
+            )
+            return await cur.fetchall()
+
+    async def save_chat_interaction(self, session_id, user_question, assistant_response=None, tool_used=None):
+        await self.insert_interactions([(session_id, user_question, assistant_response or "Processing...", tool_used)])
+
+    async def insert_interactions(self, interactions):
+        """
+        Insert many interactions in one transaction.
+
+        Rows are sent with executemany, which psycopg pipelines into a single
+        round trip, followed by one session-summary update per session.
+
+        Args:
+            interactions (iterable): (session_id, user_question, assistant_response,
+                tool_used) or (..., created_at) tuples
+
+        Returns:
+            int: Rows inserted
+        """
+        now = datetime.now()
+        rows = [interaction if len(interaction) == 5 else (*interaction, now) for interaction in interactions]
+        if not rows:
+            return 0
+        sessions = queries.summarize_sessions((row[0], row[1], row[4]) for row in rows)
+        async with self._cursor() as cur:
+            await cur.executemany(queries.INSERT_INTERACTION, rows)
+            await cur.executemany(
+                queries.UPDATE_SESSION_SUMMARY,
+                [(added, first_question, last_activity, session_id)
+                 for session_id, (added, first_question, last_activity) in sessions.items()],
+            )
+            # The sessions moved to the top of their owners' cached session lists
+            await cur.execute(queries.SELECT_SESSION_OWNERS, (list(sessions),))
+            owners = [row[0] for row in await cur.fetchall()]
+        BULK_ROWS.observe(len(rows))
+        invalidate(*(session_tag(session_id) for session_id in sessions), *(user_tag(owner) for owner in owners))
+        return len(rows)
+
+    async def delete_chat_session(self, session_id):
+        return bool(await self.delete_sessions([session_id]))
+
+    async def delete_sessions(self, session_ids):
+        """
+        Delete many sessions in one statement.
+
+        Sessions are marked as deleted and hidden at once; their queued
+        interactions are dropped and purge.py removes their rows in the background.
+
+        Returns:
+            list: IDs of the sessions that existed and were deleted
+        """
+        session_ids = list(session_ids)
+        if not session_ids:
+            return []
+        async with self._cursor() as cur:
+            await cur.execute(queries.SOFT_DELETE_SESSIONS, (session_ids,))
+            rows = await cur.fetchall()
+            deleted = [row[0] for row in rows]
+        BULK_ROWS.observe(len(session_ids))
+        logger.info(f"Deleted {len(deleted)} sessions")
+        if deleted:
+            after_sessions_deleted(deleted, (row[1] for row in rows))
+        return deleted
+
+    async def stream_user_interactions(self, user_email, itersize=DB_STREAM_ITERSIZE):
+        """
+        Stream every turn of a user through a server-side cursor.
+
+        Memory stays bounded by ``itersize`` rows however long the history is,
+        which suits exports and re-indexing jobs.
+
+        Yields:
+            tuple: (session_id, interaction_id, user_question, assistant_response,
+            tool_used, created_at), grouped by session and oldest first
+        """
+        async with self.pool.connection() as conn:
+            async with conn.transaction():
+                async with conn.cursor(name=f"stream_{uuid.uuid4().hex}") as cur:
+                    await cur.execute(queries.SELECT_USER_INTERACTIONS, (user_email,))
+                    while True:
+                        rows = await cur.fetchmany(itersize)
+                        if not rows:
+                            break
+                        for row in decode_response_rows(rows, 3):
+                            yield row
+
+
+_repository = None
+_repository_lock = asyncio.Lock()
+
+
+async def get_async_repository():
+    """Return the process-wide repository, opening its pool on first use."""
+    global _repository
+    if _repository is None:
+        async with _repository_lock:
+            if _repository is None:
+                repository = AsyncRepository()
+                await repository.open()
+                _repository = repository
+    return _repository
+
+
+async def close_async_repository():
+    global _repository
+    if _repository is not None:
+        await _repository.close()
+        _repository = None
@@ -0,0 +1,174 @@
+"""
+Process-wide read-through cache for database reads.
+
+Streamlit reruns the whole script on every widget interaction, so the same
+session list and transcript queries used to hit PostgreSQL again and again.
+Functions decorated with read_through() keep their results in a shared LRU
+cache bounded by entry count and estimated size, with a TTL as a safety net
+against writes made by other processes.
+
+Every entry carries tags such as ("user", email) or ("session", id); writers
+call invalidate() with the tags they touched and every entry carrying one of
+them is dropped.
+
+Environment:
+    DB_CACHE_MAX_ENTRIES: Maximum cached results (default: 2048)
+    DB_CACHE_MAX_BYTES: Approximate memory bound in bytes (default: 64 MB)
+    DB_CACHE_TTL: Seconds before an entry is reloaded regardless (default: 60)
+"""
+
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from src.utils.metrics import gauge, record_cache_lookup
+
+DB_CACHE_MAX_ENTRIES = int(os.getenv("DB_CACHE_MAX_ENTRIES", "2048"))
+DB_CACHE_MAX_BYTES = int(os.getenv("DB_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+DB_CACHE_TTL = float(os.getenv("DB_CACHE_TTL", "60"))
+
+CACHE_ENTRIES = gauge("lightgpt_db_cache_entries", "Results held by the database read cache")
+CACHE_BYTES = gauge("lightgpt_db_cache_bytes", "Estimated size of the database read cache")
+
+
+def user_tag(user_email):
+    return ("user", user_email)
+
+
+def session_tag(session_id):
+    return ("session", session_id)
+
+
+def _estimate_size(value):
+    """Rough byte size of a cached result: string and bytes payloads plus a fixed overhead."""
+    if isinstance(value, (str, bytes)):
+        return len(value) + 48
+    if isinstance(value, (tuple, list)):
+        return 56 + sum(_estimate_size(item) for item in value)
+    return 32
+
+
+class ReadCache:
+    """
+    Thread-safe LRU cache with TTL and tag-based invalidation.
+
+    Args:
+        max_entries (int): Maximum number of entries
+        max_bytes (int): Approximate upper bound on cached payload size
+        ttl (float): Seconds an entry stays valid
+    """
+
+    def __init__(self, max_entries=DB_CACHE_MAX_ENTRIES, max_bytes=DB_CACHE_MAX_BYTES, ttl=DB_CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, value, size, tags)
+        self._by_tag = {}
+        self._bytes = 0
+        self._generation = 0
+
+    def get(self, key):
+        """Return (found, value); expired entries count as missing."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            if entry[0] < time.monotonic():
+                self._remove(key)
+                return False, None
+            self._entries.move_to_end(key)
+            return True, entry[1]
+
+    def generation(self):
+        """Counter bumped by every invalidation; lets loaders detect a write that raced them."""
+        with self._lock:
+            return self._generation
+
+    def put(self, key, value, tags, generation=None):
+        """Store a value unless an invalidation happened since ``generation`` was read."""
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value, size, tags)
+            self._bytes += size
+            for tag in tags:
+                self._by_tag.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+            self._update_gauges()
+
+    def invalidate(self, *tags):
+        """Drop every entry carrying any of the given tags."""
+        with self._lock:
+            self._generation += 1
+            for tag in tags:
+                for key in list(self._by_tag.get(tag, ())):
+                    self._remove(key)
+            self._update_gauges()
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._by_tag.clear()
+            self._bytes = 0
+            self._update_gauges()
+
+    def _remove(self, key):
+        _, _, size, tags = self._entries.pop(key)
+        self._bytes -= size
+        for tag in tags:
+            keys = self._by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_tag[tag]
+
+    def _update_gauges(self):
+        CACHE_ENTRIES.set(len(self._entries))
+        CACHE_BYTES.set(self._bytes)
+
+
+CACHE = ReadCache()
+
+
+def read_through(name, tags):
+    """
+    Cache a read function's results in CACHE.
+
+    The function should raise on failure so that errors are never cached,
+    and should return an immutable value (tuples) because the same object is
+    handed to every caller.
+
+    Args:
+        name (str): Cache name, used in the key and in hit-rate metrics
+        tags (callable): Called with (result, *args, **kwargs); returns the
+            tags to attach to the entry
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (name, args, tuple(sorted(kwargs.items())))
+            found, value = CACHE.get(key)
+            record_cache_lookup(f"db_{name}", found)
+            if found:
+                return value
+            generation = CACHE.generation()
+            value = func(*args, **kwargs)
+            CACHE.put(key, value, tuple(tags(value, *args, **kwargs)), generation)
+            return value
+        return wrapper
+    return decorator
+
+
+def invalidate(*tags):
+    """Drop cached reads carrying any of the given tags."""
+    CACHE.invalidate(*tags)
@@ -0,0 +1,90 @@
+"""
+Compression of stored assistant responses.
+
+Cold chat_interactions rows keep their response in response_compressed
+(bytea) with the codec recorded in response_codec. zstd is used when the
+zstandard package is installed; otherwise responses are compressed with
+zlib from the standard library. Both codecs can always be read back as long
+as the matching library is available.
+"""
+
+import zlib
+
+from src.utils.log_utils import get_logger
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZSTD_LEVEL = 9
+ZLIB_LEVEL = 6
+
+DEFAULT_CODEC = "zstd" if zstandard is not None else "zlib"
+
+logger = get_logger("db")
+
+
+def compress_response(text, codec=DEFAULT_CODEC):
+    """
+    Compress a response for cold storage.
+
+    Args:
+        text (str): The response text
+        codec (str): "zstd" or "zlib"
+
+    Returns:
+        tuple: (compressed bytes, codec name)
+    """
+    data = text.encode("utf-8")
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data), codec
+    return zlib.compress(data, ZLIB_LEVEL), "zlib"
+
+
+def decompress_response(data, codec):
+    """
+    Restore a response stored by compress_response().
+
+    Args:
+        data (bytes or memoryview): Compressed bytes from the database
+        codec (str): Codec recorded with the row
+
+    Returns:
+        str: The response text
+
+    Raises:
+        ValueError: If the codec is unknown or its library is not installed
+    """
+    data = bytes(data)
+    if codec == "zlib":
+        return zlib.decompress(data).decode("utf-8")
+    if codec == "zstd":
+        if zstandard is None:
+            raise ValueError("Response is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    raise ValueError(f"Unknown response codec: {codec}")
+
+
+def decode_response_rows(rows, response_index):
+    """
+    Decompress cold responses and drop the storage columns from result rows.
+
+    Args:
+        rows (iterable): Rows ending in (response_compressed, response_codec)
+        response_index (int): Position of assistant_response in each row
+
+    Returns:
+        list: Rows without the last two columns, with every response as text
+    """
+    decoded = []
+    for row in rows:
+        *values, compressed, codec = row
+        if values[response_index] is None and compressed is not None:
+            try:
+                values[response_index] = decompress_response(compressed, codec)
+            except ValueError as e:
+                logger.error(f"Could not decompress stored response: {str(e)}")
+                values[response_index] = "[Response unavailable]"
+        decoded.append(tuple(values))
+    return decoded
@@ -1,226 +1,328 @@
 import psycopg2
-import logging
-import os
-from dotenv import load_dotenv
+import sqlite3
 import uuid
+from datetime import datetime, timedelta
+from src.database.cache import invalidate, read_through, session_tag, user_tag
+from src.database import queries
+from src.database.compression import decode_response_rows
+from src.database.migrations import run_migrations
+from src.database.pool import get_connection
+from src.database.purge import PURGE_BATCH_SIZE, get_session_purger
+from src.database.write_behind import get_write_behind_queue
+from src.utils.image_store import extract_image_path
+from src.utils.log_utils import get_logger
 
-load_dotenv()
+logger = get_logger("db")
 
-DB_HOST = os.getenv("DB_HOST", "localhost")
-DB_NAME = os.getenv("DB_NAME", "chatbot_db")
-DB_USER = os.getenv("DB_USER", "postgres")
-DB_PASSWORD = os.getenv("DB_PASSWORD", "darshit")
-DB_PORT = os.getenv("DB_PORT", "5432")  
+SESSION_PAGE_SIZE = 20
+TRANSCRIPT_PAGE_SIZE = 20
+SEARCH_RESULT_LIMIT = 20
 
-log_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'logs')
-os.makedirs(log_dir, exist_ok=True)
-log_file = os.path.join(log_dir, 'mcp_interactions.log')
+# ts_headline markers; ui_utils turns them into <mark> tags after escaping the text
+HIGHLIGHT_START = "\u2983"
+HIGHLIGHT_STOP = "\u2984"
+HEADLINE_OPTIONS = f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}, MaxWords=30, MinWords=10, MaxFragments=2"
 
-logging.basicConfig(
-    filename=log_file,
-    level=logging.INFO,
-    format='%(asctime)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+def init_database():
+    """
+    Bring the database schema up to date.
+    
+    Returns:
+        bool: True if the schema is current, False on error
+    """
+    return run_migrations()
+
+def save_chat_interaction(session_id, user_question, assistant_response=None, tool_used=None, user_email=None):
+    """
+    Queue an interaction for writing to PostgreSQL
+    
+    The interaction is stored in the local write-behind queue and inserted in
+    the background, so the caller never waits on the database.
+    
+    Args:
+        user_email (str, optional): Owner of the session; their cached session
+            lists are dropped, as the session moves to the top of the sidebar
+    
+    Returns:
+        bool: True if the interaction was queued
+    """
+    try:
+        response_text = assistant_response or "Processing..."
+        get_write_behind_queue().enqueue(session_id, user_question, response_text, tool_used)
+        invalidate(session_tag(session_id), *([user_tag(user_email)] if user_email else []))
+        return True
+    except sqlite3.Error as e:
+        logger.error(f"Error queueing interaction: {str(e)}")
+        return False
 
-def get_db_connection():
+def create_chat_session(user_email):
+    session_id = str(uuid.uuid4())
     try:
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            database=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            port=DB_PORT
-        )
-        return conn
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(queries.INSERT_SESSION, (session_id, user_email))
+            conn.commit()
+        invalidate(user_tag(user_email))
+        return session_id
     except psycopg2.Error as e:
-        logging.error(f"Database connection error: {str(e)}")
+        logger.error(f"Error creating chat session: {str(e)}")
         return None
 
-def init_database():
-    conn = get_db_connection()
-    if conn is None:
-        return False
+@read_through(
+    "chat_sessions",
+    tags=lambda result, user_email, *args: [user_tag(user_email)] + [session_tag(row[0]) for row in result],
+)
+def _fetch_chat_sessions(user_email, limit, before):
+    with get_connection() as conn, conn.cursor() as cur:
+        if before is None:
+            cur.execute(queries.SELECT_SESSIONS_FIRST_PAGE, (user_email, limit + 1))
+        else:
+            cur.execute(queries.SELECT_SESSIONS_AFTER, (user_email, before[0], before[1], limit + 1))
+        return tuple(cur.fetchall())
+
+def get_chat_sessions(user_email, limit=SESSION_PAGE_SIZE, before=None):
+    """
+    Get one page of a user's chat sessions, most recently active first
     
+    Args:
+        user_email (str): The user's email address
+        limit (int): Maximum number of sessions to return
+        before (tuple, optional): (last_activity_at, session_id) of the last
+            session on the previous page
+        
+    Returns:
+        tuple: (rows, next_cursor) where rows are (session_id, title,
+        created_at, last_activity_at, message_count) and next_cursor is the
+        ``before`` value for the next page, or None if this is the last page
+    """
     try:
-        with conn.cursor() as cur:
-            # Check if user_id column exists in chat_sessions table
-            cur.execute("""
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name='chat_sessions' AND column_name='user_id'
-            """)
-            
-            user_id_exists = cur.fetchone() is not None
-            
-            if not user_id_exists:
-                # First create the table if it doesn't exist
-                cur.execute("""
-                CREATE TABLE IF NOT EXISTS chat_sessions (
-                    session_id VARCHAR(36) PRIMARY KEY,
-                    user_id VARCHAR(255),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-                """)
-                
-                # Then add user_id column if the table already existed but without this column
-                cur.execute("""
-                ALTER TABLE chat_sessions 
-                ADD COLUMN IF NOT EXISTS user_id VARCHAR(255)
-                """)
-            else:
-                # Table exists and has user_id column
-                cur.execute("""
-                CREATE TABLE IF NOT EXISTS chat_sessions (
-                    session_id VARCHAR(36) PRIMARY KEY,
-                    user_id VARCHAR(255),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-                """)
-            
-            cur.execute("""
-            CREATE TABLE IF NOT EXISTS chat_interactions (
-                interaction_id SERIAL PRIMARY KEY,
-                session_id VARCHAR(36) REFERENCES chat_sessions(session_id),
-                user_question TEXT NOT NULL,
-                assistant_response TEXT NOT NULL,
-                tool_used VARCHAR(50),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """)
-            
-            cur.execute("""
-            DROP TABLE IF EXISTS chat_messages CASCADE
-            """)
-            conn.commit()
-            return True
+        rows = list(_fetch_chat_sessions(user_email, limit, before))
     except psycopg2.Error as e:
-        logging.error(f"Database initialization error: {str(e)}")
-        return False
-    finally:
-        conn.close()
+        logger.error(f"Error retrieving chat sessions: {str(e)}")
+        return [], None
 
-def save_chat_interaction(session_id, user_question, assistant_response=None, tool_used=None):
-    conn = get_db_connection()
-    if conn is None:
-        return False
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, (rows[-1][3], rows[-1][0])
+
+@read_through("chat_transcript", tags=lambda result, session_id: [session_tag(session_id)])
+def _fetch_chat_interactions(session_id):
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute(queries.SELECT_TRANSCRIPT, (session_id,))
+        return tuple(decode_response_rows(cur.fetchall(), 1))
+
+def get_chat_interactions(session_id, include_pending=True):
+    """
+    Get a session's full transcript, oldest first
     
+    Args:
+        session_id (str): The chat session ID
+        include_pending (bool): Also return turns still in the write-behind queue
+        
+    Returns:
+        list: (user_question, assistant_response, tool_used, created_at) tuples
+    """
     try:
-        response_text = assistant_response or "Processing..."
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO chat_interactions (session_id, user_question, assistant_response, tool_used)
-                VALUES (%s, %s, %s, %s)
-                """,
-                (session_id, user_question, response_text, tool_used)
-            )
-            conn.commit()
-            return True
+        rows = list(_fetch_chat_interactions(session_id))
     except psycopg2.Error as e:
-        logging.error(f"Error saving interaction: {str(e)}")
-        return False
-    finally:
-        conn.close()
+        logger.error(f"Error retrieving chat interactions: {str(e)}")
+        rows = []
+    if not include_pending:
+        return rows
+    # Interactions still in the write-behind queue are newer than anything stored
+    pending = get_write_behind_queue().pending_for_session(session_id)
+    return rows + [row[1:] for row in pending]
 
-def create_chat_session(user_email):
-    session_id = str(uuid.uuid4())
-    conn = get_db_connection()
-    if conn is None:
-        return None
+@read_through("chat_transcript_page", tags=lambda result, session_id, *args: [session_tag(session_id)])
+def _fetch_chat_interactions_page(session_id, limit, before):
+    with get_connection() as conn, conn.cursor() as cur:
+        if before is None:
+            cur.execute(queries.SELECT_TRANSCRIPT_LATEST, (session_id, limit + 1))
+        else:
+            cur.execute(queries.SELECT_TRANSCRIPT_BEFORE, (session_id, before[0], before[1], limit + 1))
+        return tuple(decode_response_rows(cur.fetchall(), 2))
 
+def get_chat_interactions_page(session_id, limit=TRANSCRIPT_PAGE_SIZE, before=None):
+    """
+    Get one page of a session's transcript, walking backwards from the latest turn
+    
+    Args:
+        session_id (str): The chat session ID
+        limit (int): Maximum number of turns to return
+        before (tuple, optional): (created_at, interaction_id) of the oldest
+            turn already loaded
+        
+    Returns:
+        tuple: (rows, next_cursor) where rows are (interaction_id, user_question,
+        assistant_response, tool_used, created_at) in chronological order and
+        next_cursor is the ``before`` value for the next older page, or None if
+        the start of the session was reached
+    """
     try:
-        with conn.cursor() as cur:
-            cur.execute(
-                "INSERT INTO chat_sessions (session_id, user_id) VALUES (%s, %s)",
-                (session_id, user_email)
-            )
-            conn.commit()
-            return session_id
+        rows = list(_fetch_chat_interactions_page(session_id, limit, before))
     except psycopg2.Error as e:
-        logging.error(f"Error creating chat session: {str(e)}")
-        return None
-    finally:
-        conn.close()
+        logger.error(f"Error retrieving chat interactions: {str(e)}")
+        rows = []
 
-def get_chat_sessions(user_email):
-    conn = get_db_connection()
-    if conn is None:
-        return []
+    cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        cursor = (rows[-1][4], rows[-1][0])
+    rows.reverse()
+    if before is None:
+        # Interactions still in the write-behind queue are newer than anything stored
+        rows += get_write_behind_queue().pending_for_session(session_id)
+    return rows, cursor
 
+@read_through("chat_transcript_since", tags=lambda result, session_id, *args: [session_tag(session_id)])
+def _fetch_chat_interactions_since(session_id, created_at, interaction_id):
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute(queries.SELECT_TRANSCRIPT_SINCE, (session_id, created_at, interaction_id))
+        rows = tuple(decode_response_rows(cur.fetchall(), 2))
+        # Probe for one older turn, so the cursor is only offered when there is one
+        cur.execute(queries.SELECT_TRANSCRIPT_BEFORE, (session_id, created_at, interaction_id, 1))
+        return rows, cur.fetchone() is not None
+
+def get_chat_interactions_since(session_id, created_at, interaction_id):
+    """
+    Get a session's transcript from one turn up to the latest turn
+    
+    Args:
+        session_id (str): The chat session ID
+        created_at (datetime): Timestamp of the first turn to include
+        interaction_id (int): ID of the first turn to include
+        
+    Returns:
+        tuple: (rows, next_cursor) shaped like get_chat_interactions_page
+    """
     try:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT session_id, created_at 
-                FROM chat_sessions 
-                WHERE user_id = %s
-                ORDER BY created_at DESC
-                """,
-                (user_email,)
-            )
-            return cur.fetchall()
+        rows, has_older = _fetch_chat_interactions_since(session_id, created_at, interaction_id)
     except psycopg2.Error as e:
-        logging.error(f"Error retrieving chat sessions: {str(e)}")
-        return []
-    finally:
-        conn.close()
+        logger.error(f"Error retrieving chat interactions: {str(e)}")
+        return [], None
 
-def get_chat_interactions(session_id):
-    conn = get_db_connection()
-    if conn is None:
-        return []
+    rows = list(rows) + get_write_behind_queue().pending_for_session(session_id)
+    return rows, (created_at, interaction_id) if rows and has_older else None
+
+def search_chat_history(user_email, query, limit=SEARCH_RESULT_LIMIT):
+    """
+    Full-text search over all of a user's chat turns
     
+    Args:
+        user_email (str): The user's email address
+        query (str): Search terms; quotes, OR and -word are supported
+        limit (int): Maximum number of results
+        
+    Returns:
+        list: (interaction_id, session_id, session_title, created_at, rank,
+        question_snippet, answer_snippet) tuples, best match first. Snippets
+        wrap matches in HIGHLIGHT_START/HIGHLIGHT_STOP.
+    """
+    if not query or not query.strip():
+        return []
     try:
-        with conn.cursor() as cur:
+        with get_connection() as conn, conn.cursor() as cur:
             cur.execute(
-                """
-                SELECT user_question, assistant_response, tool_used, created_at 
-                FROM chat_interactions 
-                WHERE session_id = %s 
-                ORDER BY created_at
-                """,
-                (session_id,)
+                queries.SEARCH_INTERACTIONS,
+                (HEADLINE_OPTIONS, HEADLINE_OPTIONS, query, user_email, limit)
             )
             return cur.fetchall()
     except psycopg2.Error as e:
-        logging.error(f"Error retrieving chat interactions: {str(e)}")
+        logger.error(f"Error searching chat history: {str(e)}")
         return []
-    finally:
-        conn.close()
+
+def after_sessions_deleted(session_ids, owners):
+    """
+    Finish marking sessions as deleted, in db.py and async_db.py alike
+    
+    Queued interactions of the sessions are dropped so they are never
+    written, cached reads of the sessions and of their owners' session lists
+    are invalidated, and a purge pass is started.
+    
+    Args:
+        session_ids (iterable): IDs of the sessions marked as deleted
+        owners (iterable): Emails of the sessions' owners
+    """
+    session_ids = list(session_ids)
+    queue = get_write_behind_queue()
+    for session_id in session_ids:
+        queue.discard_session(session_id)
+    invalidate(*(session_tag(session_id) for session_id in session_ids), *{user_tag(owner) for owner in owners})
+    get_session_purger().wake()
 
 def delete_chat_session(session_id):
-    conn = get_db_connection()
-    if conn is None:
-        logging.error("Failed to get database connection for deleting chat session.")
-        return False
+    """
+    Delete a chat session
+    
+    The session is only marked as deleted, which hides it immediately; its
+    rows are removed later by the background purge in bounded batches.
     
+    Returns:
+        bool: True if the session is gone from the user's view
+    """
     try:
-        with conn.cursor() as cur:
-            cur.execute(
-                "DELETE FROM chat_interactions WHERE session_id = %s",
-                (session_id,)
-            )
-            logging.info(f"Deleted interactions for session {session_id}")
-            
-            cur.execute(
-                "DELETE FROM chat_sessions WHERE session_id = %s",
-                (session_id,)
-            )
-            logging.info(f"Deleted session {session_id}")
-            
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(queries.SOFT_DELETE_SESSIONS, ([session_id],))
+            owners = {row[1] for row in cur.fetchall()}
             conn.commit()
-            return True
+        logger.info(f"Marked session {session_id} as deleted")
+        after_sessions_deleted([session_id], owners)
+        return True
     except psycopg2.Error as e:
-        logging.error(f"Error deleting chat session: {str(e)}")
-        conn.rollback()
+        logger.error(f"Error deleting chat session: {str(e)}")
         return False
     except Exception as e:
-        logging.error(f"Unexpected error deleting chat session: {str(e)}")
-        conn.rollback()
+        logger.error(f"Unexpected error deleting chat session: {str(e)}")
         return False
+
+def delete_chat_sessions(user_email, older_than_days=None, batch_size=PURGE_BATCH_SIZE):
+    """
+    Delete all of a user's chat sessions, or those inactive for a number of days
+    
+    Sessions are marked as deleted in batches of ``batch_size``, each in its
+    own transaction, and purged in the background like delete_chat_session.
+    
+    Args:
+        user_email (str): The user's email address
+        older_than_days (int, optional): Only delete sessions whose last
+            activity is older than this; None deletes every session
+        batch_size (int): Sessions marked per transaction
+        
+    Returns:
+        list: IDs of the deleted sessions, or None on error
+    """
+    cutoff = None
+    if older_than_days is not None:
+        cutoff = datetime.now() - timedelta(days=older_than_days)
+    deleted = []
+    try:
+        while True:
+            with get_connection() as conn, conn.cursor() as cur:
+                cur.execute(queries.SOFT_DELETE_USER_SESSIONS_BATCH, (user_email, cutoff, cutoff, batch_size))
+                batch = [row[0] for row in cur.fetchall()]
+                conn.commit()
+            deleted += batch
+            if len(batch) < batch_size:
+                break
+    except psycopg2.Error as e:
+        logger.error(f"Error deleting chat sessions: {str(e)}")
+        return None
     finally:
-        conn.close()
+        if deleted:
+            after_sessions_deleted(deleted, [user_email])
+    logger.info(f"Marked {len(deleted)} sessions of {user_email} as deleted")
+    return deleted
+
+@read_through(
+    "latest_session",
+    tags=lambda result, user_email: [user_tag(user_email)] + ([session_tag(result)] if result else []),
+)
+def _fetch_latest_session(user_email):
+    with get_connection() as conn, conn.cursor() as cur:
+        # Get the most recent session for this user
+        cur.execute(queries.SELECT_LATEST_SESSION, (user_email,))
+        result = cur.fetchone()
+        return result[0] if result else None
 
 def get_latest_session(user_email):
     """
@@ -232,25 +334,87 @@ def get_latest_session(user_email):
     Returns:
         str: The session ID of the most recent chat, or None if no sessions exist
     """
-    conn = None
     try:
-        conn = get_db_connection()
-        if conn is None:
-            return None
-            
-        with conn.cursor() as cur:
-            # Get the most recent session for this user
-            cur.execute(
-                "SELECT session_id FROM chat_sessions WHERE user_id = %s ORDER BY created_at DESC LIMIT 1",
-                (user_email,)
-            )
-            
-            result = cur.fetchone()
-            return result[0] if result else None
-            
+        return _fetch_latest_session(user_email)
     except Exception as e:
-        logging.error(f"Database error in get_latest_session: {str(e)}")
+        logger.error(f"Database error in get_latest_session: {str(e)}")
+        return None
+
+def get_image_references():
+    """
+    Get the image paths referenced by the turns of live chat sessions
+    
+    Returns:
+        list: One image path per referencing turn
+        
+    Raises:
+        psycopg2.Error: If the database is unavailable, so the image store
+            keeps its previous reference counts
+    """
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute(queries.SELECT_IMAGE_RESPONSES)
+        rows = decode_response_rows(cur.fetchall(), 0)
+    return [path for path in (extract_image_path(row[0]) for row in rows) if path]
+
+def revoke_session_token(token_id, expires_at):
+    """
+    Revoke a signed session token, e.g. on logout
+    
+    Args:
+        token_id (str): The token's id claim
+        expires_at (datetime): When the token expires; the revocation is kept until then
+        
+    Returns:
+        bool: True if the revocation was stored, False on error
+    """
+    try:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(queries.INSERT_REVOKED_TOKEN, (token_id, expires_at))
+            conn.commit()
+            return True
+    except psycopg2.Error as e:
+        logger.error(f"Database error in revoke_session_token: {str(e)}")
+        return False
+
+def get_revoked_token_ids():
+    """
+    Get the ids of revoked session tokens that have not expired yet
+    
+    Returns:
+        list: Token ids
+        
+    Raises:
+        psycopg2.Error: If the database is unavailable, so the caller can keep
+            its previous revocation list
+    """
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute(queries.SELECT_REVOKED_TOKENS)
+        return [row[0] for row in cur.fetchall()]
+
+@read_through(
+    "session_owner",
+    tags=lambda result, session_id: [session_tag(session_id)] + ([user_tag(result)] if result else []),
+)
+def _fetch_session_owner(session_id):
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute(queries.SELECT_SESSION_OWNER, (session_id,))
+        result = cur.fetchone()
+        return result[0] if result else None
+
+def get_session_owner(session_id):
+    """
+    Get the user a chat session belongs to
+    
+    Cached until the session is written to or deleted.
+    
+    Args:
+        session_id (str): The chat session ID
+        
+    Returns:
+        str: The owner's email address, or None if the session does not exist or was deleted
+    """
+    try:
+        return _fetch_session_owner(session_id)
+    except psycopg2.Error as e:
+        logger.error(f"Error verifying session: {str(e)}")
         return None
-    finally:
-        if conn:
-            conn.close()
\ No newline at end of file
@@ -0,0 +1,208 @@
+"""
+Maintenance job for chat_interactions.
+
+Creates upcoming monthly partitions, purges deleted sessions and expired
+token revocations, moves large responses older than a cutoff into
+compressed form, vacuums the touched partitions and reports
+what that saved: stored response bytes before and after compression, the
+on-disk size of the table, and the read latency of hot (uncompressed) and
+cold (compressed) sessions.
+
+Usage:
+    python -m src.database.maintenance
+    python -m src.database.maintenance --cold-days 60 --min-bytes 4096 --vacuum-full
+    python -m src.database.maintenance --report-only
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import psycopg2
+
+from src.database import queries
+from src.database.compression import compress_response
+from src.database.db import get_chat_interactions
+from src.database.migrations import PARTITION_MONTHS_AHEAD
+from src.database.pool import get_connection
+from src.database.purge import purge_deleted_sessions
+from src.utils.log_utils import configure_logging, get_logger
+
+COLD_AFTER_DAYS = int(os.getenv("COLD_AFTER_DAYS", "30"))
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "2048"))
+COMPRESS_BATCH_SIZE = 500
+
+logger = get_logger("maintenance")
+
+
+def table_size_bytes(cur):
+    """On-disk size of all chat_interactions partitions, including indexes and TOAST."""
+    cur.execute("""
+    SELECT COALESCE(SUM(pg_total_relation_size(relid)), 0)
+    FROM pg_partition_tree('chat_interactions')
+    WHERE isleaf
+    """)
+    return int(cur.fetchone()[0])
+
+
+def compress_cold_responses(cold_days=COLD_AFTER_DAYS, min_bytes=COMPRESS_MIN_BYTES, batch_size=COMPRESS_BATCH_SIZE):
+    """
+    Compress responses of turns older than ``cold_days``.
+
+    Rows are processed in batches, each committed on its own, so the job can
+    be interrupted and resumed.
+
+    Returns:
+        dict: rows compressed, bytes before/after and the partitions touched
+    """
+    stats = {"rows": 0, "text_bytes": 0, "compressed_bytes": 0, "partitions": set()}
+    last_id = 0
+    while True:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT interaction_id, created_at, assistant_response, tableoid::regclass::text
+                FROM chat_interactions
+                WHERE created_at < CURRENT_TIMESTAMP - make_interval(days => %s)
+                  AND assistant_response IS NOT NULL
+                  AND octet_length(assistant_response) >= %s
+                  AND interaction_id > %s
+                ORDER BY interaction_id
+                LIMIT %s
+                """,
+                (cold_days, min_bytes, last_id, batch_size)
+            )
+            rows = cur.fetchall()
+            if not rows:
+                break
+            updates = []
+            for interaction_id, created_at, response, partition in rows:
+                compressed, codec = compress_response(response)
+                stats["text_bytes"] += len(response.encode("utf-8"))
+                stats["compressed_bytes"] += len(compressed)
+                stats["partitions"].add(partition)
+                updates.append((psycopg2.Binary(compressed), codec, interaction_id, created_at))
+            cur.executemany(
+                """
+                UPDATE chat_interactions
+                SET response_compressed = %s, response_codec = %s, assistant_response = NULL
+                WHERE interaction_id = %s AND created_at = %s
+                """,
+                updates
+            )
+            conn.commit()
+            stats["rows"] += len(rows)
+            last_id = rows[-1][0]
+    stats["partitions"] = sorted(stats["partitions"])
+    return stats
+
+
+def vacuum(partitions, full=False):
+    """VACUUM the given partitions; FULL returns the space to the OS but locks them."""
+    with get_connection() as conn:
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                for partition in partitions:
+                    cur.execute(f"VACUUM ({'FULL, ' if full else ''}ANALYZE) {partition}")
+        finally:
+            conn.autocommit = False
+
+
+def _sample_sessions(cur, cold, limit):
+    if cold:
+        cur.execute(
+            """
+            SELECT session_id FROM chat_interactions
+            WHERE response_compressed IS NOT NULL
+            GROUP BY session_id
+            LIMIT %s
+            """,
+            (limit,)
+        )
+    else:
+        cur.execute(
+            """
+            SELECT session_id FROM chat_interactions
+            GROUP BY session_id
+            HAVING COUNT(response_compressed) = 0
+            ORDER BY MAX(created_at) DESC
+            LIMIT %s
+            """,
+            (limit,)
+        )
+    return [row[0] for row in cur.fetchall()]
+
+
+def read_latency(session_ids):
+    """Time get_chat_interactions() for each session and summarise in milliseconds."""
+    timings = []
+    for session_id in session_ids:
+        start = time.perf_counter()
+        # Leave the app's write-behind queue alone; it belongs to the app process
+        get_chat_interactions(session_id, include_pending=False)
+        timings.append((time.perf_counter() - start) * 1000)
+    if not timings:
+        return {"sessions": 0}
+    timings.sort()
+    return {
+        "sessions": len(timings),
+        "p50_ms": round(timings[len(timings) // 2], 2),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+        "max_ms": round(timings[-1], 2),
+    }
+
+
+def run(args):
+    report = {}
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT ensure_chat_interaction_partitions(%s)", (PARTITION_MONTHS_AHEAD,))
+        report["partitions_created"] = cur.fetchone()[0]
+        conn.commit()
+        report["table_bytes_before"] = table_size_bytes(cur)
+
+    if not args.report_only:
+        report["purge"] = purge_deleted_sessions()
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(queries.PURGE_EXPIRED_REVOCATIONS)
+            report["revocations_purged"] = cur.rowcount
+            conn.commit()
+        compression = compress_cold_responses(args.cold_days, args.min_bytes)
+        if compression["partitions"]:
+            vacuum(compression["partitions"], full=args.vacuum_full)
+        report["compression"] = compression
+        report["response_bytes_saved"] = compression["text_bytes"] - compression["compressed_bytes"]
+
+    with get_connection() as conn, conn.cursor() as cur:
+        report["table_bytes_after"] = table_size_bytes(cur)
+        hot_sessions = _sample_sessions(cur, cold=False, limit=args.sample_sessions)
+        cold_sessions = _sample_sessions(cur, cold=True, limit=args.sample_sessions)
+    report["table_bytes_reclaimed"] = report["table_bytes_before"] - report["table_bytes_after"]
+    report["read_latency"] = {"hot": read_latency(hot_sessions), "cold": read_latency(cold_sessions)}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Partition and compress chat history")
+    parser.add_argument("--cold-days", type=int, default=COLD_AFTER_DAYS, help="Compress turns older than this")
+    parser.add_argument("--min-bytes", type=int, default=COMPRESS_MIN_BYTES, help="Only compress larger responses")
+    parser.add_argument("--vacuum-full", action="store_true", help="Return freed space to the OS (locks partitions)")
+    parser.add_argument("--report-only", action="store_true", help="Only measure sizes and read latency")
+    parser.add_argument("--sample-sessions", type=int, default=20, help="Sessions timed per hot/cold group")
+    args = parser.parse_args()
+
+    configure_logging("maintenance")
+    try:
+        report = run(args)
+    except psycopg2.Error as e:
+        logger.error(f"Maintenance failed: {str(e)}")
+        sys.exit(1)
+    print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
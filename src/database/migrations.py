@@ -0,0 +1,302 @@
+"""
+Versioned schema migrations.
+
+Each migration is applied once, in order, in its own transaction and
+recorded in the schema_migrations table. run_migrations() holds a
+PostgreSQL advisory lock while it works, so several app processes starting
+at the same time do not race each other. Once the schema is current a run
+costs a SELECT plus a check that upcoming monthly partitions exist.
+
+To change the schema, append a new Migration to MIGRATIONS; never edit one
+that has already shipped.
+"""
+
+from collections import namedtuple
+
+import psycopg2
+
+from src.database.pool import get_connection
+from src.utils.log_utils import get_logger
+
+logger = get_logger("db")
+
+# Arbitrary application-wide key for pg_advisory_lock
+MIGRATION_LOCK_KEY = 72_410_031
+
+# Monthly chat_interactions partitions are created this far ahead on every
+# run, so new rows do not land in the default partition
+PARTITION_MONTHS_AHEAD = 3
+
+Migration = namedtuple("Migration", ["version", "description", "statements"])
+
+MIGRATIONS = [
+    Migration(1, "Base chat tables", [
+        """
+        CREATE TABLE IF NOT EXISTS chat_sessions (
+            session_id VARCHAR(36) PRIMARY KEY,
+            user_id VARCHAR(255),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # Databases created before user accounts existed lack this column
+        "ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS user_id VARCHAR(255)",
+        """
+        CREATE TABLE IF NOT EXISTS chat_interactions (
+            interaction_id SERIAL PRIMARY KEY,
+            session_id VARCHAR(36) REFERENCES chat_sessions(session_id),
+            user_question TEXT NOT NULL,
+            assistant_response TEXT NOT NULL,
+            tool_used VARCHAR(50),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "DROP TABLE IF EXISTS chat_messages CASCADE",
+    ]),
+    Migration(2, "Indexes for session lists and transcripts", [
+        """
+        CREATE INDEX IF NOT EXISTS idx_chat_interactions_session_created
+        ON chat_interactions (session_id, created_at)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_chat_sessions_user_created
+        ON chat_sessions (user_id, created_at DESC)
+        """,
+    ]),
+    Migration(3, "Cascade interaction deletes from their session", [
+        "DELETE FROM chat_interactions WHERE session_id NOT IN (SELECT session_id FROM chat_sessions)",
+        "ALTER TABLE chat_interactions DROP CONSTRAINT IF EXISTS chat_interactions_session_id_fkey",
+        """
+        ALTER TABLE chat_interactions
+        ADD CONSTRAINT chat_interactions_session_id_fkey
+        FOREIGN KEY (session_id) REFERENCES chat_sessions(session_id) ON DELETE CASCADE
+        """,
+    ]),
+    Migration(4, "Denormalized session title, activity time and message count", [
+        "ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS title VARCHAR(100)",
+        "ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS last_activity_at TIMESTAMP",
+        "ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS message_count INTEGER NOT NULL DEFAULT 0",
+        """
+        UPDATE chat_sessions s
+        SET title = stats.title,
+            message_count = stats.message_count,
+            last_activity_at = stats.last_activity_at
+        FROM (
+            SELECT DISTINCT ON (session_id)
+                session_id,
+                LEFT(user_question, 100) AS title,
+                COUNT(*) OVER (PARTITION BY session_id) AS message_count,
+                MAX(created_at) OVER (PARTITION BY session_id) AS last_activity_at
+            FROM chat_interactions
+            ORDER BY session_id, created_at, interaction_id
+        ) stats
+        WHERE s.session_id = stats.session_id
+        """,
+        "UPDATE chat_sessions SET last_activity_at = created_at WHERE last_activity_at IS NULL",
+        "ALTER TABLE chat_sessions ALTER COLUMN last_activity_at SET DEFAULT CURRENT_TIMESTAMP",
+        "ALTER TABLE chat_sessions ALTER COLUMN last_activity_at SET NOT NULL",
+        """
+        CREATE INDEX IF NOT EXISTS idx_chat_sessions_user_activity
+        ON chat_sessions (user_id, last_activity_at DESC, session_id DESC)
+        """,
+    ]),
+    Migration(5, "Keyset index for transcript pages", [
+        """
+        CREATE INDEX IF NOT EXISTS idx_chat_interactions_session_created_id
+        ON chat_interactions (session_id, created_at, interaction_id)
+        """,
+        "DROP INDEX IF EXISTS idx_chat_interactions_session_created",
+    ]),
+    Migration(6, "Full-text search over interactions", [
+        """
+        ALTER TABLE chat_interactions
+        ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(user_question, '')), 'A')
+            || setweight(to_tsvector('english', coalesce(assistant_response, '')), 'B')
+        ) STORED
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_chat_interactions_search
+        ON chat_interactions USING GIN (search_vector)
+        """,
+    ]),
+    # Requires PostgreSQL 13+ (row triggers on partitioned tables)
+    Migration(7, "Partition interactions by month with compressed cold responses", [
+        "ALTER TABLE chat_interactions RENAME TO chat_interactions_legacy",
+        "ALTER TABLE chat_interactions_legacy RENAME CONSTRAINT chat_interactions_pkey TO chat_interactions_legacy_pkey",
+        "ALTER INDEX idx_chat_interactions_session_created_id RENAME TO idx_chat_interactions_legacy_session",
+        "ALTER INDEX idx_chat_interactions_search RENAME TO idx_chat_interactions_legacy_search",
+        """
+        CREATE TABLE chat_interactions (
+            interaction_id INTEGER NOT NULL DEFAULT nextval('chat_interactions_interaction_id_seq'),
+            session_id VARCHAR(36) REFERENCES chat_sessions(session_id) ON DELETE CASCADE,
+            user_question TEXT NOT NULL,
+            assistant_response TEXT,
+            response_compressed BYTEA,
+            response_codec VARCHAR(10),
+            tool_used VARCHAR(50),
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            search_vector tsvector,
+            PRIMARY KEY (interaction_id, created_at),
+            CHECK (assistant_response IS NOT NULL OR response_compressed IS NOT NULL)
+        ) PARTITION BY RANGE (created_at)
+        """,
+        "CREATE TABLE chat_interactions_default PARTITION OF chat_interactions DEFAULT",
+        # Compressing a response clears assistant_response, so the vector is
+        # only recomputed while the plain text is present
+        """
+        CREATE OR REPLACE FUNCTION chat_interactions_search_vector() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.assistant_response IS NOT NULL THEN
+                NEW.search_vector :=
+                    setweight(to_tsvector('english', coalesce(NEW.user_question, '')), 'A')
+                    || setweight(to_tsvector('english', NEW.assistant_response), 'B');
+            END IF;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE TRIGGER chat_interactions_search_vector
+        BEFORE INSERT OR UPDATE OF user_question, assistant_response ON chat_interactions
+        FOR EACH ROW EXECUTE FUNCTION chat_interactions_search_vector()
+        """,
+        """
+        CREATE OR REPLACE FUNCTION ensure_chat_interaction_partitions(
+            months_ahead INTEGER, since TIMESTAMP DEFAULT NULL
+        ) RETURNS INTEGER AS $$
+        DECLARE
+            month_start DATE := date_trunc('month', COALESCE(since, CURRENT_TIMESTAMP))::date;
+            last_month DATE := (date_trunc('month', CURRENT_TIMESTAMP) + make_interval(months => months_ahead))::date;
+            partition_name TEXT;
+            created INTEGER := 0;
+        BEGIN
+            WHILE month_start <= last_month LOOP
+                partition_name := 'chat_interactions_' || to_char(month_start, 'YYYY_MM');
+                IF to_regclass(partition_name) IS NULL THEN
+                    BEGIN
+                        EXECUTE format(
+                            'CREATE TABLE %I PARTITION OF chat_interactions FOR VALUES FROM (%L) TO (%L)',
+                            partition_name, month_start, (month_start + INTERVAL '1 month')::date
+                        );
+                        created := created + 1;
+                    EXCEPTION WHEN others THEN
+                        -- e.g. the default partition already holds rows for this month
+                        RAISE WARNING 'Could not create partition %: %', partition_name, SQLERRM;
+                    END;
+                END IF;
+                month_start := (month_start + INTERVAL '1 month')::date;
+            END LOOP;
+            RETURN created;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        "SELECT ensure_chat_interaction_partitions(3, (SELECT MIN(created_at) FROM chat_interactions_legacy))",
+        """
+        INSERT INTO chat_interactions
+            (interaction_id, session_id, user_question, assistant_response, tool_used, created_at)
+        SELECT interaction_id, session_id, user_question, assistant_response, tool_used,
+               COALESCE(created_at, CURRENT_TIMESTAMP)
+        FROM chat_interactions_legacy
+        """,
+        "ALTER SEQUENCE chat_interactions_interaction_id_seq OWNED BY chat_interactions.interaction_id",
+        "DROP TABLE chat_interactions_legacy",
+        """
+        CREATE INDEX IF NOT EXISTS idx_chat_interactions_session_created_id
+        ON chat_interactions (session_id, created_at, interaction_id)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_chat_interactions_search
+        ON chat_interactions USING GIN (search_vector)
+        """,
+    ]),
+    Migration(8, "Soft-deleted sessions purged in the background", [
+        "ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP",
+        """
+        CREATE INDEX IF NOT EXISTS idx_chat_sessions_user_activity_live
+        ON chat_sessions (user_id, last_activity_at DESC, session_id DESC)
+        WHERE deleted_at IS NULL
+        """,
+        "DROP INDEX IF EXISTS idx_chat_sessions_user_activity",
+        """
+        CREATE INDEX IF NOT EXISTS idx_chat_sessions_deleted
+        ON chat_sessions (deleted_at)
+        WHERE deleted_at IS NOT NULL
+        """,
+    ]),
+    Migration(9, "Index image turns for the image store", [
+        """
+        CREATE INDEX IF NOT EXISTS idx_chat_interactions_images
+        ON chat_interactions (session_id)
+        WHERE tool_used = 'generate_image'
+        """,
+    ]),
+    Migration(10, "Revoked session tokens", [
+        """
+        CREATE TABLE IF NOT EXISTS revoked_session_tokens (
+            token_id TEXT PRIMARY KEY,
+            expires_at TIMESTAMP NOT NULL,
+            revoked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_revoked_session_tokens_expires
+        ON revoked_session_tokens (expires_at)
+        """,
+    ]),
+]
+
+
+def _applied_versions(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    cur.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cur.fetchall()}
+
+
+def run_migrations(migrations=MIGRATIONS):
+    """
+    Apply every migration that has not been applied yet.
+
+    Args:
+        migrations (list): Migrations to consider, in version order
+
+    Returns:
+        bool: True if the schema is up to date, False on error
+    """
+    try:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+            # DDL on a large table can outlast the pool's default statement_timeout
+            cur.execute("SET statement_timeout = 0")
+            conn.commit()
+            try:
+                applied = _applied_versions(cur)
+                conn.commit()
+                for migration in migrations:
+                    if migration.version in applied:
+                        continue
+                    logger.info(f"Applying migration {migration.version}: {migration.description}")
+                    for statement in migration.statements:
+                        cur.execute(statement)
+                    cur.execute(
+                        "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                        (migration.version, migration.description)
+                    )
+                    conn.commit()
+                cur.execute("SELECT ensure_chat_interaction_partitions(%s)", (PARTITION_MONTHS_AHEAD,))
+                conn.commit()
+            finally:
+                conn.rollback()
+                cur.execute("RESET statement_timeout")
+                cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+                conn.commit()
+        return True
+    except psycopg2.Error as e:
+        logger.error(f"Database migration error: {str(e)}")
+        return False
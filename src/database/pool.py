@@ -0,0 +1,191 @@
+"""
+Process-wide PostgreSQL connection pool.
+
+Connections are created lazily up to DB_POOL_MAX and reused across calls,
+so a query no longer pays for a TCP connect and authentication each time.
+Callers block for up to DB_POOL_TIMEOUT seconds when every connection is in
+use. Connections that sat idle for longer than DB_POOL_HEALTHCHECK_IDLE are
+pinged before being handed out, and broken ones are replaced. Every
+connection runs with a server-side statement_timeout.
+"""
+
+import atexit
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions, pool
+from dotenv import load_dotenv
+
+from src.utils.log_utils import get_logger
+from src.utils.metrics import counter, gauge, histogram
+
+load_dotenv()
+
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_NAME = os.getenv("DB_NAME", "chatbot_db")
+DB_USER = os.getenv("DB_USER", "postgres")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "darshit")
+DB_PORT = os.getenv("DB_PORT", "5432")
+
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_HEALTHCHECK_IDLE = float(os.getenv("DB_POOL_HEALTHCHECK_IDLE", "30"))
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "5"))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+
+POOL_WAIT = histogram(
+    "lightgpt_db_pool_wait_seconds",
+    "Time spent waiting for a pooled database connection",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0),
+)
+POOL_IN_USE = gauge("lightgpt_db_pool_connections_in_use", "Database connections checked out of the pool")
+POOL_CREATED = counter("lightgpt_db_pool_connections_created_total", "Database connections opened by the pool")
+POOL_DISCARDED = counter(
+    "lightgpt_db_pool_connections_discarded_total",
+    "Pooled database connections closed because they failed a health check or an operation",
+)
+POOL_TIMEOUTS = counter("lightgpt_db_pool_timeouts_total", "Checkouts that gave up waiting for a connection")
+
+logger = get_logger("db")
+
+
+class _CountingPool(pool.ThreadedConnectionPool):
+    """ThreadedConnectionPool that counts the connections it opens."""
+
+    def _connect(self, key=None):
+        conn = super()._connect(key)
+        POOL_CREATED.inc()
+        return conn
+
+
+class ConnectionPool:
+    """
+    Blocking wrapper around psycopg2's ThreadedConnectionPool.
+
+    psycopg2 raises PoolError as soon as the pool is exhausted; a semaphore
+    sized to the pool makes callers wait for a free connection instead.
+
+    Args:
+        minconn (int): Connections opened up front
+        maxconn (int): Upper bound on open connections
+        timeout (float): Seconds to wait for a free connection
+    """
+
+    def __init__(self, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX, timeout=DB_POOL_TIMEOUT):
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._last_used = {}
+        self._pool = _CountingPool(
+            minconn,
+            maxconn,
+            host=DB_HOST,
+            database=DB_NAME,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            port=DB_PORT,
+            connect_timeout=DB_CONNECT_TIMEOUT,
+            options=f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}",
+            application_name="lightgpt",
+        )
+
+    def _healthy(self, conn):
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn))
+        if last_used is None or time.monotonic() - last_used < DB_POOL_HEALTHCHECK_IDLE:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            POOL_TIMEOUTS.inc()
+            raise pool.PoolError(f"No database connection available after {self.timeout}s")
+        try:
+            # A connection that fails its health check is replaced, at most once per slot
+            for _ in range(2):
+                conn = self._pool.getconn()
+                if self._healthy(conn):
+                    break
+                self._discard(conn)
+            else:
+                conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        POOL_WAIT.observe(time.perf_counter() - start)
+        POOL_IN_USE.inc()
+        return conn
+
+    def _discard(self, conn):
+        logger.warning("Discarding broken database connection")
+        POOL_DISCARDED.inc()
+        self._last_used.pop(id(conn), None)
+        self._pool.putconn(conn, close=True)
+
+    def putconn(self, conn, broken=False):
+        try:
+            if broken or conn.closed:
+                self._discard(conn)
+                return
+            if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            self._last_used[id(conn)] = time.monotonic()
+            self._pool.putconn(conn)
+        except psycopg2.Error:
+            self._discard(conn)
+        finally:
+            POOL_IN_USE.dec()
+            self._slots.release()
+
+    def closeall(self):
+        if not self._pool.closed:
+            self._pool.closeall()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+                atexit.register(_pool.closeall)
+    return _pool
+
+
+@contextmanager
+def get_connection():
+    """
+    Borrow a pooled connection for the duration of a ``with`` block.
+
+    Uncommitted work is rolled back when the connection is returned, and a
+    connection that died during the block is discarded instead of reused.
+
+    Raises:
+        psycopg2.Error: If no connection can be obtained
+    """
+    db_pool = get_pool()
+    conn = db_pool.getconn()
+    broken = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        db_pool.putconn(conn, broken=broken)
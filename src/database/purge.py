@@ -0,0 +1,133 @@
+"""
+Background purge of deleted chat sessions.
+
+Deleting a session only sets chat_sessions.deleted_at, which hides it from
+every read at once. This module removes the rows afterwards: interactions
+are deleted in batches of PURGE_BATCH_SIZE, each in its own short
+transaction, so a huge session never holds many row locks or blocks the UI,
+and the session row goes last once it has no interactions left. A
+background thread runs the purge shortly after a delete and then every
+PURGE_INTERVAL seconds; the maintenance job can also run it.
+
+Environment:
+    PURGE_BATCH_SIZE: Rows deleted or marked per transaction (default: 1000)
+    PURGE_INTERVAL: Seconds between purge passes when idle (default: 300)
+"""
+
+import os
+import threading
+import time
+
+import psycopg2
+
+from src.database import queries
+from src.database.pool import get_connection
+from src.utils.log_utils import get_logger
+from src.utils.metrics import counter, histogram
+
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "1000"))
+PURGE_INTERVAL = float(os.getenv("PURGE_INTERVAL", "300"))
+
+PURGED_SESSIONS = counter("lightgpt_purged_sessions_total", "Deleted chat sessions removed from the database")
+PURGED_INTERACTIONS = counter("lightgpt_purged_interactions_total", "Interactions of deleted sessions removed")
+PURGE_BATCH_LATENCY = histogram("lightgpt_purge_batch_seconds", "Time to delete one batch of purged rows")
+
+logger = get_logger("db")
+
+
+def purge_session(session_id, batch_size=PURGE_BATCH_SIZE):
+    """
+    Remove a soft-deleted session and its interactions in bounded batches.
+
+    Returns:
+        int: Interactions deleted
+    """
+    deleted = 0
+    while True:
+        start = time.perf_counter()
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(queries.PURGE_INTERACTIONS_BATCH, (session_id, batch_size))
+            count = cur.rowcount
+            if count < batch_size:
+                cur.execute(queries.PURGE_SESSION, (session_id, session_id))
+                PURGED_SESSIONS.inc(cur.rowcount)
+            conn.commit()
+        PURGE_BATCH_LATENCY.observe(time.perf_counter() - start)
+        PURGED_INTERACTIONS.inc(count)
+        deleted += count
+        if count < batch_size:
+            return deleted
+
+
+def purge_deleted_sessions(batch_size=PURGE_BATCH_SIZE, max_sessions=None):
+    """
+    Purge soft-deleted sessions, oldest deletion first.
+
+    Args:
+        batch_size (int): Rows deleted per transaction
+        max_sessions (int, optional): Stop after this many sessions
+
+    Returns:
+        dict: sessions and interactions purged
+
+    Raises:
+        psycopg2.Error: If PostgreSQL is unavailable; the remaining work is
+            picked up by the next pass
+    """
+    stats = {"sessions": 0, "interactions": 0}
+    while max_sessions is None or stats["sessions"] < max_sessions:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(queries.SELECT_DELETED_SESSIONS, (batch_size,))
+            session_ids = [row[0] for row in cur.fetchall()]
+        if not session_ids:
+            break
+        for session_id in session_ids:
+            if max_sessions is not None and stats["sessions"] >= max_sessions:
+                break
+            stats["interactions"] += purge_session(session_id, batch_size)
+            stats["sessions"] += 1
+    if stats["sessions"]:
+        logger.info(f"Purged {stats['sessions']} deleted sessions ({stats['interactions']} interactions)")
+    return stats
+
+
+class SessionPurger:
+    """
+    Daemon thread that runs purge_deleted_sessions() after deletes and periodically.
+
+    Args:
+        interval (float): Seconds between passes when nothing wakes the thread
+    """
+
+    def __init__(self, interval=PURGE_INTERVAL):
+        self.interval = interval
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="session-purge", daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        """Start a purge pass now instead of at the next interval."""
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                purge_deleted_sessions()
+            except psycopg2.Error as e:
+                logger.warning(f"Session purge failed, retrying later: {str(e)}")
+
+
+_purger = None
+_purger_lock = threading.Lock()
+
+
+def get_session_purger():
+    """Return the process-wide purger, starting its thread on first use."""
+    global _purger
+    if _purger is None:
+        with _purger_lock:
+            if _purger is None:
+                _purger = SessionPurger()
+    return _purger
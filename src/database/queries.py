@@ -0,0 +1,222 @@
+"""
+SQL shared by the sync (db.py, write_behind.py) and async (async_db.py)
+data-access layers.
+
+Both psycopg2 and psycopg 3 use %s placeholders, so the same strings work
+with either driver. The schema itself is defined by migrations.py.
+"""
+
+INSERT_SESSION = "INSERT INTO chat_sessions (session_id, user_id) VALUES (%s, %s)"
+
+SESSION_COLUMNS = "session_id, title, created_at, last_activity_at, message_count"
+
+SELECT_SESSIONS_FIRST_PAGE = f"""
+SELECT {SESSION_COLUMNS}
+FROM chat_sessions
+WHERE user_id = %s AND deleted_at IS NULL
+ORDER BY last_activity_at DESC, session_id DESC
+LIMIT %s
+"""
+
+SELECT_SESSIONS_AFTER = f"""
+SELECT {SESSION_COLUMNS}
+FROM chat_sessions
+WHERE user_id = %s AND deleted_at IS NULL AND (last_activity_at, session_id) < (%s, %s)
+ORDER BY last_activity_at DESC, session_id DESC
+LIMIT %s
+"""
+
+SELECT_SESSIONS_BY_IDS = f"""
+SELECT {SESSION_COLUMNS}, user_id
+FROM chat_sessions
+WHERE session_id = ANY(%s) AND deleted_at IS NULL
+"""
+
+SELECT_LATEST_SESSION = """
+SELECT session_id FROM chat_sessions
+WHERE user_id = %s AND deleted_at IS NULL
+ORDER BY last_activity_at DESC, session_id DESC
+LIMIT 1
+"""
+
+SELECT_SESSION_OWNER = "SELECT user_id FROM chat_sessions WHERE session_id = %s AND deleted_at IS NULL"
+
+SELECT_SESSION_OWNERS = "SELECT DISTINCT user_id FROM chat_sessions WHERE session_id = ANY(%s)"
+
+# Signed session tokens are checked in memory; only revocations live in the database
+INSERT_REVOKED_TOKEN = """
+INSERT INTO revoked_session_tokens (token_id, expires_at)
+VALUES (%s, %s)
+ON CONFLICT (token_id) DO NOTHING
+"""
+
+SELECT_REVOKED_TOKENS = "SELECT token_id FROM revoked_session_tokens WHERE expires_at > CURRENT_TIMESTAMP"
+
+PURGE_EXPIRED_REVOCATIONS = "DELETE FROM revoked_session_tokens WHERE expires_at <= CURRENT_TIMESTAMP"
+
+# Deletes only mark sessions; purge.py removes their rows later in bounded batches
+SOFT_DELETE_SESSIONS = """
+UPDATE chat_sessions
+SET deleted_at = CURRENT_TIMESTAMP
+WHERE session_id = ANY(%s) AND deleted_at IS NULL
+RETURNING session_id, user_id
+"""
+
+# Parameters: user_id, last-activity cutoff (NULL for all sessions), batch size
+SOFT_DELETE_USER_SESSIONS_BATCH = """
+UPDATE chat_sessions
+SET deleted_at = CURRENT_TIMESTAMP
+WHERE session_id IN (
+    SELECT session_id FROM chat_sessions
+    WHERE user_id = %s AND deleted_at IS NULL
+      AND (%s::timestamp IS NULL OR last_activity_at < %s::timestamp)
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING session_id
+"""
+
+SELECT_DELETED_SESSIONS = """
+SELECT session_id FROM chat_sessions
+WHERE deleted_at IS NOT NULL
+ORDER BY deleted_at
+LIMIT %s
+"""
+
+# Parameters: session_id, batch size
+PURGE_INTERACTIONS_BATCH = """
+DELETE FROM chat_interactions
+WHERE (interaction_id, created_at) IN (
+    SELECT interaction_id, created_at FROM chat_interactions
+    WHERE session_id = %s
+    LIMIT %s
+)
+"""
+
+PURGE_SESSION = """
+DELETE FROM chat_sessions
+WHERE session_id = %s AND deleted_at IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM chat_interactions WHERE session_id = %s)
+"""
+
+# Transcript rows end in (response_compressed, response_codec); see compression.decode_response_rows
+SELECT_TRANSCRIPT = """
+SELECT user_question, assistant_response, tool_used, created_at,
+       response_compressed, response_codec
+FROM chat_interactions
+WHERE session_id = %s
+ORDER BY created_at, interaction_id
+"""
+
+TRANSCRIPT_PAGE_COLUMNS = """interaction_id, user_question, assistant_response, tool_used, created_at,
+       response_compressed, response_codec"""
+
+SELECT_TRANSCRIPT_LATEST = f"""
+SELECT {TRANSCRIPT_PAGE_COLUMNS}
+FROM chat_interactions
+WHERE session_id = %s
+ORDER BY created_at DESC, interaction_id DESC
+LIMIT %s
+"""
+
+SELECT_TRANSCRIPT_BEFORE = f"""
+SELECT {TRANSCRIPT_PAGE_COLUMNS}
+FROM chat_interactions
+WHERE session_id = %s AND (created_at, interaction_id) < (%s, %s)
+ORDER BY created_at DESC, interaction_id DESC
+LIMIT %s
+"""
+
+SELECT_TRANSCRIPT_SINCE = f"""
+SELECT {TRANSCRIPT_PAGE_COLUMNS}
+FROM chat_interactions
+WHERE session_id = %s AND (created_at, interaction_id) >= (%s, %s)
+ORDER BY created_at, interaction_id
+"""
+
+SELECT_USER_INTERACTIONS = """
+SELECT i.session_id, i.interaction_id, i.user_question, i.assistant_response, i.tool_used, i.created_at,
+       i.response_compressed, i.response_codec
+FROM chat_interactions i
+JOIN chat_sessions s ON s.session_id = i.session_id
+WHERE s.user_id = %s AND s.deleted_at IS NULL
+ORDER BY i.session_id, i.created_at, i.interaction_id
+"""
+
+# Ranks on the GIN index first, then builds headlines only for the returned rows.
+# Parameters: headline options (twice), query, user_id, limit
+SEARCH_INTERACTIONS = """
+SELECT m.interaction_id, m.session_id, m.title, m.created_at, m.rank,
+       ts_headline('english', m.user_question, m.query, %s),
+       ts_headline('english', m.assistant_response, m.query, %s)
+FROM (
+    SELECT i.interaction_id, i.session_id, s.title, i.created_at,
+           i.user_question, i.assistant_response, q.query,
+           ts_rank_cd(i.search_vector, q.query) AS rank
+    FROM chat_interactions i
+    JOIN chat_sessions s ON s.session_id = i.session_id
+    CROSS JOIN websearch_to_tsquery('english', %s) AS q(query)
+    WHERE s.user_id = %s AND s.deleted_at IS NULL AND i.search_vector @@ q.query
+    ORDER BY rank DESC, i.created_at DESC
+    LIMIT %s
+) m
+ORDER BY m.rank DESC, m.created_at DESC
+"""
+
+# Responses of image turns in live sessions; the image path is part of the response text
+SELECT_IMAGE_RESPONSES = """
+SELECT i.assistant_response, i.response_compressed, i.response_codec
+FROM chat_interactions i
+JOIN chat_sessions s ON s.session_id = i.session_id
+WHERE i.tool_used = 'generate_image' AND s.deleted_at IS NULL
+"""
+
+INSERT_INTERACTION = """
+INSERT INTO chat_interactions (session_id, user_question, assistant_response, tool_used, created_at)
+VALUES (%s, %s, %s, %s, %s)
+"""
+
+# Multi-row form for psycopg2.extras.execute_values
+INSERT_INTERACTIONS_VALUES = """
+INSERT INTO chat_interactions (session_id, user_question, assistant_response, tool_used, created_at)
+VALUES %s
+"""
+
+# Parameters: added, first_question, last_activity, session_id
+UPDATE_SESSION_SUMMARY = """
+UPDATE chat_sessions
+SET message_count = message_count + %s,
+    title = COALESCE(title, LEFT(%s, 100)),
+    last_activity_at = GREATEST(last_activity_at, %s::timestamp)
+WHERE session_id = %s
+"""
+
+# Multi-row form for psycopg2.extras.execute_values; rows are
+# (session_id, added, first_question, last_activity). Returns the owners, whose
+# cached session lists are now out of order
+UPDATE_SESSION_SUMMARIES_VALUES = """
+UPDATE chat_sessions s
+SET message_count = s.message_count + v.added,
+    last_activity_at = GREATEST(s.last_activity_at, v.last_activity::timestamp),
+    title = COALESCE(s.title, LEFT(v.first_question, 100))
+FROM (VALUES %s) AS v (session_id, added, first_question, last_activity)
+WHERE s.session_id = v.session_id
+RETURNING s.user_id
+"""
+
+
+def summarize_sessions(rows):
+    """
+    Aggregate new interactions per session for the session summary update.
+
+    Args:
+        rows (iterable): (session_id, user_question, created_at) tuples in insert order
+
+    Returns:
+        dict: session_id -> (added, first_question, last_activity)
+    """
+    sessions = {}
+    for session_id, question, created in rows:
+        count, first_question, last_activity = sessions.get(session_id, (0, question, created))
+        sessions[session_id] = (count + 1, first_question, max(last_activity, created))
+    return sessions
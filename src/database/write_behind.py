@@ -0,0 +1,266 @@
+"""
+Write-behind queue for chat interactions.
+
+save_chat_interaction() only appends the interaction to a local SQLite file
+and returns. A background thread drains that file into PostgreSQL in batches
+(one multi-row INSERT plus one session-summary UPDATE per batch) and deletes
+rows only after the PostgreSQL transaction committed. If PostgreSQL is down
+the batch is retried with exponential backoff; queued rows survive app
+restarts because they are already on disk. Rows PostgreSQL rejects outright
+(e.g. their session was deleted) are moved to a dead-letter table instead of
+blocking the queue.
+
+Environment:
+    WRITE_BEHIND_PATH: SQLite file of the queue (default: src/data/pending_interactions.sqlite3)
+    WRITE_BEHIND_BATCH_SIZE: Maximum rows per INSERT (default: 200)
+    WRITE_BEHIND_FLUSH_INTERVAL: Seconds between flushes when idle (default: 0.5)
+    WRITE_BEHIND_MAX_BACKOFF: Longest wait between retries in seconds (default: 30)
+
+The queue file belongs to one app process; run separate processes with
+separate WRITE_BEHIND_PATH values.
+"""
+
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from src.database import queries
+from src.database.cache import invalidate, session_tag, user_tag
+from src.database.pool import get_connection
+from src.utils.log_utils import get_logger
+from src.utils.metrics import counter, gauge, histogram
+
+DEFAULT_QUEUE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "pending_interactions.sqlite3"
+)
+WRITE_BEHIND_PATH = os.getenv("WRITE_BEHIND_PATH", DEFAULT_QUEUE_PATH)
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "200"))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "0.5"))
+WRITE_BEHIND_MAX_BACKOFF = float(os.getenv("WRITE_BEHIND_MAX_BACKOFF", "30"))
+
+QUEUE_DEPTH = gauge("lightgpt_write_behind_pending", "Chat interactions waiting to be written to PostgreSQL")
+BATCH_SIZE = histogram(
+    "lightgpt_write_behind_batch_rows",
+    "Rows written per write-behind batch",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 200, 500),
+)
+FLUSH_LATENCY = histogram("lightgpt_write_behind_flush_seconds", "Time to write one batch to PostgreSQL")
+FLUSH_FAILURES = counter("lightgpt_write_behind_failures_total", "Write-behind batches that failed and will be retried")
+DEAD_LETTERS = counter("lightgpt_write_behind_dead_letters_total", "Interactions PostgreSQL rejected permanently")
+
+logger = get_logger("db")
+
+_COLUMNS = "id, session_id, user_question, assistant_response, tool_used, created_at"
+
+
+class WriteBehindQueue:
+    """
+    Durable local queue drained into chat_interactions by a background thread.
+
+    Args:
+        path (str): SQLite file holding the queued rows
+        batch_size (int): Maximum rows written per transaction
+        flush_interval (float): Seconds to wait for more rows before flushing
+    """
+
+    def __init__(self, path=WRITE_BEHIND_PATH, batch_size=WRITE_BEHIND_BATCH_SIZE,
+                 flush_interval=WRITE_BEHIND_FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.execute("""
+        CREATE TABLE IF NOT EXISTS pending (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            user_question TEXT NOT NULL,
+            assistant_response TEXT NOT NULL,
+            tool_used TEXT,
+            created_at TEXT NOT NULL
+        )
+        """)
+        self._db.execute("""
+        CREATE TABLE IF NOT EXISTS dead_letters (
+            id INTEGER PRIMARY KEY,
+            session_id TEXT NOT NULL,
+            user_question TEXT NOT NULL,
+            assistant_response TEXT NOT NULL,
+            tool_used TEXT,
+            created_at TEXT NOT NULL,
+            error TEXT,
+            failed_at TEXT NOT NULL
+        )
+        """)
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._backoff = 0.0
+        self._update_depth()
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def _update_depth(self):
+        with self._lock:
+            QUEUE_DEPTH.set(self._db.execute("SELECT COUNT(*) FROM pending").fetchone()[0])
+
+    def enqueue(self, session_id, user_question, assistant_response, tool_used):
+        """Persist an interaction locally; it reaches PostgreSQL on the next flush."""
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO pending (session_id, user_question, assistant_response, tool_used, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (session_id, user_question, assistant_response, tool_used, datetime.now().isoformat())
+            )
+        QUEUE_DEPTH.inc()
+        self._wakeup.set()
+
+    def pending_for_session(self, session_id):
+        """
+        Queued interactions of a session that are not in PostgreSQL yet.
+
+        Returns:
+            list: (None, user_question, assistant_response, tool_used, created_at)
+            rows, oldest first, shaped like the transcript rows in db.py
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT user_question, assistant_response, tool_used, created_at "
+                "FROM pending WHERE session_id = ? ORDER BY id",
+                (session_id,)
+            ).fetchall()
+        return [(None, q, a, tool, datetime.fromisoformat(created)) for q, a, tool, created in rows]
+
+    def discard_session(self, session_id):
+        """Drop queued interactions of a deleted session so they are never written."""
+        with self._lock:
+            removed = self._db.execute("DELETE FROM pending WHERE session_id = ?", (session_id,)).rowcount
+        QUEUE_DEPTH.dec(removed)
+        return removed
+
+    def _next_batch(self):
+        with self._lock:
+            return self._db.execute(
+                f"SELECT {_COLUMNS} FROM pending ORDER BY id LIMIT ?", (self.batch_size,)
+            ).fetchall()
+
+    def _delete(self, ids):
+        with self._lock:
+            self._db.executemany("DELETE FROM pending WHERE id = ?", [(i,) for i in ids])
+        QUEUE_DEPTH.dec(len(ids))
+
+    def _dead_letter(self, row, error):
+        logger.error(f"Dropping chat interaction {row[0]} for session {row[1]}: {error}")
+        DEAD_LETTERS.inc()
+        with self._lock:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO dead_letters ({_COLUMNS}, error, failed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (*row, str(error), datetime.now().isoformat())
+            )
+        self._delete([row[0]])
+
+    @staticmethod
+    def _write(cur, rows):
+        """Insert the rows and update their sessions' summaries; returns the sessions' owners."""
+        execute_values(
+            cur,
+            queries.INSERT_INTERACTIONS_VALUES,
+            [(session_id, q, a, tool, created) for _, session_id, q, a, tool, created in rows],
+        )
+        sessions = queries.summarize_sessions((session_id, q, created) for _, session_id, q, _, _, created in rows)
+        owners = execute_values(
+            cur,
+            queries.UPDATE_SESSION_SUMMARIES_VALUES,
+            [(session_id, *values) for session_id, values in sessions.items()],
+            fetch=True,
+        )
+        return {row[0] for row in owners}
+
+    def flush_once(self):
+        """
+        Write one batch to PostgreSQL.
+
+        Returns:
+            int: Rows written or dead-lettered, 0 if the queue was empty
+
+        Raises:
+            psycopg2.Error: If PostgreSQL is unavailable; the rows stay queued
+        """
+        rows = self._next_batch()
+        if not rows:
+            return 0
+        start = time.perf_counter()
+        try:
+            with get_connection() as conn, conn.cursor() as cur:
+                owners = self._write(cur, rows)
+                conn.commit()
+        except (psycopg2.IntegrityError, psycopg2.DataError):
+            # One bad row fails the whole batch; retry row by row to isolate it
+            for row in rows:
+                try:
+                    with get_connection() as conn, conn.cursor() as cur:
+                        owners = self._write(cur, [row])
+                        conn.commit()
+                except (psycopg2.IntegrityError, psycopg2.DataError) as e:
+                    self._dead_letter(row, e)
+                    continue
+                self._delete([row[0]])
+                invalidate(session_tag(row[1]), *(user_tag(owner) for owner in owners))
+            return len(rows)
+        FLUSH_LATENCY.observe(time.perf_counter() - start)
+        BATCH_SIZE.observe(len(rows))
+        self._delete([row[0] for row in rows])
+        # Cached transcripts and session lists (the sessions moved to the top) no longer match the database
+        invalidate(*{session_tag(row[1]) for row in rows}, *(user_tag(owner) for owner in owners))
+        return len(rows)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            if self._backoff:
+                # Waiting out a failure; new rows should not shorten the backoff
+                self._stopping.wait(self._backoff)
+            else:
+                self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                while self.flush_once() == self.batch_size:
+                    pass
+                self._backoff = 0.0
+            except psycopg2.Error as e:
+                FLUSH_FAILURES.inc()
+                self._backoff = min(WRITE_BEHIND_MAX_BACKOFF, max(1.0, self._backoff * 2))
+                logger.warning(f"Write-behind flush failed, retrying in {self._backoff:.0f}s: {str(e)}")
+
+    def close(self, timeout=10.0):
+        """Stop the background thread and try to drain the queue before exit."""
+        self._stopping.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+        deadline = time.monotonic() + timeout
+        try:
+            while time.monotonic() < deadline and self.flush_once():
+                pass
+        except psycopg2.Error as e:
+            logger.warning(f"Could not drain write-behind queue at shutdown, rows stay queued: {str(e)}")
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_write_behind_queue():
+    """Return the process-wide queue, creating it (and draining leftovers) on first use."""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = WriteBehindQueue()
+                atexit.register(_queue.close)
+    return _queue
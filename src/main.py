@@ -1,9 +1,9 @@
 import streamlit as st
-import asyncio
+import html
 import os
 import time
 from datetime import datetime
-from langchain.memory import ConversationBufferMemory
+from src.utils.memory import ConversationMemory
 
 import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -17,30 +17,61 @@ from src.database.db import (
     create_chat_session,
     get_chat_sessions,
     get_chat_interactions,
+    get_chat_interactions_page,
+    get_chat_interactions_since,
+    search_chat_history,
+    HIGHLIGHT_START,
+    HIGHLIGHT_STOP,
     delete_chat_session,
+    delete_chat_sessions,
     save_chat_interaction,
-    get_latest_session
+    get_latest_session,
+    get_session_owner,
+    get_image_references
 )
-from src.utils.formatting import format_tool_response
+from src.utils.formatting import format_tool_response_stream
+from src.utils.image_store import extract_image_path, get_image_store, strip_image_path
+from src.utils.response_shaping import record_shaping_time, shape_response
 from src.utils.pdf_export import export_chat_to_pdf
-from src.mcp.client import run_query, force_deep_research, generate_image_with_prompt, query_pdf
+from src.utils.file_utils import UploadRejected, store_upload
+from src.mcp.client import run_query, force_deep_research, generate_image_with_prompt, query_pdf, close_shared_sessions
+from src.database.async_db import close_async_repository
+from src.utils.event_loop import get_background_loop
+from src.utils.metrics import histogram, start_http_server
+from src.utils.tracing import set_service_name, start_span, get_trace
+from src.utils.log_utils import configure_logging, request_context
 
 from src.utils.ui_utils import (
     display_message,
+    display_chat_message,
     display_message_streaming,
+    display_message_stream,
+    display_trace_waterfall,
     format_timestamp,
-    extract_image_path,
     get_session_preview,
+    format_search_snippet,
+    scroll_to_anchor,
     load_css,
     get_user_display_name
 )
 from src.utils.session_utils import (
     load_chat_history,
+    load_older_messages,
+    get_visible_messages,
+    show_earlier_messages,
+    chat_message,
+    RENDER_WINDOW_MESSAGES,
+    open_chat_at,
+    get_full_transcript,
     init_session_state,
     load_user_from_cookies,
     clear_session,
     get_user_email,
-    load_most_recent_session
+    load_most_recent_session,
+    get_session_list,
+    load_more_sessions,
+    reset_session_list,
+    start_new_chat
 )
 
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -52,17 +83,51 @@ load_dotenv()
 import warnings
 warnings.filterwarnings("ignore")
 
-import logging
-logging.basicConfig(
-    filename='../src/logs/mcp_interactions.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+configure_logging("streamlit_app")
   
 SERVER_URL = os.getenv("SERVER_URL")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 MODEL_NAME = os.getenv("MODEL_NAME", "llama3-70b-8192")
+METRICS_PORT = os.getenv("METRICS_PORT")
+TRACE_DEBUG_PANEL = os.getenv("TRACE_DEBUG_PANEL", "true").lower() == "true"
+OAUTH_TIMEOUT = float(os.getenv("OAUTH_TIMEOUT", "30"))
+
+set_service_name("streamlit-app")
+
+# Streamlit has no route of its own for /metrics, so serve the registry on a side port
+if METRICS_PORT:
+    start_http_server(int(METRICS_PORT))
+
+MESSAGE_LATENCY = histogram(
+    "lightgpt_app_message_seconds",
+    "Time from a chat message being sent to its answer being stored",
+    ("tool", "arm", "shaping"),
+)
+
+@st.cache_resource(show_spinner=False)
+def ensure_database_schema():
+    """Run pending migrations once per process instead of on every rerun."""
+    return init_database()
+
+# A failed attempt is not cached, so the next rerun tries again
+if not ensure_database_schema():
+    ensure_database_schema.clear()
+
+@st.cache_resource(show_spinner=False)
+def get_event_loop():
+    """
+    Start the background event loop once per process. Connections opened on it
+    (the shared MCP session, async database pool) stay warm across reruns and users.
+    """
+    loop = get_background_loop()
+    loop.on_shutdown(close_shared_sessions)
+    loop.on_shutdown(close_async_repository)
+    return loop
+
+event_loop = get_event_loop()
+
+# Reference counts come from stored chats, so images they show are not evicted
+get_image_store(get_image_references)
 
 init_session_state()
 
@@ -81,15 +146,16 @@ def main():
     code = st.query_params.get("code")
     if code and st.session_state["user"] is None:
         st.write("🔄 Logging in...")
-        token_data = asyncio.run(get_access_token(code))
+        token_data = event_loop.run(get_access_token(code), timeout=OAUTH_TIMEOUT)
         access_token = token_data["access_token"]
-        user_info = asyncio.run(get_user_info(access_token))
+        user_info = event_loop.run(get_user_info(access_token), timeout=OAUTH_TIMEOUT)
         st.session_state["user"] = user_info
         
         st.session_state.session_id = None
+        st.session_state.loaded_session_id = None
         st.session_state.messages = []
-        st.session_state.memory = ConversationBufferMemory(return_messages=True)
-        st.session_state.image_paths = []
+        st.session_state.memory = ConversationMemory()
+        st.session_state.render_window = RENDER_WINDOW_MESSAGES
                # Save user to cookies
         cookie_manager.save_user_session(user_info)
         
@@ -105,27 +171,35 @@ def main():
     if not load_css(css_path):
         st.error(f"CSS file not found at: {css_path}")
     
-    init_database()
-    
     st.title("MCP Assistant")
-    # Load chat history if we have an active session
-    if st.session_state.session_id:
-        load_chat_history(st.session_state.session_id, get_chat_interactions, cookie_manager)
+    # Load chat history when the active session changed since the last rerun
+    if st.session_state.session_id and st.session_state.session_id != st.session_state.loaded_session_id:
+        if not load_chat_history(st.session_state.session_id, get_chat_interactions_page, cookie_manager,
+                                 get_session_owner):
+            # Deleted since the login token was issued; open the latest session instead
+            if load_most_recent_session(get_user_email(), get_latest_session):
+                load_chat_history(st.session_state.session_id, get_chat_interactions_page, cookie_manager)
     
     chat_container = st.container()
     with chat_container:
-        for i, message in enumerate(st.session_state.messages):
+        hidden, visible_messages = get_visible_messages()
+        if hidden:
+            if st.button(f"⬆️ Show earlier messages ({hidden} hidden)", key="show_earlier_messages"):
+                show_earlier_messages()
+                st.rerun()
+        elif st.session_state.history_cursor is not None:
+            if st.button("⬆️ Load older messages", key="load_older_messages"):
+                load_older_messages(get_chat_interactions_page)
+                st.rerun()
+        jump_to = st.session_state.jump_to_interaction
+        for message in visible_messages:
             is_user = message['role'] == 'user'
-            if not is_user and "Tool used: generate_image" in message['content'] and i > 0:
-                image_index = sum(1 for m in st.session_state.messages[:i] 
-                                if m['role'] == 'assistant' and "Tool used: generate_image" in m['content'])
-                if image_index < len(st.session_state.image_paths):
-                    display_message(message['content'], is_user, st.session_state.image_paths[image_index])
-                    
-                else:
-                    display_message(message['content'], is_user)
-            else:
-                display_message(message['content'], is_user)
+            anchor_id = f"turn-{jump_to}" if is_user and jump_to and message.get('interaction_id') == jump_to else None
+            display_chat_message(message, anchor_id=anchor_id)
+        if jump_to:
+            # Scroll once; later reruns keep the reader's position
+            scroll_to_anchor(f"turn-{jump_to}")
+            st.session_state.jump_to_interaction = None
     
     server_url = SERVER_URL
     with st.sidebar:
@@ -139,7 +213,7 @@ def main():
                 st.rerun()
         else:
             if st.button("🔐 Login with Google"):
-                auth_url = asyncio.run(get_authorization_url())
+                auth_url = event_loop.run(get_authorization_url(), timeout=OAUTH_TIMEOUT)
                 st.markdown(
                     f"""<meta http-equiv="refresh" content="0; url={auth_url}" />""",
                     unsafe_allow_html=True
@@ -148,16 +222,9 @@ def main():
         st.header("Chat Sessions")       
         if st.button("➕ New Chat"):
             if st.session_state["user"]:
-                user_email = get_user_email()
                 try:
-                    st.session_state.session_id = create_chat_session(user_email)
-                    # Reset chat state
-                    st.session_state.messages = []
-                    st.session_state.memory = ConversationBufferMemory(return_messages=True)
-                    st.session_state.image_paths = []
-                    
-                    # Update cookie with new session ID
-                    cookie_manager.save_user_session(st.session_state["user"], st.session_state.session_id)
+                    start_new_chat(create_chat_session, cookie_manager)
+                    reset_session_list()
                     
                     st.success("Created new chat session!")
                     st.rerun()
@@ -169,30 +236,38 @@ def main():
         st.divider()
         st.subheader("Chat History")
         chat_sessions = []
+        has_more_sessions = False
         
         if st.session_state["user"]:
             user_email = get_user_email()
-            chat_sessions = get_chat_sessions(user_email)
+            search_query = st.text_input("🔎 Search chats", key="chat_search_query",
+                                         placeholder="Search your chat history")
+            if search_query:
+                results = search_chat_history(user_email, search_query)
+                if not results:
+                    st.caption("No matching messages.")
+                for interaction_id, result_session_id, title, created_at, rank, question_snippet, answer_snippet in results:
+                    st.markdown(
+                        f"<small>{html.escape(get_session_preview(title))} · {format_timestamp(created_at)}</small><br>"
+                        f"{format_search_snippet(question_snippet, HIGHLIGHT_START, HIGHLIGHT_STOP)}<br>"
+                        f"<small>{format_search_snippet(answer_snippet, HIGHLIGHT_START, HIGHLIGHT_STOP)}</small>",
+                        unsafe_allow_html=True
+                    )
+                    if st.button("Open", key=f"search_result_{interaction_id}"):
+                        open_chat_at(result_session_id, created_at, interaction_id,
+                                     get_chat_interactions_since, cookie_manager)
+                        st.rerun()
+                st.divider()
+            session_list = get_session_list(user_email, get_chat_sessions)
+            chat_sessions = session_list["rows"]
+            has_more_sessions = session_list["cursor"] is not None
         else:
             st.warning("Please log in to view your chat history.")
         
-        if 'delete_session_id' not in st.session_state:
-            st.session_state.delete_session_id = None
-            
-        if st.session_state.delete_session_id:
-            session_to_delete = st.session_state.delete_session_id
-            if delete_chat_session(session_to_delete):
-                st.success(f"Chat deleted successfully!")
-                st.session_state.delete_session_id = None
-                st.rerun()
-            else:
-                st.error("Failed to delete chat. Please try again.")
-                st.session_state.delete_session_id = None
-        
         with st.container():
-            for session_id, created_at in chat_sessions:
-                formatted_time = format_timestamp(created_at)
-                preview = get_session_preview(session_id, get_chat_interactions)
+            for session_id, title, created_at, last_activity_at, message_count in chat_sessions:
+                formatted_time = format_timestamp(last_activity_at)
+                preview = get_session_preview(title)
                 is_active = session_id == st.session_state.session_id
                 
                 with st.container():
@@ -204,30 +279,47 @@ def main():
                         else:
                             session_button_label = f"{preview}\n{formatted_time}"
                             if st.button(session_button_label, key=f"session_{session_id}", use_container_width=True):
-                                load_chat_history(session_id, get_chat_interactions, cookie_manager)
+                                load_chat_history(session_id, get_chat_interactions_page, cookie_manager)
                                 st.rerun()
                     with col2:
                         if is_active:
                             st.markdown("<div style='height: 38px; display: flex; align-items: center;'>", unsafe_allow_html=True)
                             if st.button("🗑️", key=f"delete_active_{session_id}", help="Delete this chat"):
-                                if st.session_state["user"]:
-                                    user_email = get_user_email()
-                                    new_session_id = create_chat_session(user_email)
-                                else:
-                                    new_session_id = None
-                                    
-                                if new_session_id:
-                                    st.session_state.session_id = new_session_id
-                                    st.session_state.messages = []
-                                    st.session_state.memory = ConversationBufferMemory(return_messages=True)
-                                    st.session_state.image_paths = []
-                                    st.session_state.delete_session_id = session_id
+                                if delete_chat_session(session_id):
+                                    start_new_chat(create_chat_session, cookie_manager)
+                                    reset_session_list()
                                     st.rerun()
+                                else:
+                                    st.error("Failed to delete chat. Please try again.")
                             st.markdown("</div>", unsafe_allow_html=True)
                         else:
                             if st.button("🗑️", key=f"delete_{session_id}", help="Delete this chat"):
-                                st.session_state.delete_session_id = session_id
-                                st.rerun()
+                                if delete_chat_session(session_id):
+                                    reset_session_list()
+                                    st.rerun()
+                                else:
+                                    st.error("Failed to delete chat. Please try again.")
+            
+            if has_more_sessions and st.button("Load more", key="load_more_sessions", use_container_width=True):
+                load_more_sessions(get_chat_sessions)
+                st.rerun()
+        
+        if st.session_state["user"] and chat_sessions:
+            with st.expander("🧹 Clean up history"):
+                older_than_days = st.number_input(
+                    "Delete chats inactive for more than N days (0 deletes all)",
+                    min_value=0, value=30, step=1, key="cleanup_days"
+                )
+                confirm_cleanup = st.checkbox("I understand this cannot be undone", key="cleanup_confirm")
+                if st.button("Delete chats", key="cleanup_delete", disabled=not confirm_cleanup):
+                    deleted = delete_chat_sessions(get_user_email(), older_than_days or None)
+                    if deleted is None:
+                        st.error("Failed to delete chats. Please try again.")
+                    else:
+                        if st.session_state.session_id in deleted:
+                            start_new_chat(create_chat_session, cookie_manager)
+                        reset_session_list()
+                        st.rerun()
         
         st.divider()
         st.header("Tool Controls")
@@ -254,24 +346,35 @@ def main():
             st.subheader("Upload PDF")
             uploaded_pdf = st.file_uploader("Choose a PDF file", type=["pdf"], accept_multiple_files=False)
             if uploaded_pdf is not None:
-                static_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static")
-                uploaded_dir = os.path.join(static_dir, "uploaded_pdfs")
-                os.makedirs(uploaded_dir, exist_ok=True)
-                pdf_path = os.path.join(uploaded_dir, uploaded_pdf.name)
-                with open(pdf_path, "wb") as f:
-                    f.write(uploaded_pdf.read())
-                st.session_state.pdf_path = pdf_path
-                st.success("PDF uploaded successfully!")
+                # Reruns keep the same upload; only a new file is hashed and stored
+                upload_id = getattr(uploaded_pdf, "file_id", None) or (uploaded_pdf.name, uploaded_pdf.size)
+                if st.session_state.pdf_upload_id != upload_id:
+                    try:
+                        st.session_state.pdf_path, _ = store_upload(
+                            uploaded_pdf, get_user_email(), declared_size=uploaded_pdf.size
+                        )
+                        st.session_state.pdf_upload_id = upload_id
+                    except UploadRejected as e:
+                        st.session_state.pdf_path = None
+                        st.session_state.pdf_upload_id = None
+                        st.error(str(e))
+                if st.session_state.pdf_path:
+                    st.success("PDF uploaded successfully!")
             else:
                 st.session_state.pdf_path = None
+                st.session_state.pdf_upload_id = None
                 st.warning("No PDF uploaded. Please upload a PDF to use the PDF QA tool.")
         
         if st.button(" Export Chat as PDF"):
             if st.session_state.messages:
-                for message in st.session_state.messages:
+                # The chat only holds the loaded window; export the whole session
+                messages = st.session_state.messages
+                if st.session_state.session_id:
+                    messages = get_full_transcript(st.session_state.session_id, get_chat_interactions) or messages
+                for message in messages:
                     if "timestamp" not in message:
                         message["timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                pdf_content = export_chat_to_pdf(st.session_state.messages)
+                pdf_content = export_chat_to_pdf(messages)
                 st.download_button(
                     label="Download Chat History",
                     data=pdf_content,
@@ -280,6 +383,10 @@ def main():
                 )
             else:
                 st.warning("No chat history to export.")
+        
+        if TRACE_DEBUG_PANEL and st.session_state.get("last_trace_id"):
+            with st.expander("🔍 Last message trace"):
+                display_trace_waterfall(get_trace(st.session_state.last_trace_id))
     if prompt := st.chat_input("Type your message here..."):
         if not st.session_state["user"]:
             st.error("Please login to send messages")
@@ -288,45 +395,79 @@ def main():
         if not st.session_state.session_id:
             user_email = get_user_email()
             st.session_state.session_id = create_chat_session(user_email)
+            st.session_state.loaded_session_id = st.session_state.session_id
+            reset_session_list()
             
             cookie_manager.save_user_session(st.session_state["user"], st.session_state.session_id)
             
-        st.session_state.messages.append({'role': 'user', 'content': prompt})
+        st.session_state.messages.append(chat_message('user', prompt))
         user_question = prompt
         with chat_container:
             display_message(prompt, is_user=True)
-        with st.spinner("Processing your query..."):
-            if selected_tool == "Deep Research":
-                result, tool_used = asyncio.run(force_deep_research(prompt, research_depth))
-            elif selected_tool == "Image Generation":
-                result, tool_used = asyncio.run(generate_image_with_prompt(prompt))
-            elif selected_tool == "PDF QA" and st.session_state.pdf_path:
-                result, tool_used = asyncio.run(query_pdf(prompt, st.session_state.pdf_path))
-            else:
-                result, tool_used = asyncio.run(run_query(server_url, prompt, st.session_state.pdf_path))
+        with st.spinner("Processing your query..."), request_context(), start_span("chat_message", tool_mode=selected_tool) as message_span:
+            st.session_state.last_trace_id = message_span.trace_id
+            message_start = time.perf_counter()
+            try:
+                if selected_tool == "Deep Research":
+                    result, tool_used = event_loop.run(force_deep_research(prompt, research_depth))
+                elif selected_tool == "Image Generation":
+                    result, tool_used = event_loop.run(generate_image_with_prompt(prompt))
+                elif selected_tool == "PDF QA" and st.session_state.pdf_path:
+                    result, tool_used = event_loop.run(query_pdf(prompt, st.session_state.pdf_path))
+                else:
+                    result, tool_used = event_loop.run(run_query(server_url, prompt, st.session_state.pdf_path))
+            except TimeoutError:
+                result, tool_used = "The request took too long and was cancelled. Please try again.", None
             
-            formatted_result = result if tool_used in ["deep_research", "generate_code"] else format_tool_response(prompt, result, st.session_state.memory)
+            message_span.set_tag("tool", tool_used)
+            # Tools already answer in markdown; only output that still looks raw is reformatted
+            shaping = shape_response(tool_used, result)
+            message_span.set_tag("formatted", shaping.reformat)
+            message_span.set_tag("shaping_reason", shaping.reason)
+            render_stats = None
+            shaping_start = time.perf_counter()
+            if shaping.reformat:
+                # The formatted answer is shown while the model writes it
+                with chat_container, start_span("render_reply", streamed=True) as render_span:
+                    render_stats = display_message_stream(
+                        format_tool_response_stream(prompt, result, st.session_state.memory),
+                        prefix=f"Tool used: {tool_used}"
+                    )
+                    render_span.set_tag("deltas", render_stats["deltas"])
+                    render_span.set_tag("chars", render_stats["chars"])
+                formatted_result = render_stats["text"]
+            else:
+                formatted_result = result
+            record_shaping_time(tool_used, shaping, time.perf_counter() - shaping_start)
 
-            if tool_used == "generate_image":
-                image_path = extract_image_path(result)
-                if image_path and os.path.exists(image_path):
-                    st.session_state.image_paths.append(image_path)
+            image_path = extract_image_path(result) if tool_used == "generate_image" else None
+            get_image_store().add_reference(image_path)
             
-            assistant_message = f"Tool used: {tool_used}\n\n{formatted_result}"
-            st.session_state.messages.append({'role': 'assistant', 'content': assistant_message})
+            assistant_message = f"Tool used: {tool_used}\n\n{strip_image_path(formatted_result)}"
+            st.session_state.messages.append(chat_message('assistant', formatted_result, tool=tool_used, image_path=image_path))
             
-            save_chat_interaction(st.session_state.session_id, user_question, formatted_result, tool_used)
-            st.session_state.memory.chat_memory.add_user_message(prompt)
-            st.session_state.memory.chat_memory.add_ai_message(formatted_result)
+            with start_span("save_chat_interaction"):
+                save_chat_interaction(st.session_state.session_id, user_question, formatted_result, tool_used,
+                                      user_email=get_user_email())
+            # The session's title, activity time and position in the sidebar changed
+            reset_session_list()
+            st.session_state.memory.add_turn(prompt, formatted_result)
+            MESSAGE_LATENCY.observe(
+                time.perf_counter() - message_start, tool=tool_used, arm=shaping.arm,
+                shaping="format" if shaping.reformat else "skip"
+            )
             
-            with chat_container:
-                # Always use streaming display for assistant responses
-                if tool_used == "generate_image" and image_path and os.path.exists(image_path):
-                    display_message_streaming(assistant_message, is_user=False, image_path=image_path, 
-                                           typing_speed=st.session_state.typing_speed)
-                else:
-                    display_message_streaming(assistant_message, is_user=False, 
-                                           typing_speed=st.session_state.typing_speed)
+            if render_stats is None:
+                with chat_container, start_span("render_reply") as render_span:
+                    # Always use streaming display for assistant responses
+                    if image_path:
+                        render_stats = display_message_streaming(assistant_message, is_user=False, image_path=image_path, 
+                                                                 typing_speed=st.session_state.typing_speed)
+                    else:
+                        render_stats = display_message_streaming(assistant_message, is_user=False, 
+                                                                 typing_speed=st.session_state.typing_speed)
+                    render_span.set_tag("deltas", render_stats["deltas"])
+                    render_span.set_tag("chars", render_stats["chars"])
 
 if __name__ == "__main__":
     main()
@@ -1,23 +1,43 @@
 import asyncio
+import contextvars
+import itertools
 import json
-import logging
 import traceback
-from mcp import ClientSession
+import weakref
+from contextlib import asynccontextmanager
+from mcp import ClientSession, types
 from mcp.client.sse import sse_client
-from groq import Groq
+from mcp.client.streamable_http import streamablehttp_client
+from mcp.shared.exceptions import McpError
 import os
+import time
 from dotenv import load_dotenv
+from src.utils.clients import get_groq_client
+from src.utils.metrics import histogram, counter, track_upstream, record_token_usage
+from src.utils.tracing import add_remote_spans, start_span
+from src.utils.log_utils import get_logger, log_payload
 
 load_dotenv()
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 MODEL_NAME = os.getenv("MODEL_NAME", "llama3-70b-8192")
+SERVER_URL = os.getenv("SERVER_URL")
 
-logging.basicConfig(
-    filename='logs/mcp_interactions.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+# "sse" keeps a GET /sse stream plus POSTs to /messages/ open for every call;
+# "streamable-http" sends each request as one POST to the server's /mcp/ endpoint.
+MCP_TRANSPORT = os.getenv("MCP_TRANSPORT", "sse")
+MCP_HTTP_URL = os.getenv("MCP_HTTP_URL") or (SERVER_URL or "").rsplit("/sse", 1)[0] + "/mcp/"
+MCP_STREAM_URL = os.getenv("MCP_STREAM_URL") or (SERVER_URL or "").rsplit("/sse", 1)[0] + "/mcp-stream/"
+# Shared client sessions kept open by the app; spread over the workers when MCP_WORKERS > 1
+MCP_CLIENT_SESSIONS = int(os.getenv("MCP_CLIENT_SESSIONS") or os.getenv("MCP_WORKERS") or "1")
+
+ROUTING_LATENCY = histogram("lightgpt_client_routing_seconds", "Time the routing LLM takes to pick a tool")
+ROUTING_ERRORS = counter("lightgpt_client_routing_errors_total", "Queries whose tool routing failed")
+CLIENT_TOOL_LATENCY = histogram("lightgpt_client_tool_call_seconds", "Tool call latency seen by the client", ("tool",))
+MCP_SESSIONS_OPENED = counter("lightgpt_client_mcp_sessions_opened_total", "Shared MCP client sessions opened")
+
+# Tools that run long enough to be worth a streamed response under streamable HTTP
+STREAMING_TOOLS = {"deep_research", "pdf_qa", "generate_image"}
+
+logger = get_logger("client")
 
 def get_prompt_to_identify_tool_and_arguments(query, tools, pdf_path=None):
     tools_description = "\n".join([f"- {tool.name}, {tool.description}, {tool.inputSchema} " for tool in tools])
@@ -50,71 +70,267 @@ IMPORTANT GUIDELINES:
         "}\n\n"
     )
 
+@asynccontextmanager
+async def open_session(server_url=None, streaming=False, transport=None):
+    """
+    Open an initialized MCP client session over the configured transport.
+
+    Args:
+        server_url (str, optional): SSE endpoint, defaults to SERVER_URL
+        streaming (bool): Use the streamed endpoint under streamable HTTP
+        transport (str, optional): "sse" or "streamable-http", defaults to MCP_TRANSPORT
+
+    Yields:
+        ClientSession: The initialized session
+    """
+    transport = transport or MCP_TRANSPORT
+    if transport == "streamable-http":
+        url = MCP_STREAM_URL if streaming else MCP_HTTP_URL
+        async with streamablehttp_client(url) as (read_stream, write_stream, _):
+            async with ClientSession(read_stream, write_stream) as session:
+                await session.initialize()
+                yield session
+    else:
+        async with sse_client(server_url or SERVER_URL) as streams:
+            async with ClientSession(streams[0], streams[1]) as session:
+                await session.initialize()
+                yield session
+
+async def call_tool(name, arguments, session=None, transport=None):
+    """
+    Call a tool, moving long-running tools onto a streamed session when needed.
+    The active trace context is sent along in the request's _meta.traceparent,
+    and the server spans returned in the result's _meta.spans join the trace.
+
+    Args:
+        name (str): Tool name
+        arguments (dict): Tool arguments
+        session (ClientSession, optional): An already open session to reuse
+        transport (str, optional): Transport override for new sessions
+
+    Returns:
+        CallToolResult: The tool result
+    """
+    transport = transport or MCP_TRANSPORT
+    needs_stream = transport == "streamable-http" and name in STREAMING_TOOLS
+    with CLIENT_TOOL_LATENCY.time(tool=name), start_span("mcp.call_tool", kind="CLIENT", tool=name) as span:
+        request = types.ClientRequest(
+            types.CallToolRequest(
+                method="tools/call",
+                params=types.CallToolRequestParams(
+                    name=name,
+                    arguments=arguments,
+                    _meta=types.RequestParams.Meta(traceparent=span.traceparent),
+                ),
+            )
+        )
+        if session is not None and not needs_stream:
+            result = await session.send_request(request, types.CallToolResult)
+        else:
+            async with open_session(streaming=needs_stream, transport=transport) as new_session:
+                result = await new_session.send_request(request, types.CallToolResult)
+    add_remote_spans((result.meta or {}).get("spans"))
+    return result
+
+class SharedSession:
+    """
+    An MCP client session kept open on an event loop and reused by every call.
+
+    Opening a session costs an SSE connection plus the initialize handshake,
+    and tools/list is another round trip; with the app's background event loop
+    both are paid once instead of for every message. The session lives in its
+    own task because the transport's context managers must be exited by the
+    task that entered them. After a connection error the session is
+    discarded and the next call opens a new one.
+
+    Args:
+        server_url (str, optional): SSE endpoint, defaults to SERVER_URL
+    """
+
+    def __init__(self, server_url=None):
+        self.server_url = server_url
+        self.in_flight = 0
+        self._session = None
+        self._tools = None
+        self._task = None
+        self._closed = None
+        self._lock = asyncio.Lock()
+
+    async def _hold(self, ready, closed):
+        session = None
+        try:
+            async with open_session(self.server_url) as session:
+                MCP_SESSIONS_OPENED.inc()
+                self._session = session
+                ready.set()
+                await closed.wait()
+        finally:
+            # A discarded session may close after its replacement opened; leave that one alone
+            if session is not None and self._session is session:
+                self._session = None
+                self._tools = None
+            # Wakes get() if the session could not be opened
+            ready.set()
+
+    async def get(self):
+        """Return the open session, opening it if needed."""
+        async with self._lock:
+            if self._session is None:
+                ready = asyncio.Event()
+                self._closed = asyncio.Event()
+                # A fresh context, so the long-lived task does not keep the first caller's trace span
+                self._task = contextvars.Context().run(asyncio.ensure_future, self._hold(ready, self._closed))
+                await ready.wait()
+                if self._task.done():
+                    # Raises the connection error
+                    await self._task
+                    raise ConnectionError("MCP session closed while opening")
+            return self._session
+
+    async def list_tools(self):
+        """Return the server's tools, listed once per session."""
+        self.in_flight += 1
+        session = None
+        try:
+            session = await self.get()
+            if self._tools is None:
+                tools = (await session.list_tools()).tools
+                if self._session is session:
+                    self._tools = tools
+                return tools
+            return self._tools
+        except McpError:
+            raise
+        except Exception:
+            if session is not None:
+                self.discard(session)
+            raise
+        finally:
+            self.in_flight -= 1
+
+    async def call_tool(self, name, arguments):
+        """Call a tool on the shared session, discarding the session if the connection failed."""
+        self.in_flight += 1
+        try:
+            session = await self.get()
+            try:
+                return await call_tool(name, arguments, session=session)
+            except McpError:
+                # The tool failed, the session is fine
+                raise
+            except Exception:
+                self.discard(session)
+                raise
+        finally:
+            self.in_flight -= 1
+
+    def discard(self, session=None):
+        """
+        Close the session; the next call opens a new one.
+
+        Args:
+            session (ClientSession, optional): Only close if this is still the
+                open session, so a late failure does not close its replacement
+        """
+        if session is not None and session is not self._session:
+            return
+        if self._closed is not None:
+            self._closed.set()
+        self._session = None
+        self._tools = None
+
+    async def close(self):
+        self.discard()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+
+# A few shared sessions per event loop and server URL; with MCP_WORKERS > 1 the
+# router pins each SSE session to one worker, so one session would use only one
+_shared_sessions = weakref.WeakKeyDictionary()
+_rotation = itertools.count()
+
+def get_shared_session(server_url=None):
+    """Return the least busy shared MCP session of the running event loop for ``server_url``."""
+    sessions = _shared_sessions.setdefault(asyncio.get_running_loop(), {})
+    key = server_url or SERVER_URL
+    if key not in sessions:
+        sessions[key] = [SharedSession(key) for _ in range(max(1, MCP_CLIENT_SESSIONS))]
+    pool = sessions[key]
+    start = next(_rotation) % len(pool)
+    return min(pool[start:] + pool[:start], key=lambda shared: shared.in_flight)
+
+async def close_shared_sessions():
+    """Close the shared MCP sessions of the running event loop."""
+    for pool in _shared_sessions.pop(asyncio.get_running_loop(), {}).values():
+        for shared in pool:
+            await shared.close()
+
 def llm_client(message: str):
-    groq_client = Groq(api_key=GROQ_API_KEY)
-    response = groq_client.chat.completions.create(
-        model=MODEL_NAME,
-        messages=[{"role": "system", "content": "You are an intelligent assistant. You will execute tasks as prompted"},
-                  {"role": "user", "content": message}],
-        max_tokens=250,
-        temperature=0.2
-    )
+    groq_client = get_groq_client()
+    with track_upstream("groq", "route"):
+        response = groq_client.chat.completions.create(
+            model=MODEL_NAME,
+            messages=[{"role": "system", "content": "You are an intelligent assistant. You will execute tasks as prompted"},
+                      {"role": "user", "content": message}],
+            max_tokens=250,
+            temperature=0.2
+        )
+    record_token_usage(MODEL_NAME, response)
     return response.choices[0].message.content.strip()
 
 async def run_query(server_url: str, query: str, pdf_path=None):
-    logging.info(f"User Query: {query}")
+    log_payload(logger, "User query", query)
+    shared = get_shared_session(server_url)
     try:
-        async with sse_client(server_url) as streams:
-            async with ClientSession(streams[0], streams[1]) as session:
-                await session.initialize()
-                tools = await session.list_tools()
-                
-                prompt = get_prompt_to_identify_tool_and_arguments(query, tools.tools, pdf_path)
-                llm_response = llm_client(prompt)
-                logging.info(f"LLM response received: {llm_response}")
+        tools = await shared.list_tools()
+        
+        prompt = get_prompt_to_identify_tool_and_arguments(query, tools, pdf_path)
+        routing_start = time.perf_counter()
+        try:
+            with start_span("route_query"):
+                # A blocking HTTP call; off the shared event loop so other users' calls keep running
+                llm_response = await asyncio.to_thread(llm_client, prompt)
+                log_payload(logger, "Routing LLM response", llm_response)
                 
                 tool_call = json.loads(llm_response)
-                
-                result = await session.call_tool(tool_call["tool"], arguments=tool_call["arguments"])
-                
-                if not result.content:
-                    return "No results found. Please try a different query.", tool_call["tool"]
-                
-                response_text = result.content[0].text if result.content else "No content available"
-                logging.info(f"Response from main tool : {response_text}\n")
-                
-                return response_text, tool_call["tool"]
+        except Exception:
+            ROUTING_ERRORS.inc()
+            raise
+        finally:
+            ROUTING_LATENCY.observe(time.perf_counter() - routing_start)
+        
+        result = await shared.call_tool(tool_call["tool"], tool_call["arguments"])
+        
+        if not result.content:
+            return "No results found. Please try a different query.", tool_call["tool"]
+        
+        response_text = result.content[0].text if result.content else "No content available"
+        logger.info(f"Tool {tool_call['tool']} returned {len(response_text)} chars")
+        log_payload(logger, "Tool response", response_text)
+        
+        return response_text, tool_call["tool"]
     except Exception as e:
         error_msg = f"Error processing query: {str(e)}\n{traceback.format_exc()}"
-        logging.error(error_msg)
+        logger.error(error_msg)
         return f"An error occurred. Please try again. Error: {str(e)}", None
 
 async def force_deep_research(query, research_depth):
-    async with sse_client(os.getenv("SERVER_URL")) as streams:
-        async with ClientSession(streams[0], streams[1]) as session:
-            await session.initialize()
-            result = await session.call_tool(
-                "deep_research",
-                arguments={"query": query, "depth": str(research_depth)}
-            )
-            return result.content[0].text, "deep_research"
+    result = await get_shared_session().call_tool(
+        "deep_research",
+        {"query": query, "depth": str(research_depth)}
+    )
+    return result.content[0].text, "deep_research"
 
 async def generate_image_with_prompt(query):
-    async with sse_client(os.getenv("SERVER_URL")) as streams:
-        async with ClientSession(streams[0], streams[1]) as session:
-            await session.initialize()
-            result = await session.call_tool(
-                "generate_image",
-                arguments={"prompt": query}
-            )
-            return result.content[0].text, "generate_image"
+    result = await get_shared_session().call_tool(
+        "generate_image",
+        {"prompt": query}
+    )
+    return result.content[0].text, "generate_image"
 
 async def query_pdf(query, pdf_path):
-    async with sse_client(os.getenv("SERVER_URL")) as streams:
-        async with ClientSession(streams[0], streams[1]) as session:
-            await session.initialize()
-            result = await session.call_tool(
-                "pdf_qa",
-                arguments={"query": query, "pdf_path": pdf_path}
-            )
-            return result.content[0].text, "pdf_qa"
\ No newline at end of file
+    result = await get_shared_session().call_tool(
+        "pdf_qa",
+        {"query": query, "pdf_path": pdf_path}
+    )
+    return result.content[0].text, "pdf_qa"
\ No newline at end of file
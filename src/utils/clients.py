@@ -0,0 +1,30 @@
+"""
+Shared upstream clients for the Streamlit process.
+
+A Groq client holds an HTTP connection pool; creating one per call meant a
+new TCP and TLS handshake for every routing, formatting and summary request.
+get_groq_client() returns one client per process, which is thread-safe and
+keeps its connections warm across reruns and users.
+"""
+
+import os
+import threading
+
+from dotenv import load_dotenv
+from groq import Groq
+
+load_dotenv()
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+
+_groq_client = None
+_groq_lock = threading.Lock()
+
+
+def get_groq_client():
+    """Return the process-wide Groq client, creating it on first use."""
+    global _groq_client
+    if _groq_client is None:
+        with _groq_lock:
+            if _groq_client is None:
+                _groq_client = Groq(api_key=GROQ_API_KEY)
+    return _groq_client
@@ -1,9 +1,13 @@
 from streamlit_cookies_manager import CookieManager
 import streamlit as st
-import json
 import warnings
+from src.utils.session_tokens import issue_token, revoke_token, verify_token
 warnings.filterwarnings("ignore")
 
+TOKEN_COOKIE = "session_token"
+# Unsigned cookie written by earlier versions; never trusted, only removed
+LEGACY_COOKIE = "user_session"
+
 class SessionCookieManager:
     def __init__(self):
         # Initialize cookie manager
@@ -17,36 +21,47 @@ class SessionCookieManager:
         return self.cookies
     
     def save_user_session(self, user_data, session_id=None):
-        """Save user session data to cookies"""
+        """Save a signed session token for the user (and their open chat session) to cookies"""
         cookies = self.init_cookies()
         
-        # Prepare session data
-        session_data = {
-            "user": user_data,
-            "session_id": session_id
-        }
-        
-        # Save to cookies
-        cookies["user_session"] = json.dumps(session_data)
+        cookies[TOKEN_COOKIE] = issue_token(user_data["email"], user_data.get("name"), session_id)
+        if LEGACY_COOKIE in cookies:
+            del cookies[LEGACY_COOKIE]
         cookies.save()
     
     def load_user_session(self):
-        """Load user session data from cookies"""
+        """
+        Load user session data from cookies.
+        
+        The token is verified in memory, so no database round trip is needed.
+        
+        Returns:
+            tuple: (user, session_id) where user holds the email and name, or (None, None)
+        """
         cookies = self.init_cookies()
         
-        if "user_session" in cookies:
-            try:
-                session_data = json.loads(cookies["user_session"])
-                return session_data.get("user"), session_data.get("session_id")
-            except json.JSONDecodeError:
-                return None, None
+        token = cookies.get(TOKEN_COOKIE)
+        if token:
+            claims = verify_token(token)
+            if claims:
+                user = {"email": claims["u"]}
+                if claims.get("n"):
+                    user["name"] = claims["n"]
+                return user, claims.get("s")
         
         return None, None
     
     def clear_user_session(self):
-        """Clear user session data from cookies"""
+        """Revoke the session token and clear it from cookies"""
         cookies = self.init_cookies()
         
-        if "user_session" in cookies:
-            del cookies["user_session"]
+        token = cookies.get(TOKEN_COOKIE)
+        if token:
+            revoke_token(token)
+        changed = False
+        for name in (TOKEN_COOKIE, LEGACY_COOKIE):
+            if name in cookies:
+                del cookies[name]
+                changed = True
+        if changed:
             cookies.save()
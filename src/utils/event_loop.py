@@ -0,0 +1,147 @@
+"""
+Process-wide background event loop for the Streamlit app.
+
+Streamlit runs each script rerun on a plain thread, and main.py used to call
+asyncio.run() for every tool call and OAuth step. Each call created and closed
+an event loop, so nothing bound to a loop (MCP sessions, httpx pools, the
+async database pool) could outlive a single message. BackgroundLoop runs one
+event loop on a daemon thread for the lifetime of the process; script threads
+hand coroutines to it through run(), which waits with a timeout and cancels
+the coroutine if the wait is abandoned. The caller's context variables (the
+active trace span and the request id) travel with the coroutine.
+
+Environment:
+    ASYNC_CALL_TIMEOUT: Default seconds run() waits for a coroutine (default: 300)
+"""
+
+import asyncio
+import atexit
+import concurrent.futures
+import contextvars
+import os
+import threading
+
+from src.utils.log_utils import get_logger
+from src.utils.metrics import counter, gauge
+
+ASYNC_CALL_TIMEOUT = float(os.getenv("ASYNC_CALL_TIMEOUT", "300"))
+
+CALLS_IN_FLIGHT = gauge("lightgpt_app_async_calls_in_flight", "Coroutines submitted to the background event loop")
+CALL_TIMEOUTS = counter("lightgpt_app_async_timeouts_total", "Background coroutines cancelled after a timeout")
+
+logger = get_logger("event_loop")
+
+
+async def _run_in_context(context, coro):
+    # The task copies the submitting thread's context instead of the loop thread's
+    return await context.run(asyncio.ensure_future, coro)
+
+
+class BackgroundLoop:
+    """
+    An asyncio event loop running on its own daemon thread.
+
+    Args:
+        name (str): Name of the loop thread
+    """
+
+    def __init__(self, name="event-loop"):
+        self.loop = asyncio.new_event_loop()
+        self._shutdown_callbacks = []
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        self._started.wait()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(self._started.set)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """
+        Schedule a coroutine on the loop without waiting for it.
+
+        Returns:
+            concurrent.futures.Future: Resolves with the coroutine's result;
+            cancelling it cancels the coroutine
+        """
+        context = contextvars.copy_context()
+        future = asyncio.run_coroutine_threadsafe(_run_in_context(context, coro), self.loop)
+        CALLS_IN_FLIGHT.inc()
+        future.add_done_callback(lambda _: CALLS_IN_FLIGHT.dec())
+        return future
+
+    def run(self, coro, timeout=ASYNC_CALL_TIMEOUT):
+        """
+        Run a coroutine on the loop and wait for its result.
+
+        Args:
+            coro: The coroutine to run
+            timeout (float, optional): Seconds to wait; None waits indefinitely
+
+        Returns:
+            The coroutine's result
+
+        Raises:
+            TimeoutError: If the coroutine did not finish in time; it is cancelled
+        """
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("BackgroundLoop.run() called from the loop thread; await the coroutine instead")
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            CALL_TIMEOUTS.inc()
+            raise TimeoutError(f"Coroutine did not finish within {timeout}s") from None
+        finally:
+            # Also reached when the script thread is interrupted, e.g. by a Streamlit rerun
+            if not future.done():
+                future.cancel()
+
+    def on_shutdown(self, callback):
+        """Register a coroutine function awaited on the loop when it shuts down, e.g. to close a pool."""
+        self._shutdown_callbacks.append(callback)
+
+    def shutdown(self, timeout=5.0):
+        """Run the shutdown callbacks, cancel pending tasks and stop the loop."""
+        if not self.loop.is_running():
+            return
+
+        async def close():
+            for callback in reversed(self._shutdown_callbacks):
+                try:
+                    await callback()
+                except Exception as e:
+                    logger.warning(f"Shutdown callback failed: {str(e)}")
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        try:
+            asyncio.run_coroutine_threadsafe(close(), self.loop).result(timeout)
+        except Exception as e:
+            logger.warning(f"Background event loop did not shut down cleanly: {str(e)}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_background_loop():
+    """Return the process-wide background loop, starting it on first use."""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                _loop = BackgroundLoop()
+                atexit.register(_loop.shutdown)
+    return _loop
+
+
+def run_async(coro, timeout=ASYNC_CALL_TIMEOUT):
+    """Run a coroutine on the process-wide background loop and wait for its result."""
+    return get_background_loop().run(coro, timeout)
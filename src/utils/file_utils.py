@@ -0,0 +1,129 @@
+"""
+Storage for uploaded PDFs.
+
+The PDF QA upload used to be read into memory and rewritten to
+static/uploaded_pdfs/<name> on every Streamlit rerun, and two users uploading
+files with the same name overwrote each other. store_upload() checks the
+declared size first, then streams the file in UPLOAD_CHUNK_SIZE chunks while
+hashing it, and stores it as <sha256>.pdf in a per-user directory. A file whose
+hash is already stored is not written again, and since the name changes with
+the content, the MCP server's index cached per file name stays valid.
+
+Environment:
+    UPLOAD_DIR: Root directory of uploaded PDFs (default: static/uploaded_pdfs)
+    PDF_MAX_UPLOAD_MB: Largest PDF accepted (default: 50)
+    UPLOAD_CHUNK_SIZE: Bytes read per chunk (default: 1 MB)
+"""
+
+import hashlib
+import os
+import tempfile
+
+from src.utils.log_utils import get_logger
+from src.utils.metrics import counter
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(PROJECT_ROOT, "static", "uploaded_pdfs"))
+PDF_MAX_UPLOAD_MB = float(os.getenv("PDF_MAX_UPLOAD_MB", "50"))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+PDF_MAGIC = b"%PDF-"
+
+UPLOADS = counter("lightgpt_app_pdf_uploads_total", "Uploaded PDFs by outcome", ("result",))
+
+logger = get_logger("files")
+
+
+class UploadRejected(ValueError):
+    """The uploaded file is too large or not a PDF."""
+
+
+def user_upload_dir(user_email):
+    """Directory of a user's uploads, named by a hash so emails do not appear in paths."""
+    key = hashlib.sha256((user_email or "anonymous").strip().lower().encode()).hexdigest()[:16]
+    return os.path.join(UPLOAD_DIR, key)
+
+
+def _chunks(fileobj, max_bytes):
+    """Read a file in chunks, enforcing the size limit and the PDF header as it goes."""
+    size = 0
+    first = True
+    while True:
+        chunk = fileobj.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            return
+        if first and not chunk.startswith(PDF_MAGIC):
+            raise UploadRejected("The file is not a PDF.")
+        first = False
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadRejected(f"The PDF is larger than {max_bytes / (1024 * 1024):g} MB.")
+        yield chunk
+
+
+def store_upload(fileobj, user_email, declared_size=None, max_bytes=None):
+    """
+    Store an uploaded PDF under a content-addressed name.
+
+    Args:
+        fileobj: Readable binary file, e.g. a Streamlit UploadedFile
+        user_email (str): Owner of the upload
+        declared_size (int, optional): Size reported by the upload, checked before reading
+        max_bytes (int, optional): Size limit, defaults to PDF_MAX_UPLOAD_MB
+
+    Returns:
+        tuple: (path, stored) where stored is False if the file was already there
+
+    Raises:
+        UploadRejected: If the file is too large or not a PDF
+    """
+    max_bytes = max_bytes or int(PDF_MAX_UPLOAD_MB * 1024 * 1024)
+    if declared_size is not None and declared_size > max_bytes:
+        UPLOADS.inc(result="rejected")
+        raise UploadRejected(f"The PDF is larger than {max_bytes / (1024 * 1024):g} MB.")
+
+    target_dir = user_upload_dir(user_email)
+    os.makedirs(target_dir, exist_ok=True)
+    seekable = hasattr(fileobj, "seekable") and fileobj.seekable()
+    try:
+        if seekable:
+            # Hash first: a file that is already stored is never written again
+            fileobj.seek(0)
+            digest = hashlib.sha256()
+            for chunk in _chunks(fileobj, max_bytes):
+                digest.update(chunk)
+            path = os.path.join(target_dir, f"{digest.hexdigest()}.pdf")
+            if os.path.exists(path):
+                UPLOADS.inc(result="duplicate")
+                return path, False
+            fileobj.seek(0)
+        path, stored = _write(fileobj, target_dir, max_bytes)
+    except UploadRejected:
+        UPLOADS.inc(result="rejected")
+        raise
+    UPLOADS.inc(result="stored" if stored else "duplicate")
+    if stored:
+        logger.info(f"Stored uploaded PDF {os.path.basename(path)}")
+    return path, stored
+
+
+def _write(fileobj, target_dir, max_bytes):
+    """Stream a file to a temporary name while hashing it, then move it to <sha256>.pdf."""
+    digest = hashlib.sha256()
+    handle, temp_path = tempfile.mkstemp(dir=target_dir, suffix=".part")
+    try:
+        with os.fdopen(handle, "wb") as out:
+            for chunk in _chunks(fileobj, max_bytes):
+                digest.update(chunk)
+                out.write(chunk)
+        path = os.path.join(target_dir, f"{digest.hexdigest()}.pdf")
+        if os.path.exists(path):
+            os.remove(temp_path)
+            return path, False
+        # Atomic, so the MCP server never reads a half-written file
+        os.replace(temp_path, path)
+        return path, True
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
@@ -1,44 +1,57 @@
-from groq import Groq
 import os
+import time
 from dotenv import load_dotenv
-from langchain.memory import ConversationBufferMemory
-from langchain.schema import HumanMessage, AIMessage
+from src.utils.clients import get_groq_client
+from src.utils.memory import ConversationMemory
+from src.utils.metrics import histogram, track_upstream, record_token_usage
+from src.utils.tracing import start_span
+from src.utils.log_utils import get_logger, log_payload
 
 load_dotenv()
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 MODEL_NAME = os.getenv("MODEL_NAME", "llama3-70b-8192")
 
-import logging
-logging.basicConfig(
-    filename='../logs/mcp_interactions.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+FORMATTING_LATENCY = histogram("lightgpt_formatting_seconds", "Time spent reformatting tool responses with the LLM")
 
-def llm_client(message: str, memory: ConversationBufferMemory):
-    memory_messages = memory.chat_memory.messages
+logger = get_logger("formatting")
+
+def _history(message: str, memory: ConversationMemory, query: str = None):
     message_history = [{"role": "system", "content": "You are an intelligent assistant. You will execute tasks as prompted"}]
     
-    for msg in memory_messages:
-        if isinstance(msg, HumanMessage):
-            message_history.append({"role": "user", "content": msg.content})
-        elif isinstance(msg, AIMessage):
-            message_history.append({"role": "assistant", "content": msg.content})
+    history, stats = memory.build_messages(query or message)
+    message_history.extend(history)
+    logger.debug(
+        f"Prompt history: {stats['history_tokens']} tokens "
+        f"({stats['tokens_saved']} saved of {stats['full_history_tokens']})"
+    )
     
     message_history.append({"role": "user", "content": message})
+    return message_history
+
+def llm_client_stream(message: str, memory: ConversationMemory, query: str = None):
+    """Ask the formatting model, yielding the answer in chunks as the model produces them."""
+    message_history = _history(message, memory, query)
     
-    groq_client = Groq(api_key=GROQ_API_KEY)
-    response = groq_client.chat.completions.create(
-        model=MODEL_NAME,
-        messages=message_history,
-        max_tokens=1000,
-        temperature=0.2
-    )
-    return response.choices[0].message.content.strip()
+    groq_client = get_groq_client()
+    content = []
+    with track_upstream("groq", "format_stream"):
+        stream = groq_client.chat.completions.create(
+            model=MODEL_NAME,
+            messages=message_history,
+            max_tokens=1000,
+            temperature=0.2,
+            stream=True
+        )
+        for chunk in stream:
+            # Groq reports usage on the last chunk
+            record_token_usage(MODEL_NAME, getattr(chunk, "x_groq", None))
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                content.append(delta)
+                yield delta
+    log_payload(logger, "Formatted response", "".join(content))
 
-def format_tool_response(query: str, raw_response: str, memory: ConversationBufferMemory):
-    prompt = (
+def _format_prompt(query: str, raw_response: str):
+    return (
         "You are an assistant tasked with reformatting a tool's response to make it clear, concise, and well-structured. "
         "Ensure the response directly answers the user's question, uses proper grammar, and is formatted in a professional manner. "
         "Avoid adding unnecessary details or altering the factual content unless it improves clarity. "
@@ -50,4 +63,25 @@ def format_tool_response(query: str, raw_response: str, memory: ConversationBuff
         f"Raw Tool Response: {raw_response}\n"
         "Reformatted Response:"
     )
-    return llm_client(prompt, memory)
\ No newline at end of file
+
+def format_tool_response_stream(query: str, raw_response: str, memory: ConversationMemory):
+    """
+    Reformat a tool's response, yielding the formatted text in chunks so the
+    UI can show it while the model is still writing.
+    
+    Falls back to the raw response if the call fails before any text arrived.
+    """
+    start = time.perf_counter()
+    streamed = False
+    try:
+        with start_span("format_tool_response", stream=True):
+            for chunk in llm_client_stream(_format_prompt(query, raw_response), memory, query=query):
+                streamed = True
+                yield chunk
+    except Exception as e:
+        if streamed:
+            raise
+        logger.warning(f"Formatting failed, showing the raw tool response: {str(e)}")
+        yield raw_response
+    finally:
+        FORMATTING_LATENCY.observe(time.perf_counter() - start)
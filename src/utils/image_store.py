@@ -0,0 +1,310 @@
+"""
+Image store for generated images.
+
+Rendering a message used to list the image directory, stat every file and
+delete all but the five newest each time an image was shown, which put
+filesystem work on the render path and removed images older chats still
+referenced. ImageStore keeps an in-memory index of the directory instead,
+with a reference count per image taken from the stored chat sessions. A
+background thread rescans the directory, reloads the references and evicts
+files: unreferenced images older than IMAGE_MAX_AGE first, then the oldest
+images while the directory is above IMAGE_STORE_MAX_BYTES, unreferenced
+ones before referenced ones. Images younger than IMAGE_GRACE_SECONDS are
+never evicted.
+
+The UI is served downscaled variants (IMAGE_VARIANT_WIDTH pixels wide),
+generated once per image and cached next to the originals. References to
+evicted images resolve to None so the UI can show a placeholder.
+
+Environment:
+    IMAGE_DIR: Directory the MCP server writes images to (default: server/image)
+    IMAGE_STORE_MAX_BYTES: Size budget of the directory (default: 200 MB)
+    IMAGE_MAX_AGE: Seconds after which unreferenced images are evicted (default: 7 days)
+    IMAGE_GRACE_SECONDS: Minimum age before any eviction (default: 600)
+    IMAGE_EVICT_INTERVAL: Seconds between background passes (default: 300)
+    IMAGE_VARIANT_WIDTH: Width of the variants shown in the chat (default: 400)
+"""
+
+import glob
+import os
+import threading
+import time
+from collections import Counter
+
+from src.utils.log_utils import get_logger
+from src.utils.metrics import counter, gauge
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+IMAGE_DIR = os.getenv("IMAGE_DIR", os.path.join(PROJECT_ROOT, "server", "image"))
+IMAGE_STORE_MAX_BYTES = int(os.getenv("IMAGE_STORE_MAX_BYTES", str(200 * 1024 * 1024)))
+IMAGE_MAX_AGE = float(os.getenv("IMAGE_MAX_AGE", str(7 * 24 * 3600)))
+IMAGE_GRACE_SECONDS = float(os.getenv("IMAGE_GRACE_SECONDS", "600"))
+IMAGE_EVICT_INTERVAL = float(os.getenv("IMAGE_EVICT_INTERVAL", "300"))
+IMAGE_VARIANT_WIDTH = int(os.getenv("IMAGE_VARIANT_WIDTH", "400"))
+
+VARIANT_DIR_NAME = ".variants"
+
+IMAGES_STORED = gauge("lightgpt_image_store_files", "Generated images on disk")
+IMAGES_BYTES = gauge("lightgpt_image_store_bytes", "Size of the generated images on disk")
+IMAGES_EVICTED = counter("lightgpt_image_store_evictions_total", "Generated images deleted by the store", ("reason",))
+
+logger = get_logger("images")
+
+
+def extract_image_path(result_text):
+    """
+    Extract the image path from a result text containing "Saved as:" marker.
+
+    Args:
+        result_text (str): The text containing an image path
+
+    Returns:
+        str or None: The extracted path or None if not found
+    """
+    if result_text and "Saved as:" in result_text:
+        return result_text.split("Saved as:")[1].strip()
+    return None
+
+
+def strip_image_path(result_text):
+    """Text of an image result without the "Saved as:" path, for display next to the image."""
+    if result_text and "Saved as:" in result_text:
+        return result_text.split("Saved as:")[0].strip()
+    return result_text
+
+
+class ImageStore:
+    """
+    In-memory index of generated images with reference counts and eviction.
+
+    Args:
+        image_dir (str): Directory holding the images
+        load_references (callable, optional): Returns the image paths referenced
+            by stored chat turns; called from the background thread
+        max_bytes (int): Size budget of the directory
+        max_age (float): Seconds after which unreferenced images are evicted
+        interval (float): Seconds between background passes
+    """
+
+    def __init__(self, image_dir=IMAGE_DIR, load_references=None, max_bytes=IMAGE_STORE_MAX_BYTES,
+                 max_age=IMAGE_MAX_AGE, interval=IMAGE_EVICT_INTERVAL):
+        self.image_dir = os.path.abspath(image_dir)
+        self.variant_dir = os.path.join(self.image_dir, VARIANT_DIR_NAME)
+        self.load_references = load_references
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._files = {}  # path -> (size, mtime)
+        self._variants = {}  # (path, width) -> variant path
+        self._missing = set()
+        self._references = Counter()
+        self._references_loaded = False
+        self._wakeup = threading.Event()
+        # The first pass (directory scan included) runs in the background right away
+        self._wakeup.set()
+        self._thread = threading.Thread(target=self._run, name="image-store", daemon=True)
+        self._thread.start()
+
+    def _scan(self):
+        files = {}
+        if os.path.isdir(self.image_dir):
+            with os.scandir(self.image_dir) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        files[os.path.abspath(entry.path)] = (stat.st_size, stat.st_mtime)
+        with self._lock:
+            self._files = files
+            self._missing.clear()
+            self._variants = {key: variant for key, variant in self._variants.items() if key[0] in files}
+            self._update_gauges()
+
+    def _update_gauges(self):
+        IMAGES_STORED.set(len(self._files))
+        IMAGES_BYTES.set(sum(size for size, _ in self._files.values()))
+
+    def _index(self, path):
+        """Look a path up, indexing it if it appeared since the last scan."""
+        with self._lock:
+            if path in self._files:
+                return True
+            if path in self._missing:
+                return False
+        try:
+            stat = os.stat(path)
+        except OSError:
+            # Remembered until the next scan so stale references cost no filesystem calls
+            with self._lock:
+                self._missing.add(path)
+            return False
+        with self._lock:
+            self._files[path] = (stat.st_size, stat.st_mtime)
+            self._update_gauges()
+        return True
+
+    def add_reference(self, path):
+        """Count a new chat turn referencing ``path`` until the next reload from the database."""
+        if path:
+            path = os.path.abspath(path)
+            with self._lock:
+                self._references[path] += 1
+                self._missing.discard(path)
+            if os.path.dirname(path) == self.image_dir:
+                self._index(path)
+
+    def variant(self, path, width=IMAGE_VARIANT_WIDTH):
+        """
+        Get a downscaled copy of an image for display.
+
+        Args:
+            path (str): Path of the original image
+            width (int): Maximum width of the variant
+
+        Returns:
+            str or None: Path of the variant (or of the original if it is
+            small enough or cannot be scaled), None if the image is gone
+        """
+        if not path:
+            return None
+        path = os.path.abspath(path)
+        if os.path.dirname(path) != self.image_dir:
+            # Not managed by the store, e.g. written by a server started elsewhere
+            return path if os.path.isfile(path) else None
+        key = (path, width)
+        with self._lock:
+            variant = self._variants.get(key)
+        if variant is not None:
+            return variant
+        if not self._index(path):
+            return None
+        variant = self._make_variant(path, width)
+        with self._lock:
+            if path in self._files:
+                self._variants[key] = variant
+        return variant
+
+    def _make_variant(self, path, width):
+        if Image is None:
+            return path
+        name, _ = os.path.splitext(os.path.basename(path))
+        target = os.path.join(self.variant_dir, f"{name}_{width}.jpg")
+        if os.path.exists(target):
+            return target
+        try:
+            with Image.open(path) as image:
+                if image.width <= width:
+                    return path
+                image.thumbnail((width, width * image.height // image.width))
+                os.makedirs(self.variant_dir, exist_ok=True)
+                image.convert("RGB").save(target, "JPEG", quality=85, optimize=True)
+            return target
+        except OSError as e:
+            logger.warning(f"Could not create variant of {path}: {str(e)}")
+            return path
+
+    def _remove(self, path, reason):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        name, _ = os.path.splitext(os.path.basename(path))
+        with self._lock:
+            self._files.pop(path, None)
+            for key in [key for key in self._variants if key[0] == path]:
+                del self._variants[key]
+        for variant in glob.glob(os.path.join(glob.escape(self.variant_dir), f"{glob.escape(name)}_*.jpg")):
+            try:
+                os.remove(variant)
+            except FileNotFoundError:
+                pass
+        IMAGES_EVICTED.inc(reason=reason)
+        logger.info(f"Evicted image {name} ({reason})")
+
+    def evict(self, now=None):
+        """
+        Evict images by age and size.
+
+        Returns:
+            int: Images deleted
+        """
+        now = now or time.time()
+        with self._lock:
+            if not self._references_loaded:
+                # Without reference counts every image would look unused
+                return 0
+            files = sorted(self._files.items(), key=lambda item: item[1][1])
+            references = Counter(self._references)
+        candidates = [(path, size, mtime) for path, (size, mtime) in files if now - mtime >= IMAGE_GRACE_SECONDS]
+        evicted = 0
+        total = sum(size for _, (size, _) in files)
+
+        for path, size, mtime in candidates:
+            if not references[path] and now - mtime >= self.max_age:
+                self._remove(path, "age")
+                total -= size
+                evicted += 1
+
+        # Over budget: oldest unreferenced images go first, then the oldest referenced ones
+        with self._lock:
+            remaining = [c for c in candidates if c[0] in self._files]
+        for path, size, _ in sorted(remaining, key=lambda c: (references[c[0]] > 0, c[2])):
+            if total <= self.max_bytes:
+                break
+            self._remove(path, "size")
+            total -= size
+            evicted += 1
+        with self._lock:
+            self._update_gauges()
+        return evicted
+
+    def reload_references(self):
+        """Replace the reference counts with those of the stored chat turns."""
+        if self.load_references is None:
+            return
+        references = Counter(os.path.abspath(path) for path in self.load_references() if path)
+        with self._lock:
+            self._references = references
+            self._references_loaded = True
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self._scan()
+                self.reload_references()
+                self.evict()
+            except Exception as e:
+                logger.warning(f"Image store maintenance failed: {str(e)}")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_image_store(load_references=None):
+    """
+    Return the process-wide image store, creating it on first use.
+
+    Args:
+        load_references (callable, optional): Reference loader; set on the
+            store if it does not have one yet
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ImageStore(load_references=load_references)
+    if load_references is not None and _store.load_references is None:
+        _store.load_references = load_references
+        _store.wake()
+    return _store
@@ -0,0 +1,218 @@
+"""
+Logging Utilities for MCP Assistant
+
+This module contains the shared logging setup for the Streamlit app, the MCP
+client and the MCP server. Log calls only put a record on an in-memory queue;
+a background listener thread formats each record as a JSON line and writes it
+to a size-rotated file. Large messages are truncated before they are queued,
+and payload logging (full prompts or responses) can be sampled.
+
+Configuration (environment variables):
+    LOG_DIR: Directory for log files (default: src/logs)
+    LOG_FILE: Full path of the log file (default: <LOG_DIR>/<process>.log)
+    LOG_PROCESS_NAME: Process label used in the default file name
+    LOG_LEVEL: Default level for every component (default: INFO)
+    LOG_LEVEL_<COMPONENT>: Level for one component, e.g. LOG_LEVEL_CLIENT=DEBUG
+    LOG_MAX_BYTES / LOG_BACKUP_COUNT: Rotation size and number of kept files
+    LOG_MAX_MESSAGE_CHARS: Messages longer than this are truncated
+    LOG_PAYLOAD_SAMPLE_RATE: Fraction of log_payload() calls that are written
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from src.utils.tracing import current_span
+
+ROOT_LOGGER = "lightgpt"
+DEFAULT_LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "logs")
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_MAX_MESSAGE_CHARS = int(os.getenv("LOG_MAX_MESSAGE_CHARS", "2000"))
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "1.0"))
+
+_request_id = contextvars.ContextVar("lightgpt_request_id", default=None)
+_configure_lock = threading.Lock()
+_listener = None
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+def truncate(text, limit=None):
+    """
+    Shorten a string for logging, noting how much was cut.
+
+    Args:
+        text (str): Text to shorten
+        limit (int, optional): Maximum characters to keep
+
+    Returns:
+        str: The text, truncated with a marker if it was too long
+    """
+    limit = limit or LOG_MAX_MESSAGE_CHARS
+    if text is None or len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [truncated {len(text) - limit} chars]"
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that captures request context on the calling thread.
+
+    Only the cheap work happens here: resolving the message, truncating it and
+    attaching the request and trace ids. JSON encoding and file I/O happen on
+    the listener thread.
+    """
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(vars(record))
+        record.msg = truncate(record.getMessage())
+        record.args = None
+        record.request_id = _request_id.get()
+        span = current_span()
+        record.trace_id = span.trace_id if span else None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _level_for(component):
+    return os.getenv(f"LOG_LEVEL_{component.upper()}", LOG_LEVEL).upper()
+
+
+def configure_logging(process_name=None):
+    """
+    Install the queue handler and start the background writer. Safe to call
+    more than once; only the first call has an effect.
+
+    Args:
+        process_name (str, optional): Label used for the default log file name
+    """
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            return
+        process_name = os.getenv("LOG_PROCESS_NAME") or process_name or "lightgpt"
+        log_dir = os.getenv("LOG_DIR", DEFAULT_LOG_DIR)
+        log_file = os.getenv("LOG_FILE") or os.path.join(log_dir, f"{process_name}.log")
+        os.makedirs(os.path.dirname(log_file), exist_ok=True)
+
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+        )
+        file_handler.setFormatter(JsonFormatter())
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = ContextQueueHandler(log_queue)
+
+        # Our own loggers go through the queue at their configured level;
+        # third-party libraries only reach the file at WARNING and above.
+        app_logger = logging.getLogger(ROOT_LOGGER)
+        app_logger.setLevel(LOG_LEVEL)
+        app_logger.addHandler(queue_handler)
+        app_logger.propagate = False
+
+        root = logging.getLogger()
+        root.setLevel(logging.WARNING)
+        root.addHandler(queue_handler)
+
+        _listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+
+def get_logger(component):
+    """
+    Return the logger of a component. Records reach the log file once the
+    process entry point has called configure_logging().
+
+    Args:
+        component (str): Component name, e.g. "client", "server", "db"
+
+    Returns:
+        logging.Logger: Logger named "lightgpt.<component>" at its configured level
+    """
+    logger = logging.getLogger(f"{ROOT_LOGGER}.{component}")
+    logger.setLevel(_level_for(component))
+    return logger
+
+
+def new_request_id():
+    return uuid.uuid4().hex[:16]
+
+
+def get_request_id():
+    """Return the request id bound to the current context, if any."""
+    return _request_id.get()
+
+
+@contextmanager
+def request_context(request_id=None):
+    """
+    Bind a request id to every log record written inside the block.
+
+    Args:
+        request_id (str, optional): Id to use; a new one is generated if omitted
+
+    Yields:
+        str: The bound request id
+    """
+    token = _request_id.set(request_id or new_request_id())
+    try:
+        yield _request_id.get()
+    finally:
+        _request_id.reset(token)
+
+
+def log_payload(logger, label, payload, level=logging.DEBUG):
+    """
+    Log a large payload (prompt, LLM or tool response) at DEBUG, sampled and truncated.
+
+    Nothing is built unless the level is enabled and the call is picked by
+    LOG_PAYLOAD_SAMPLE_RATE; the full length is recorded next to the text.
+
+    Args:
+        logger (logging.Logger): Logger to write to
+        label (str): What the payload is, e.g. "tool response"
+        payload (str): The payload text
+        level (int): Level to log at
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if LOG_PAYLOAD_SAMPLE_RATE < 1.0 and random.random() >= LOG_PAYLOAD_SAMPLE_RATE:
+        return
+    text = payload if isinstance(payload, str) else str(payload)
+    logger.log(level, f"{label}: {truncate(text)}", extra={"payload_chars": len(text)})
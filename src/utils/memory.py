@@ -0,0 +1,249 @@
+"""
+Token-budgeted conversation memory.
+
+Response formatting used to send the whole ConversationBufferMemory with
+every message, so prompts grew with the session until they exceeded the
+context window. ConversationMemory keeps every turn but only puts
+MEMORY_TOKEN_BUDGET tokens of history into a prompt: a rolling summary of
+older turns, optionally the older turns most similar to the new question
+(by embedding similarity), and as many recent turns verbatim as still fit.
+
+Turns that leave the recent window are folded into the summary by a
+background worker, MEMORY_SUMMARY_BATCH turns at a time, so no message waits
+on summarization. Tokens are estimated from character counts; each call
+records how many prompt tokens the budget saved compared to sending the
+full history.
+
+Environment:
+    MEMORY_TOKEN_BUDGET: Tokens of history per prompt (default: 1500)
+    MEMORY_RECENT_TURNS: Turns never folded into the summary (default: 6)
+    MEMORY_SUMMARY_BATCH: Turns folded into the summary per update (default: 4)
+    MEMORY_SUMMARY_TOKENS: Maximum length of the summary (default: 300)
+    MEMORY_EMBED_MODEL: HuggingFace model for relevance retrieval; empty disables it
+    MEMORY_RELEVANT_TURNS: Older turns retrieved by similarity (default: 2)
+"""
+
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+from src.utils.clients import get_groq_client
+from src.utils.log_utils import get_logger
+from src.utils.metrics import counter, histogram, record_token_usage, track_upstream
+
+MODEL_NAME = os.getenv("MODEL_NAME", "llama3-70b-8192")
+
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "1500"))
+MEMORY_RECENT_TURNS = int(os.getenv("MEMORY_RECENT_TURNS", "6"))
+MEMORY_SUMMARY_BATCH = int(os.getenv("MEMORY_SUMMARY_BATCH", "4"))
+MEMORY_SUMMARY_TOKENS = int(os.getenv("MEMORY_SUMMARY_TOKENS", "300"))
+MEMORY_EMBED_MODEL = os.getenv("MEMORY_EMBED_MODEL", "")
+MEMORY_RELEVANT_TURNS = int(os.getenv("MEMORY_RELEVANT_TURNS", "2"))
+
+# Rough tokens per character for English text with Llama tokenizers
+CHARS_PER_TOKEN = 4
+
+PROMPT_HISTORY_TOKENS = histogram(
+    "lightgpt_memory_prompt_tokens",
+    "Estimated tokens of conversation history sent per LLM call",
+    buckets=(50, 100, 250, 500, 1000, 2000, 4000, 8000),
+)
+TOKENS_SAVED = counter(
+    "lightgpt_memory_tokens_saved_total",
+    "Estimated prompt tokens saved by the memory budget compared to the full history",
+)
+SUMMARY_UPDATES = counter("lightgpt_memory_summary_updates_total", "Rolling summary updates", ("result",))
+
+logger = get_logger("memory")
+
+# One worker keeps each session's summary updates in order
+_summarizer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-summary")
+_embed_model = None
+_embed_lock = threading.Lock()
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text or "") / CHARS_PER_TOKEN)
+
+
+def _get_embed_model():
+    global _embed_model
+    if _embed_model is None:
+        with _embed_lock:
+            if _embed_model is None:
+                from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+                _embed_model = HuggingFaceEmbedding(model_name=MEMORY_EMBED_MODEL)
+    return _embed_model
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def summarize(summary, turns):
+    """
+    Fold turns into a running summary with the LLM.
+
+    Args:
+        summary (str): The current summary, possibly empty
+        turns (list): (user_message, assistant_message) tuples to add
+
+    Returns:
+        str: The updated summary
+    """
+    transcript = "\n".join(f"User: {user}\nAssistant: {assistant}" for user, assistant in turns)
+    prompt = (
+        "Update the running summary of a conversation with the new exchanges below. "
+        "Keep facts, names, decisions, open questions and user preferences; drop pleasantries. "
+        f"Answer with the updated summary only, in at most {MEMORY_SUMMARY_TOKENS} tokens.\n\n"
+        f"Current summary:\n{summary or '(none)'}\n\n"
+        f"New exchanges:\n{transcript}"
+    )
+    with track_upstream("groq", "summarize"):
+        response = get_groq_client().chat.completions.create(
+            model=MODEL_NAME,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=MEMORY_SUMMARY_TOKENS,
+            temperature=0.1,
+        )
+    record_token_usage(MODEL_NAME, response)
+    return response.choices[0].message.content.strip()
+
+
+class ConversationMemory:
+    """
+    Conversation history with a token budget and a rolling summary.
+
+    Args:
+        token_budget (int): Tokens of history per prompt
+        recent_turns (int): Turns kept out of the summary
+        summarizer (callable): (summary, turns) -> new summary
+    """
+
+    def __init__(self, token_budget=MEMORY_TOKEN_BUDGET, recent_turns=MEMORY_RECENT_TURNS, summarizer=summarize):
+        self.token_budget = token_budget
+        self.recent_turns = recent_turns
+        self.summarizer = summarizer
+        self.turns = []  # (user_message, assistant_message)
+        self.summary = ""
+        self.summarized = 0  # turns already folded into the summary
+        self._embeddings = {}
+        self._lock = threading.Lock()
+        self._summarizing = False
+
+    def load(self, turns):
+        """Start from stored turns, e.g. when a session is reopened; they are summarized as new turns arrive."""
+        with self._lock:
+            self.turns = list(turns)
+            self.summary = ""
+            self.summarized = 0
+            self._embeddings = {}
+
+    def add_turn(self, user_message, assistant_message):
+        """Record a finished exchange and fold old turns into the summary in the background."""
+        with self._lock:
+            self.turns.append((user_message, assistant_message))
+            ready = len(self.turns) - self.recent_turns - self.summarized
+            if ready < MEMORY_SUMMARY_BATCH or self._summarizing:
+                return
+            self._summarizing = True
+            start = self.summarized
+            batch = self.turns[start:start + ready]
+            summary = self.summary
+        _summarizer.submit(self._update_summary, summary, batch, start + len(batch))
+
+    def _update_summary(self, summary, batch, summarized):
+        try:
+            summary = self.summarizer(summary, batch)
+            SUMMARY_UPDATES.inc(result="ok")
+        except Exception as e:
+            # The turns stay unsummarized and are retried with the next batch
+            SUMMARY_UPDATES.inc(result="error")
+            logger.warning(f"Could not update conversation summary: {str(e)}")
+            with self._lock:
+                self._summarizing = False
+            return
+        with self._lock:
+            self.summary = summary
+            self.summarized = summarized
+            self._summarizing = False
+
+    def _relevant(self, query, turns, candidates, limit):
+        """Pick the older turns most similar to the query."""
+        if not MEMORY_EMBED_MODEL or not candidates or limit <= 0:
+            return []
+        try:
+            model = _get_embed_model()
+            query_embedding = model.get_query_embedding(query)
+            scored = []
+            for index in candidates:
+                if index not in self._embeddings:
+                    user, assistant = turns[index]
+                    self._embeddings[index] = model.get_text_embedding(f"{user}\n{assistant}")
+                scored.append((_cosine(query_embedding, self._embeddings[index]), index))
+        except Exception as e:
+            logger.warning(f"Relevance retrieval failed: {str(e)}")
+            return []
+        scored.sort(reverse=True)
+        return sorted(index for _, index in scored[:limit])
+
+    def build_messages(self, query):
+        """
+        Select the history to send with a new question.
+
+        Args:
+            query (str): The new question, used for relevance retrieval
+
+        Returns:
+            tuple: (messages, stats) where messages are chat completion
+            messages (system summary first, then turns oldest first) and stats
+            holds the estimated history tokens sent, the tokens of the full
+            history and the tokens saved
+        """
+        with self._lock:
+            turns = list(self.turns)
+            summary = self.summary
+            summarized = self.summarized
+
+        full_tokens = sum(estimate_tokens(user) + estimate_tokens(assistant) for user, assistant in turns)
+        budget = self.token_budget
+        messages = []
+        if summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation: {summary}"})
+            budget -= estimate_tokens(messages[0]["content"])
+
+        # Newest turns verbatim while they fit; the summary covers what it already folded in
+        selected = []
+        for index in range(len(turns) - 1, summarized - 1, -1):
+            cost = estimate_tokens(turns[index][0]) + estimate_tokens(turns[index][1])
+            if cost > budget:
+                break
+            selected.append(index)
+            budget -= cost
+
+        # selected is a contiguous run down from the newest turn, so everything before it is older
+        older = range(selected[-1] if selected else len(turns))
+        for index in self._relevant(query, turns, older, MEMORY_RELEVANT_TURNS):
+            cost = estimate_tokens(turns[index][0]) + estimate_tokens(turns[index][1])
+            if cost <= budget:
+                selected.append(index)
+                budget -= cost
+
+        for index in sorted(selected):
+            user, assistant = turns[index]
+            messages.append({"role": "user", "content": user})
+            messages.append({"role": "assistant", "content": assistant})
+
+        sent_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+        stats = {
+            "history_tokens": sent_tokens,
+            "full_history_tokens": full_tokens,
+            "tokens_saved": max(0, full_tokens - sent_tokens),
+        }
+        PROMPT_HISTORY_TOKENS.observe(sent_tokens)
+        TOKENS_SAVED.inc(stats["tokens_saved"])
+        return messages, stats
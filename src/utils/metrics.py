@@ -0,0 +1,279 @@
+"""
+Metrics Utilities for MCP Assistant
+
+This module contains a small process-wide registry of counters, gauges and
+histograms rendered in the Prometheus text exposition format, plus helpers
+for timing upstream API calls and recording LLM token usage. The MCP server
+serves the registry on its /metrics route; other processes can expose it with
+start_http_server().
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.utils.tracing import start_span
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 180.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = [
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in pairs
+    ]
+    return "{" + ",".join(escaped) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["buckets"][i] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of the enclosed block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self, **labels):
+        """Return (count, sum) for one label combination."""
+        state = self._values.get(self._key(labels))
+        return (state["count"], state["sum"]) if state else (0, 0.0)
+
+    def _render_sample(self, key, state):
+        lines = []
+        for bound, count in zip(self.buckets, state["buckets"]):
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', bound))} {count}")
+        lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {state['count']}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {state['sum']}")
+        lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state['count']}")
+        return lines
+
+
+class Registry:
+    """Holds every metric of the process, keyed by name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get_or_create(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+UPSTREAM_LATENCY = histogram(
+    "lightgpt_upstream_request_seconds",
+    "Latency of calls to upstream APIs",
+    ("provider", "operation"),
+)
+UPSTREAM_ERRORS = counter(
+    "lightgpt_upstream_errors_total",
+    "Failed calls to upstream APIs",
+    ("provider", "operation"),
+)
+LLM_TOKENS = counter(
+    "lightgpt_llm_tokens_total",
+    "Prompt and completion tokens reported by the LLM provider",
+    ("model", "kind"),
+)
+CACHE_REQUESTS = counter(
+    "lightgpt_cache_requests_total",
+    "Cache lookups by cache name and result (hit or miss)",
+    ("cache", "result"),
+)
+
+
+@contextmanager
+def track_upstream(provider, operation="request"):
+    """
+    Time a call to an upstream API and count it as an error if it raises.
+    The call is also recorded as a client span of the active trace.
+
+    Args:
+        provider (str): Upstream name, e.g. "groq", "tavily", "firecrawl", "pollinations"
+        operation (str): What the call does, e.g. "chat", "search"
+    """
+    start = time.perf_counter()
+    with start_span(f"{provider}.{operation}", kind="CLIENT", provider=provider):
+        try:
+            yield
+        except Exception:
+            UPSTREAM_ERRORS.inc(provider=provider, operation=operation)
+            raise
+        finally:
+            UPSTREAM_LATENCY.observe(time.perf_counter() - start, provider=provider, operation=operation)
+
+
+def record_token_usage(model, response):
+    """
+    Record the token usage reported on a chat completion response.
+
+    Args:
+        model (str): Model name used for the request
+        response: Chat completion response with an optional ``usage`` attribute
+    """
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    LLM_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, model=model, kind="prompt")
+    LLM_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, model=model, kind="completion")
+
+
+def record_cache_lookup(cache, hit):
+    """Count a cache lookup as a hit or a miss."""
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def render_latest():
+    """Render every registered metric in the Prometheus text format."""
+    return REGISTRY.render()
+
+
+_http_server = None
+_http_server_lock = threading.Lock()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render_latest().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, host="127.0.0.1"):
+    """
+    Serve the registry on a background thread. Safe to call more than once.
+
+    Args:
+        port (int): Port to listen on
+        host (str): Interface to bind
+
+    Returns:
+        bool: True if the server is running, False if the port could not be bound
+    """
+    global _http_server
+    with _http_server_lock:
+        if _http_server is not None:
+            return True
+        try:
+            _http_server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError:
+            return False
+        thread = threading.Thread(target=_http_server.serve_forever, name="metrics-http", daemon=True)
+        thread.start()
+        return True
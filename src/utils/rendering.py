@@ -0,0 +1,228 @@
+"""
+Incremental rendering of assistant replies.
+
+The typing effect used to resend the whole message HTML after every
+character, so a long answer cost thousands of websocket deltas and O(n²)
+bytes. IncrementalRenderer splits the reply into blocks (paragraphs and
+fenced code blocks) and keeps two placeholders: completed blocks are
+rendered as markdown in the message bubble, updated once per block, while
+only the block being typed is refreshed, at most RENDER_FPS times a second
+and always on a word boundary. Code blocks appear whole once reached, and a
+block's markdown is rendered only after it is complete; until then its text
+is shown escaped. Replies are revealed no slower than RENDER_MAX_SECONDS in
+total however long they are.
+
+render_stream() shows a reply that is still being generated, e.g. by the
+formatting LLM call: blocks settle as soon as the next one starts, and the
+block being written is refreshed at most RENDER_FPS times a second.
+
+Environment:
+    RENDER_FPS: Maximum UI updates per second while typing (default: 20)
+    RENDER_MAX_SECONDS: Upper bound on the typing effect per reply (default: 4)
+"""
+
+import html
+import os
+import time
+
+import streamlit as st
+
+from src.utils.log_utils import get_logger
+from src.utils.metrics import histogram
+
+RENDER_FPS = float(os.getenv("RENDER_FPS", "20"))
+RENDER_MAX_SECONDS = float(os.getenv("RENDER_MAX_SECONDS", "4"))
+
+RENDER_SECONDS = histogram(
+    "lightgpt_app_render_seconds",
+    "Time to render an assistant reply with the typing effect",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0),
+)
+RENDER_DELTAS = histogram(
+    "lightgpt_app_render_deltas",
+    "UI updates sent to the browser per assistant reply",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+
+logger = get_logger("ui")
+
+
+def split_blocks(text):
+    """
+    Split markdown into paragraphs and fenced code blocks.
+
+    Args:
+        text (str): Markdown text
+
+    Returns:
+        list: (kind, text) tuples where kind is "text" or "code"; joining the
+        texts with blank lines gives back the markdown
+    """
+    blocks = []
+    lines = []
+    fence = None
+
+    def close(kind):
+        if lines:
+            blocks.append((kind, "\n".join(lines)))
+            lines.clear()
+
+    for line in text.split("\n"):
+        stripped = line.strip()
+        if fence is None and stripped.startswith("```"):
+            close("text")
+            fence = stripped[:3]
+            lines.append(line)
+        elif fence is not None:
+            lines.append(line)
+            if stripped.startswith(fence) and len(lines) > 1:
+                close("code")
+                fence = None
+        elif not stripped:
+            close("text")
+        else:
+            lines.append(line)
+    # An unterminated fence is shown as it is, all at once
+    close("code" if fence is not None else "text")
+    return blocks
+
+
+def message_html(body, avatar="🖥️", role="Assistant"):
+    return f"""
+        <div class="stChatMessage" data-testid="stChatMessage-{role}">
+            <div class="avatar">{avatar}</div>
+            <div class="message-content">{body}</div>
+        </div>
+    """
+
+
+class IncrementalRenderer:
+    """
+    Types out one assistant reply with a bounded number of UI updates.
+
+    Args:
+        fps (float): Maximum updates per second for the block being typed
+        max_seconds (float): Upper bound on the whole typing effect
+    """
+
+    def __init__(self, fps=RENDER_FPS, max_seconds=RENDER_MAX_SECONDS):
+        self.frame = 1.0 / fps
+        self.max_seconds = max_seconds
+        self.deltas = 0
+        self.container = st.container()
+        with self.container:
+            self._settled = st.empty()
+            self._live = st.empty()
+
+    def _show_settled(self, blocks):
+        self._settled.markdown(message_html("\n\n".join(blocks)), unsafe_allow_html=True)
+        self.deltas += 1
+
+    def _show_live(self, text):
+        self._live.markdown(
+            f'<div class="message-content">{html.escape(text)}</div>', unsafe_allow_html=True
+        )
+        self.deltas += 1
+
+    def render(self, text, prefix="", typing_speed=0.01):
+        """
+        Render a reply, typing it out block by block.
+
+        Args:
+            text (str): Markdown of the reply
+            prefix (str): Shown immediately, e.g. the "Tool used:" line
+            typing_speed (float): Seconds per character at the slowest
+
+        Returns:
+            dict: deltas sent, seconds spent and characters rendered
+        """
+        start = time.perf_counter()
+        blocks = split_blocks(text)
+        typed_chars = sum(len(block) for kind, block in blocks if kind == "text")
+        chars_per_second = max(1.0 / typing_speed if typing_speed else float("inf"),
+                               typed_chars / self.max_seconds)
+        chars_per_frame = max(1, int(chars_per_second * self.frame))
+
+        settled = [prefix] if prefix else []
+        if settled:
+            self._show_settled(settled)
+        for kind, block in blocks:
+            typed = False
+            if kind == "text":
+                shown = block.find(" ", chars_per_frame)
+                while shown != -1:
+                    self._show_live(block[:shown])
+                    typed = True
+                    time.sleep(self.frame)
+                    shown = block.find(" ", shown + chars_per_frame)
+            settled.append(block)
+            self._show_settled(settled)
+            if typed:
+                self._live.empty()
+                self.deltas += 1
+
+        stats = {
+            "deltas": self.deltas,
+            "seconds": time.perf_counter() - start,
+            "chars": len(text) + len(prefix),
+        }
+        RENDER_SECONDS.observe(stats["seconds"])
+        RENDER_DELTAS.observe(stats["deltas"])
+        logger.debug(f"Rendered {stats['chars']} chars in {stats['seconds']:.2f}s with {stats['deltas']} deltas")
+        return stats
+
+    def render_stream(self, chunks, prefix=""):
+        """
+        Render a reply while it is being generated.
+
+        Args:
+            chunks (iterable): Text chunks of the reply, in order
+            prefix (str): Shown immediately, e.g. the "Tool used:" line
+
+        Returns:
+            dict: deltas sent, seconds spent, characters rendered and the
+            full text of the reply
+        """
+        start = time.perf_counter()
+        settled = [prefix] if prefix else []
+        if settled:
+            self._show_settled(settled)
+        text = ""
+        done = 0  # blocks already settled
+        last_frame = 0.0
+        live = False
+        for chunk in chunks:
+            text += chunk
+            now = time.perf_counter()
+            if "\n" not in chunk and now - last_frame < self.frame:
+                continue
+            blocks = split_blocks(text)
+            # The last block may still grow; everything before it is final
+            if len(blocks) - 1 > done:
+                self._show_settled(settled + [block for _, block in blocks[:-1]])
+                done = len(blocks) - 1
+                if live:
+                    self._live.empty()
+                    self.deltas += 1
+                    live = False
+            if blocks and now - last_frame >= self.frame:
+                self._show_live(blocks[-1][1])
+                live = True
+                last_frame = now
+
+        text = text.strip()
+        self._show_settled(settled + [block for _, block in split_blocks(text)])
+        if live:
+            self._live.empty()
+            self.deltas += 1
+
+        stats = {
+            "deltas": self.deltas,
+            "seconds": time.perf_counter() - start,
+            "chars": len(text) + len(prefix),
+            "text": text,
+        }
+        RENDER_SECONDS.observe(stats["seconds"])
+        RENDER_DELTAS.observe(stats["deltas"])
+        logger.debug(f"Streamed {stats['chars']} chars in {stats['seconds']:.2f}s with {stats['deltas']} deltas")
+        return stats
@@ -0,0 +1,126 @@
+"""
+Response shaping: decide whether a tool's output needs the formatting LLM call.
+
+Most tools already produce finished markdown (their prompts on the MCP
+server carry the formatting rules), so a second LLM call that restyles the
+text mostly adds latency. shape_response() applies a per-tool policy and
+cheap structural checks and only asks for reformatting when the output
+looks raw: empty, JSON-like, a raw search dump, a wall of text, unbalanced
+code fences or HTML.
+
+FORMATTING_MODE selects the behaviour:
+    auto    per-tool policy plus structural checks (default)
+    always  reformat every answer, as before
+    ab      A/B test: FORMATTING_AB_RATIO of the messages use "always", the
+            rest "auto"; every decision is labelled with its arm in the metrics
+
+Environment:
+    FORMATTING_MODE: auto, always or ab (default: auto)
+    FORMATTING_AB_RATIO: Share of messages in the "always" arm in ab mode (default: 0.5)
+"""
+
+import os
+import random
+import re
+from collections import namedtuple
+
+from src.utils.metrics import counter, histogram
+
+FORMATTING_MODE = os.getenv("FORMATTING_MODE", "auto").lower()
+FORMATTING_AB_RATIO = float(os.getenv("FORMATTING_AB_RATIO", "0.5"))
+
+# Per-tool policy: "skip" trusts the tool's own formatting, "check" runs the
+# structural checks, "always" reformats every time
+TOOL_POLICIES = {
+    "general_qa": "check",
+    "chat_with_assistant": "check",
+    "tavily_search": "check",
+    "generate_prompt": "check",
+    "math_solver": "check",
+    "pdf_qa": "check",
+    "generate_code": "skip",
+    "deep_research": "skip",
+    "generate_image": "skip",
+}
+DEFAULT_POLICY = "check"
+
+WALL_OF_TEXT_CHARS = 1200
+MIN_ANSWER_CHARS = 2
+
+SHAPING_DECISIONS = counter(
+    "lightgpt_response_shaping_decisions_total",
+    "Answers sent to or kept from the formatting LLM call",
+    ("tool", "arm", "decision", "reason"),
+)
+SHAPING_SECONDS = histogram(
+    "lightgpt_response_shaping_seconds",
+    "Time spent shaping an answer, i.e. formatting it or deciding not to",
+    ("tool", "arm", "decision"),
+)
+
+ShapingDecision = namedtuple("ShapingDecision", ["reformat", "reason", "arm"])
+
+_HTML_TAG = re.compile(r"<(div|span|p|br|table|html|body)\b", re.IGNORECASE)
+
+
+def structural_issue(text):
+    """
+    Cheap checks for output that still needs reformatting.
+
+    Args:
+        text (str): The tool output
+
+    Returns:
+        str or None: Name of the first problem found, None if the text looks finished
+    """
+    stripped = (text or "").strip()
+    if len(stripped) < MIN_ANSWER_CHARS:
+        return "empty"
+    if stripped[0] in "{[" and stripped[-1] in "}]":
+        return "json"
+    if stripped.startswith("Search Results:") or stripped.startswith("Error"):
+        return "raw_output"
+    if stripped.count("```") % 2:
+        return "unbalanced_code_fence"
+    if _HTML_TAG.search(stripped):
+        return "html"
+    if len(stripped) > WALL_OF_TEXT_CHARS and "\n" not in stripped:
+        return "wall_of_text"
+    return None
+
+
+def shape_response(tool, text, mode=FORMATTING_MODE):
+    """
+    Decide whether a tool's output goes through the formatting LLM call.
+
+    Args:
+        tool (str): Name of the tool that produced the output
+        text (str): The tool output
+        mode (str): auto, always or ab
+
+    Returns:
+        ShapingDecision: reformat flag, the reason and the A/B arm
+    """
+    arm = mode
+    if mode == "ab":
+        arm = "always" if random.random() < FORMATTING_AB_RATIO else "auto"
+
+    policy = TOOL_POLICIES.get(tool, DEFAULT_POLICY)
+    if policy == "skip":
+        # Tools whose output must stay verbatim are never reformatted, whatever the arm
+        decision = ShapingDecision(False, "policy", arm)
+    elif arm == "always" or policy == "always":
+        decision = ShapingDecision(True, "always", arm)
+    else:
+        issue = structural_issue(text)
+        decision = ShapingDecision(issue is not None, issue or "clean", arm)
+
+    SHAPING_DECISIONS.inc(
+        tool=tool, arm=decision.arm, decision="format" if decision.reformat else "skip", reason=decision.reason
+    )
+    return decision
+
+
+def record_shaping_time(tool, decision, seconds):
+    """Record how long the shaping stage took for one answer."""
+    SHAPING_SECONDS.observe(seconds, tool=tool, arm=decision.arm, decision="format" if decision.reformat else "skip")
@@ -0,0 +1,200 @@
+"""
+Signed session tokens for the login cookie.
+
+The cookie used to hold the whole Google userinfo JSON in plain text, and the
+first page load of every browser session opened a database connection to
+check that the cookie's session_id belonged to the user. A session token is
+a compact HMAC-SHA256 signed payload carrying the user's email and name, the
+chat session id, an expiry time and a random token id. It is verified in
+memory; the only shared state is the list of revoked token ids (written on
+logout), which each process reloads at most every SESSION_REVOCATION_TTL
+seconds.
+
+Token format: base64url(JSON claims) "." base64url(HMAC-SHA256(secret, claims part))
+
+Environment:
+    SESSION_TOKEN_SECRET: Signing key; set it so tokens survive restarts and
+        are accepted by every app process (a random key is used otherwise)
+    SESSION_TOKEN_TTL: Seconds a token stays valid (default: 7 days)
+    SESSION_REVOCATION_TTL: Seconds the revocation list is cached (default: 60)
+"""
+
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from src.utils.log_utils import get_logger
+from src.utils.metrics import counter
+
+load_dotenv()
+SESSION_TOKEN_SECRET = os.getenv("SESSION_TOKEN_SECRET", "")
+SESSION_TOKEN_TTL = int(os.getenv("SESSION_TOKEN_TTL", str(7 * 24 * 3600)))
+SESSION_REVOCATION_TTL = float(os.getenv("SESSION_REVOCATION_TTL", "60"))
+
+TOKEN_CHECKS = counter("lightgpt_app_session_token_checks_total", "Session tokens verified", ("result",))
+REVOCATION_RELOADS = counter("lightgpt_app_session_revocation_reloads_total", "Revocation list reloads", ("result",))
+
+logger = get_logger("auth")
+
+if SESSION_TOKEN_SECRET:
+    _secret = SESSION_TOKEN_SECRET.encode()
+else:
+    logger.warning("SESSION_TOKEN_SECRET is not set; login cookies will not survive a restart")
+    _secret = secrets.token_bytes(32)
+
+
+def _encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(payload):
+    return _encode(hmac.new(_secret, payload.encode(), hashlib.sha256).digest())
+
+
+def issue_token(email, name=None, session_id=None, ttl=SESSION_TOKEN_TTL, now=None):
+    """
+    Create a signed session token.
+
+    Args:
+        email (str): The user's email, used as the user id
+        name (str, optional): Display name
+        session_id (str, optional): Chat session to reopen
+        ttl (int): Seconds until the token expires
+
+    Returns:
+        str: The token
+    """
+    claims = {"u": email, "e": int((now or time.time()) + ttl), "j": _encode(secrets.token_bytes(9))}
+    if name:
+        claims["n"] = name
+    if session_id:
+        claims["s"] = session_id
+    payload = _encode(json.dumps(claims, separators=(",", ":")).encode())
+    return f"{payload}.{_sign(payload)}"
+
+
+def decode_token(token, now=None):
+    """
+    Verify a token's signature and expiry without the revocation check.
+
+    Returns:
+        dict or None: The claims, None if the token is malformed, forged or expired
+    """
+    try:
+        payload, signature = token.split(".")
+        if not hmac.compare_digest(signature, _sign(payload)):
+            TOKEN_CHECKS.inc(result="invalid")
+            return None
+        claims = json.loads(_decode(payload))
+    except (AttributeError, ValueError, binascii.Error):
+        TOKEN_CHECKS.inc(result="invalid")
+        return None
+    if claims.get("e", 0) <= (now or time.time()):
+        TOKEN_CHECKS.inc(result="expired")
+        return None
+    return claims
+
+
+def verify_token(token, now=None):
+    """
+    Verify a token, including the revocation check.
+
+    Returns:
+        dict or None: The claims (u: email, n: name, s: session id, e: expiry,
+        j: token id), None if the token is not valid
+    """
+    claims = decode_token(token, now)
+    if claims is None:
+        return None
+    if get_revocations().is_revoked(claims["j"]):
+        TOKEN_CHECKS.inc(result="revoked")
+        return None
+    TOKEN_CHECKS.inc(result="valid")
+    return claims
+
+
+def revoke_token(token):
+    """
+    Revoke a token so it is refused from now on, e.g. on logout.
+
+    Returns:
+        bool: True if the revocation was stored for all processes
+    """
+    claims = decode_token(token)
+    if claims is None:
+        # Forged or expired tokens are refused anyway
+        return True
+    return get_revocations().revoke(claims["j"], datetime.fromtimestamp(claims["e"]))
+
+
+class RevocationCache:
+    """
+    Revoked token ids, reloaded from the database at most every ``ttl`` seconds.
+
+    Args:
+        load (callable): Returns the ids of unexpired revoked tokens; raises on failure
+        store (callable): (token_id, expires_at) -> bool, persists a revocation
+        ttl (float): Seconds the loaded list is used before reloading
+    """
+
+    def __init__(self, load, store, ttl=SESSION_REVOCATION_TTL):
+        self.load = load
+        self.store = store
+        self.ttl = ttl
+        self._revoked = frozenset()
+        self._local = {}  # token id -> expiry, revoked by this process; kept even if a reload fails
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def _reload(self):
+        try:
+            revoked = frozenset(self.load())
+            REVOCATION_RELOADS.inc(result="ok")
+        except Exception as e:
+            # Keep the previous list; a database outage must not log everyone out
+            REVOCATION_RELOADS.inc(result="error")
+            logger.warning(f"Could not reload revoked session tokens: {str(e)}")
+            revoked = self._revoked
+        self._revoked = revoked
+        self._loaded_at = time.monotonic()
+        now = datetime.now()
+        self._local = {token_id: expires for token_id, expires in self._local.items() if expires > now}
+
+    def is_revoked(self, token_id):
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl:
+                self._reload()
+            return token_id in self._revoked or token_id in self._local
+
+    def revoke(self, token_id, expires_at):
+        with self._lock:
+            self._local[token_id] = expires_at
+        return self.store(token_id, expires_at)
+
+
+_revocations = None
+_revocations_lock = threading.Lock()
+
+
+def get_revocations():
+    """Return the process-wide revocation cache, backed by revoked_session_tokens."""
+    global _revocations
+    if _revocations is None:
+        with _revocations_lock:
+            if _revocations is None:
+                from src.database.db import get_revoked_token_ids, revoke_session_token
+                _revocations = RevocationCache(get_revoked_token_ids, revoke_session_token)
+    return _revocations
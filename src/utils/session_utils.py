@@ -7,8 +7,16 @@ and other session-related utilities.
 
 import streamlit as st
 import os
-from langchain.memory import ConversationBufferMemory
-from src.utils.ui_utils import extract_image_path
+from src.utils.log_utils import get_logger
+from src.utils.memory import ConversationMemory
+from src.utils.image_store import extract_image_path
+
+logger = get_logger("session")
+
+# Turns replayed into the conversation memory when a session is opened
+MEMORY_TAIL_TURNS = int(os.getenv("MEMORY_TAIL_TURNS", "10"))
+# Messages rendered at the bottom of the chat; earlier ones are shown on demand
+RENDER_WINDOW_MESSAGES = int(os.getenv("RENDER_WINDOW_MESSAGES", "40"))
 
 def get_user_email():
     """
@@ -25,47 +33,156 @@ def get_user_email():
     else:
         return str(st.session_state["user"])
 
-def load_chat_history(session_id, get_chat_interactions, cookie_manager):
+def chat_message(role, content, interaction_id=None, tool=None, image_path=None):
     """
-    Load chat history from database for a specific session.
+    Build a chat message record as kept in st.session_state.messages.
     
     Args:
-        session_id (str): The ID of the chat session to load
-        get_chat_interactions (callable): Function to get chat interactions from DB
-        cookie_manager: Cookie manager instance for saving session data
+        role (str): "user" or "assistant"
+        content (str): The message text, without any "Tool used:" line
+        interaction_id (int, optional): Database ID of the turn, once stored
+        tool (str, optional): Tool that produced an assistant message
+        image_path (str, optional): Generated image shown with the message
         
     Returns:
-        None: Updates session state directly
+        dict: The message record
     """
-    # Reset session state
-    st.session_state.messages = []
-    st.session_state.memory = ConversationBufferMemory(return_messages=True)
-    st.session_state.image_paths = []
-    
-    # Load interactions from database
-    interactions = get_chat_interactions(session_id)
-    for user_question, assistant_response, tool_used, timestamp in interactions:
-        # Add to session state
-        st.session_state.messages.append({'role': 'user', 'content': user_question})
-        st.session_state.messages.append({'role': 'assistant', 'content': assistant_response})
-        
-        # Add to memory for context
-        st.session_state.memory.chat_memory.add_user_message(user_question)
-        st.session_state.memory.chat_memory.add_ai_message(assistant_response)
-        
-        # Handle images if present
+    return {'role': role, 'content': content, 'interaction_id': interaction_id,
+            'tool': tool, 'image_path': image_path}
+
+def _interaction_messages(interactions):
+    """Turn transcript rows into chat message records."""
+    messages = []
+    for interaction_id, user_question, assistant_response, tool_used, timestamp in interactions:
+        image_path = None
         if tool_used == "generate_image":
             image_path = extract_image_path(assistant_response)
-            if image_path and os.path.exists(image_path):
-                st.session_state.image_paths.append(image_path)
+        messages.append(chat_message('user', user_question, interaction_id))
+        messages.append(chat_message('assistant', assistant_response, interaction_id, tool_used, image_path))
+    return messages
+
+def load_chat_history(session_id, get_chat_interactions_page, cookie_manager, get_session_owner_func=None):
+    """
+    Load the latest turns of a chat session from the database.
+    
+    Only the most recent page is fetched; older turns are loaded on demand
+    with load_older_messages(). The conversation memory is hydrated from the
+    last MEMORY_TAIL_TURNS turns rather than the whole history.
+    
+    Args:
+        session_id (str): The ID of the chat session to load
+        get_chat_interactions_page (callable): Function returning (rows, next_cursor)
+        cookie_manager: Cookie manager instance for saving session data
+        get_session_owner_func (callable, optional): Function returning a session's
+            owner; when given, a session without turns is checked for having been
+            deleted, e.g. one restored from the login token
+        
+    Returns:
+        bool: True if the session was loaded, False if it no longer exists
+    """
+    interactions, cursor = get_chat_interactions_page(session_id)
+    # Only an empty page can mean a deleted session, so loaded sessions cost no extra query
+    if not interactions and get_session_owner_func and get_session_owner_func(session_id) != get_user_email():
+        logger.info(f"Session {session_id} no longer exists")
+        st.session_state.session_id = None
+        st.session_state.loaded_session_id = None
+        return False
+    _set_history(session_id, interactions, cursor, cookie_manager)
+    return True
+
+def open_chat_at(session_id, created_at, interaction_id, get_chat_interactions_since, cookie_manager):
+    """
+    Open a chat session at a specific turn, e.g. a search result.
+    
+    The loaded window runs from that turn to the latest one; older turns can
+    still be fetched with load_older_messages(). The turn is remembered in
+    st.session_state.jump_to_interaction so the UI can scroll to it.
+    
+    Args:
+        session_id (str): The ID of the chat session to open
+        created_at (datetime): Timestamp of the target turn
+        interaction_id (int): ID of the target turn
+        get_chat_interactions_since (callable): Function returning (rows, next_cursor)
+        cookie_manager: Cookie manager instance for saving session data
+    """
+    interactions, cursor = get_chat_interactions_since(session_id, created_at, interaction_id)
+    _set_history(session_id, interactions, cursor, cookie_manager)
+    st.session_state.jump_to_interaction = interaction_id
+    # Everything from the target turn on must be rendered for the scroll to land
+    st.session_state.render_window = max(RENDER_WINDOW_MESSAGES, len(st.session_state.messages))
+
+def _set_history(session_id, interactions, cursor, cookie_manager):
+    """Replace the displayed transcript and the conversation memory."""
+    st.session_state.messages = _interaction_messages(interactions)
+    st.session_state.render_window = RENDER_WINDOW_MESSAGES
+    st.session_state.history_cursor = cursor
+    st.session_state.jump_to_interaction = None
+    
+    # Add the most recent turns to memory for context
+    st.session_state.memory = ConversationMemory()
+    st.session_state.memory.load(
+        (user_question, assistant_response)
+        for _, user_question, assistant_response, _, _ in interactions[-MEMORY_TAIL_TURNS:]
+    )
     
     # Update session ID
     st.session_state.session_id = session_id
+    st.session_state.loaded_session_id = session_id
     
     # Update cookies with new session_id
     if st.session_state.get("user"):
         cookie_manager.save_user_session(st.session_state["user"], session_id)
 
+def load_older_messages(get_chat_interactions_page):
+    """
+    Prepend the next older page of the current session's transcript.
+    
+    Args:
+        get_chat_interactions_page (callable): Function returning (rows, next_cursor)
+    """
+    cursor = st.session_state.get("history_cursor")
+    if not st.session_state.session_id or cursor is None:
+        return
+    interactions, cursor = get_chat_interactions_page(st.session_state.session_id, before=cursor)
+    messages = _interaction_messages(interactions)
+    st.session_state.messages = messages + st.session_state.messages
+    st.session_state.render_window += len(messages)
+    st.session_state.history_cursor = cursor
+
+def get_visible_messages():
+    """
+    Get the window of messages to render.
+    
+    Returns:
+        tuple: (hidden, messages) where hidden is the number of earlier
+        messages left out and messages are the ones to render
+    """
+    messages = st.session_state.messages
+    hidden = max(0, len(messages) - st.session_state.render_window)
+    return hidden, messages[hidden:]
+
+def show_earlier_messages():
+    """Widen the rendered window by another RENDER_WINDOW_MESSAGES messages."""
+    st.session_state.render_window += RENDER_WINDOW_MESSAGES
+
+def get_full_transcript(session_id, get_chat_interactions):
+    """
+    Get every message of a session with timestamps, e.g. for exporting.
+    
+    Args:
+        session_id (str): The chat session ID
+        get_chat_interactions (callable): Function returning the full transcript
+        
+    Returns:
+        list: Message dicts with role, content and timestamp
+    """
+    messages = []
+    for user_question, assistant_response, tool_used, created_at in get_chat_interactions(session_id):
+        timestamp = created_at.strftime("%Y-%m-%d %H:%M:%S")
+        messages.append({'role': 'user', 'content': user_question, 'timestamp': timestamp})
+        messages.append({'role': 'assistant', 'content': assistant_response, 'timestamp': timestamp})
+    return messages
+
 def init_session_state():
     """
     Initialize Streamlit session state variables if they don't exist.
@@ -76,18 +193,26 @@ def init_session_state():
         st.session_state.tools = []
     if 'tool_used' not in st.session_state:
         st.session_state.tool_used = None
-    if 'image_paths' not in st.session_state:
-        st.session_state.image_paths = []
+    if 'render_window' not in st.session_state:
+        st.session_state.render_window = RENDER_WINDOW_MESSAGES
     if 'memory' not in st.session_state:
-        st.session_state.memory = ConversationBufferMemory(return_messages=True)
+        st.session_state.memory = ConversationMemory()
     if 'pdf_path' not in st.session_state:
         st.session_state.pdf_path = None
+    if 'pdf_upload_id' not in st.session_state:
+        st.session_state.pdf_upload_id = None
     if "user" not in st.session_state:
         st.session_state["user"] = None
     if 'session_id' not in st.session_state:
         st.session_state.session_id = None
-    if 'delete_session_id' not in st.session_state:
-        st.session_state.delete_session_id = None
+    if 'session_list' not in st.session_state:
+        st.session_state.session_list = None
+    if 'loaded_session_id' not in st.session_state:
+        st.session_state.loaded_session_id = None
+    if 'history_cursor' not in st.session_state:
+        st.session_state.history_cursor = None
+    if 'jump_to_interaction' not in st.session_state:
+        st.session_state.jump_to_interaction = None
     # Streaming settings
     if 'typing_speed' not in st.session_state:
         st.session_state.typing_speed = 0.01  # Default typing speed
@@ -108,32 +233,16 @@ def load_user_from_cookies(cookie_manager):
         try:
             user_data, session_id = cookie_manager.load_user_session()
             if user_data:
-                # Verify this session belongs to the current user if session_id exists
+                # The signed token binds the session to this user, so no ownership query is needed;
+                # a session deleted since is caught when its history is loaded
                 if session_id:
-                    from src.database.db import get_db_connection
-                    import logging
-                    conn = get_db_connection()
-                    if conn:
-                        try:
-                            with conn.cursor() as cur:
-                                cur.execute(
-                                    "SELECT user_id FROM chat_sessions WHERE session_id = %s",
-                                    (session_id,)
-                                )
-                                result = cur.fetchone()
-                                if result and result[0] == user_data["email"]:
-                                    st.session_state.session_id = session_id
-                        except Exception as e:
-                            logging.error(f"Error verifying session: {str(e)}")
-                        finally:
-                            conn.close()
+                    st.session_state.session_id = session_id
                 
                 # Set the user in session state
                 st.session_state["user"] = user_data
                 return True
         except Exception as e:
-            import logging
-            logging.error(f"Error loading user session from cookies: {str(e)}")
+            logger.error(f"Error loading user session from cookies: {str(e)}")
     
     return False
 
@@ -142,8 +251,72 @@ def clear_session():
     st.session_state["user"] = None
     st.session_state.session_id = None
     st.session_state.messages = []
-    st.session_state.memory = ConversationBufferMemory(return_messages=True)
-    st.session_state.image_paths = []
+    st.session_state.memory = ConversationMemory()
+    st.session_state.render_window = RENDER_WINDOW_MESSAGES
+    st.session_state.session_list = None
+    st.session_state.loaded_session_id = None
+    st.session_state.history_cursor = None
+
+def get_session_list(user_email, get_chat_sessions_func):
+    """
+    Get the sidebar's chat session list, loading its first page if needed.
+    
+    The loaded pages are kept in session state, so reruns do not query the
+    database until reset_session_list() is called.
+    
+    Args:
+        user_email (str): The user's email
+        get_chat_sessions_func (callable): Function returning (rows, next_cursor)
+        
+    Returns:
+        dict: {"rows": [...], "cursor": next page cursor or None}
+    """
+    session_list = st.session_state.get("session_list")
+    if session_list is None or session_list["user"] != user_email:
+        rows, cursor = get_chat_sessions_func(user_email)
+        session_list = {"user": user_email, "rows": list(rows), "cursor": cursor}
+        st.session_state.session_list = session_list
+    return session_list
+
+def load_more_sessions(get_chat_sessions_func):
+    """
+    Append the next page of chat sessions to the sidebar list.
+    
+    Args:
+        get_chat_sessions_func (callable): Function returning (rows, next_cursor)
+    """
+    session_list = st.session_state.get("session_list")
+    if not session_list or session_list["cursor"] is None:
+        return
+    rows, cursor = get_chat_sessions_func(session_list["user"], before=session_list["cursor"])
+    session_list["rows"].extend(rows)
+    session_list["cursor"] = cursor
+
+def reset_session_list():
+    """Forget the loaded session list so the sidebar reloads it from the first page."""
+    st.session_state.session_list = None
+
+def start_new_chat(create_chat_session_func, cookie_manager):
+    """
+    Switch to a new, empty chat session.
+    
+    Args:
+        create_chat_session_func (callable): Function creating a session for a user email
+        cookie_manager: The cookie manager used to remember the active session
+        
+    Returns:
+        str: The new session ID, or None if it could not be created
+    """
+    session_id = create_chat_session_func(get_user_email())
+    st.session_state.session_id = session_id
+    st.session_state.loaded_session_id = session_id
+    st.session_state.history_cursor = None
+    st.session_state.messages = []
+    st.session_state.memory = ConversationMemory()
+    st.session_state.render_window = RENDER_WINDOW_MESSAGES
+    if session_id:
+        cookie_manager.save_user_session(st.session_state["user"], session_id)
+    return session_id
 
 
 def load_most_recent_session(user_email, get_latest_session_func):
@@ -0,0 +1,301 @@
+"""
+Tracing Utilities for MCP Assistant
+
+This module contains a lightweight span API used to follow one chat message
+through the Streamlit app, the MCP client, the MCP server and the upstream
+APIs. Trace context is propagated with W3C ``traceparent`` strings, finished
+spans are kept in memory for the debug panel and can be exported in the
+Zipkin v2 JSON format to a local file (one span per line) or to a collector.
+The MCP server sends the spans of each tool call back in the result's
+``_meta.spans``; the client adds them with ``add_remote_spans`` so the debug
+panel shows the whole message.
+
+Configuration (environment variables):
+    TRACE_FILE: Append finished spans to this file
+    TRACE_COLLECTOR_URL: POST finished spans to this Zipkin-compatible endpoint
+"""
+
+import contextvars
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from contextlib import contextmanager
+
+TRACE_FILE = os.getenv("TRACE_FILE")
+TRACE_COLLECTOR_URL = os.getenv("TRACE_COLLECTOR_URL")
+MAX_RECENT_TRACES = 50
+EXPORT_BATCH_SIZE = 100
+EXPORT_INTERVAL = 1.0
+
+logger = logging.getLogger("lightgpt.tracing")
+
+_current_span = contextvars.ContextVar("lightgpt_current_span", default=None)
+_span_collector = contextvars.ContextVar("lightgpt_span_collector", default=None)
+_service_name = "lightgpt"
+
+
+class Span:
+    """A timed operation belonging to a trace."""
+
+    def __init__(self, name, trace_id, parent_id=None, kind=None, tags=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.tags = dict(tags or {})
+        self.start = time.time()
+        self.duration = None
+        self.service = _service_name
+
+    def set_tag(self, key, value):
+        self.tags[key] = value
+
+    def finish(self):
+        self.duration = time.time() - self.start
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_zipkin(self):
+        span = {
+            "traceId": self.trace_id,
+            "id": self.span_id,
+            "name": self.name,
+            "timestamp": int(self.start * 1_000_000),
+            "duration": max(1, int((self.duration or 0) * 1_000_000)),
+            "localEndpoint": {"serviceName": self.service},
+            "tags": {k: str(v) for k, v in self.tags.items()},
+        }
+        if self.parent_id:
+            span["parentId"] = self.parent_id
+        if self.kind:
+            span["kind"] = self.kind
+        return span
+
+    @classmethod
+    def from_zipkin(cls, data):
+        span = cls(data["name"], data["traceId"], data.get("parentId"), data.get("kind"), data.get("tags"))
+        span.span_id = data["id"]
+        span.start = data["timestamp"] / 1_000_000
+        span.duration = data["duration"] / 1_000_000
+        span.service = data.get("localEndpoint", {}).get("serviceName", span.service)
+        return span
+
+
+class _RemoteParent:
+    """Parent context received from another process."""
+
+    def __init__(self, trace_id, span_id):
+        self.trace_id = trace_id
+        self.span_id = span_id
+
+
+def set_service_name(name):
+    """Set the service name stamped on spans created by this process."""
+    global _service_name
+    _service_name = name
+
+
+def parse_traceparent(value):
+    """
+    Parse a W3C traceparent string.
+
+    Args:
+        value (str): A "00-<trace_id>-<span_id>-<flags>" string
+
+    Returns:
+        _RemoteParent or None: The parent context, or None if the value is invalid
+    """
+    if not value or not isinstance(value, str):
+        return None
+    parts = value.split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return _RemoteParent(parts[1], parts[2])
+
+
+def current_span():
+    """Return the active span of the current context, if any."""
+    return _current_span.get()
+
+
+def current_traceparent():
+    """Return the traceparent of the active span, or None outside a trace."""
+    span = _current_span.get()
+    return span.traceparent if span else None
+
+
+@contextmanager
+def start_span(name, parent=None, kind=None, **tags):
+    """
+    Start a span as a child of ``parent`` or of the active span.
+
+    Args:
+        name (str): Span name
+        parent (str or Span, optional): A traceparent string or span to continue
+        kind (str, optional): Zipkin span kind, e.g. "CLIENT" or "SERVER"
+        **tags: Tags recorded on the span
+
+    Yields:
+        Span: The new span, active for the duration of the block
+    """
+    if isinstance(parent, str):
+        parent = parse_traceparent(parent)
+    parent = parent or _current_span.get()
+    if parent is not None:
+        span = Span(name, parent.trace_id, parent.span_id, kind, tags)
+    else:
+        span = Span(name, secrets.token_hex(16), None, kind, tags)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except Exception as e:
+        span.set_tag("error", str(e))
+        raise
+    finally:
+        _current_span.reset(token)
+        span.finish()
+        _record(span)
+
+
+@contextmanager
+def collect_spans():
+    """
+    Collect the spans finished inside the block.
+
+    Contexts copied from the block, e.g. for worker threads, collect too.
+
+    Yields:
+        list: The finished spans, filled in as they finish
+    """
+    spans = []
+    token = _span_collector.set(spans)
+    try:
+        yield spans
+    finally:
+        _span_collector.reset(token)
+
+
+_recent_lock = threading.Lock()
+_recent_traces = OrderedDict()
+
+
+def _remember(span):
+    # Caller holds _recent_lock
+    spans = _recent_traces.pop(span.trace_id, [])
+    spans.append(span)
+    _recent_traces[span.trace_id] = spans
+    while len(_recent_traces) > MAX_RECENT_TRACES:
+        _recent_traces.popitem(last=False)
+
+
+def _record(span):
+    with _recent_lock:
+        _remember(span)
+    collector = _span_collector.get()
+    if collector is not None:
+        collector.append(span)
+    if TRACE_FILE or TRACE_COLLECTOR_URL:
+        _exporter().submit(span)
+
+
+def add_remote_spans(spans):
+    """
+    Add spans finished by another process to the recent traces.
+
+    They are not exported again; the process that finished them did that.
+
+    Args:
+        spans (list): Spans in the Zipkin v2 JSON format; invalid entries are skipped
+    """
+    for data in spans or []:
+        try:
+            span = Span.from_zipkin(data)
+        except (KeyError, TypeError, ValueError):
+            continue
+        with _recent_lock:
+            if all(known.span_id != span.span_id for known in _recent_traces.get(span.trace_id, [])):
+                _remember(span)
+
+
+def get_trace(trace_id):
+    """
+    Return the finished spans of a recent trace, ordered by start time.
+
+    Args:
+        trace_id (str): Trace id to look up
+
+    Returns:
+        list: Span objects, empty if the trace is unknown
+    """
+    with _recent_lock:
+        spans = list(_recent_traces.get(trace_id, []))
+    return sorted(spans, key=lambda s: s.start)
+
+
+class _Exporter:
+    """Background thread that batches finished spans to a file and/or collector."""
+
+    def __init__(self, path=None, url=None):
+        self.path = path
+        self.url = url
+        self.queue = queue.Queue(maxsize=10000)
+        self.thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self.thread.start()
+
+    def submit(self, span):
+        try:
+            self.queue.put_nowait(span)
+        except queue.Full:
+            pass
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.time() + EXPORT_INTERVAL
+            while len(batch) < EXPORT_BATCH_SIZE and time.time() < deadline:
+                try:
+                    batch.append(self.queue.get(timeout=max(0.0, deadline - time.time())))
+                except queue.Empty:
+                    break
+            self._export([span.to_zipkin() for span in batch])
+
+    def _export(self, spans):
+        if self.path:
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    for span in spans:
+                        f.write(json.dumps(span) + "\n")
+            except OSError as e:
+                logger.error(f"Error writing trace spans: {str(e)}")
+        if self.url:
+            request = urllib.request.Request(
+                self.url,
+                data=json.dumps(spans).encode("utf-8"),
+                headers={"Content-Type": "application/json"},
+                method="POST",
+            )
+            try:
+                urllib.request.urlopen(request, timeout=5).close()
+            except Exception as e:
+                logger.error(f"Error exporting trace spans: {str(e)}")
+
+
+_exporter_instance = None
+_exporter_lock = threading.Lock()
+
+
+def _exporter():
+    global _exporter_instance
+    with _exporter_lock:
+        if _exporter_instance is None:
+            _exporter_instance = _Exporter(TRACE_FILE, TRACE_COLLECTOR_URL)
+        return _exporter_instance
@@ -6,11 +6,15 @@ displaying messages, formatting timestamps, and other UI helper functions.
 """
 
 import streamlit as st
+import streamlit.components.v1 as components
+import html
 import os
-import time
 from datetime import datetime
 
-def display_message(message, is_user=False, image_path=None):
+from src.utils.image_store import IMAGE_VARIANT_WIDTH, get_image_store, strip_image_path
+from src.utils.rendering import IncrementalRenderer
+
+def display_message(message, is_user=False, image_path=None, anchor_id=None):
     """
     Display a chat message in the Streamlit UI with proper formatting.
     
@@ -18,32 +22,50 @@ def display_message(message, is_user=False, image_path=None):
         message (str): The message content to display
         is_user (bool): Whether the message is from the user (True) or assistant (False)
         image_path (str, optional): Path to an image to display with the message
+        anchor_id (str, optional): HTML id for scrolling to and highlighting this message
     """
     avatar = "👤" if is_user else "🖥️"
+    anchor = f' id="{anchor_id}" style="outline: 2px solid #10a37f; border-radius: 8px;"' if anchor_id else ""
 
     message_html = f"""
-        <div class="stChatMessage" data-testid="stChatMessage-{'User' if is_user else 'Assistant'}">
+        <div class="stChatMessage" data-testid="stChatMessage-{'User' if is_user else 'Assistant'}"{anchor}>
             <div class="avatar">{avatar}</div>
             <div class="message-content">{message}</div>
         </div>
     """
     st.markdown(message_html, unsafe_allow_html=True)
 
-    if image_path and not is_user and os.path.exists(image_path):
+    if image_path and not is_user:
         with st.container():
-            st.image(image_path, caption="Generated Image", width=400)
+            display_image(image_path)
+
+def display_image(image_path):
+    """
+    Display a generated image from the image store, or a placeholder if it was evicted.
+    
+    Args:
+        image_path (str): Path of the original image
+    """
+    variant = get_image_store().variant(image_path)
+    if variant is None:
+        st.caption("🖼️ This image is no longer available.")
+    else:
+        st.image(variant, caption="Generated Image", width=IMAGE_VARIANT_WIDTH)
 
-        # Manage image storage - keep only the most recent 5 images
-        project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-        static_dir = os.path.join(project_root, "server")
-        image_dir = os.path.join(static_dir, "image")
-        if os.path.exists(image_dir):
-            image_files = [f for f in os.listdir(image_dir) if os.path.isfile(os.path.join(image_dir, f))]
-            if len(image_files) > 5:
-                # Sort by modification time and remove the oldest
-                image_files.sort(key=lambda x: os.path.getmtime(os.path.join(image_dir, x)))
-                for img_file in image_files[:-5]:  # Keep the 5 most recent
-                    os.remove(os.path.join(image_dir, img_file))
+def display_chat_message(message, anchor_id=None):
+    """
+    Display a chat message record built by session_utils.chat_message().
+    
+    Args:
+        message (dict): The message record
+        anchor_id (str, optional): HTML id for scrolling to and highlighting this message
+    """
+    content = message['content']
+    if message.get('image_path'):
+        content = strip_image_path(content)
+    if message.get('tool'):
+        content = f"Tool used: {message['tool']}\n\n{content}"
+    display_message(content, message['role'] == 'user', message.get('image_path'), anchor_id=anchor_id)
 
 def display_message_streaming(message, is_user=False, image_path=None, typing_speed=0.01):
     """
@@ -54,13 +76,14 @@ def display_message_streaming(message, is_user=False, image_path=None, typing_sp
         is_user (bool): Whether the message is from the user (True) or assistant (False)
         image_path (str, optional): Path to an image to display with the message
         typing_speed (float): Delay between characters to simulate typing speed
+        
+    Returns:
+        dict: Render statistics (deltas, seconds, chars), or None for user messages
     """
-    avatar = "👤" if is_user else "🖥️"
-    
     # For user messages, we don't need streaming
     if is_user:
         display_message(message, is_user, image_path)
-        return
+        return None
         
     # Extract "Tool used:" prefix to display immediately without streaming effect
     tool_prefix = ""
@@ -69,141 +92,64 @@ def display_message_streaming(message, is_user=False, image_path=None, typing_sp
     if "Tool used:" in message:
         lines = message.split("\n", 2)
         if len(lines) >= 2:
-            tool_prefix = lines[0] + "\n\n"
+            tool_prefix = lines[0]
             message_content = lines[2] if len(lines) > 2 else ""
     
-    # Handle code blocks specially
-    code_blocks = []
-    text_chunks = []
-    current_pos = 0
-    in_code_block = False
-    code_start = message_content.find("```", current_pos)
-    
-    while code_start != -1:
-        # Add text before code block
-        if code_start > current_pos:
-            text_chunks.append(message_content[current_pos:code_start])
-            
-        # Find end of code block
-        code_end = message_content.find("```", code_start + 3)
-        if code_end == -1:  # No closing tag
-            text_chunks.append(message_content[code_start:])
-            break
-        
-        # Add complete code block
-        code_blocks.append(message_content[code_start:code_end+3])
-        current_pos = code_end + 3
-        code_start = message_content.find("```", current_pos)
-    
-    # Add remaining text after last code block
-    if current_pos < len(message_content):
-        text_chunks.append(message_content[current_pos:])
-    
-    # If we found code blocks, we'll handle streaming differently
-    has_code_blocks = len(code_blocks) > 0
-    
-    # Create the message container
-    message_container = st.container()
-    
-    with message_container:
-        # Create the HTML structure
-        message_placeholder = st.empty()
-        
-        # Display tool prefix immediately
-        if tool_prefix:
-            full_message = tool_prefix
-            streaming_html = f"""
-                <div class="stChatMessage" data-testid="stChatMessage-Assistant">
-                    <div class="avatar">{avatar}</div>
-                    <div class="message-content">{full_message}</div>
-                </div>
-            """
-            message_placeholder.markdown(streaming_html, unsafe_allow_html=True)
-            time.sleep(0.5)  # Small pause after tool prefix
-        else:
-            full_message = ""
-        
-        if has_code_blocks:
-            # Stream text chunks and code blocks alternately
-            for i in range(max(len(text_chunks), len(code_blocks))):
-                # Stream text chunk
-                if i < len(text_chunks):
-                    text = text_chunks[i]
-                    for char in text:
-                        full_message += char
-                        streaming_html = f"""
-                            <div class="stChatMessage" data-testid="stChatMessage-Assistant">
-                                <div class="avatar">{avatar}</div>
-                                <div class="message-content">{full_message}</div>
-                            </div>
-                        """
-                        message_placeholder.markdown(streaming_html, unsafe_allow_html=True)
-                        time.sleep(typing_speed)
-                
-                # Add complete code block at once, not character by character
-                if i < len(code_blocks):
-                    full_message += code_blocks[i]
-                    streaming_html = f"""
-                        <div class="stChatMessage" data-testid="stChatMessage-Assistant">
-                            <div class="avatar">{avatar}</div>
-                            <div class="message-content">{full_message}</div>
-                        </div>
-                    """
-                    message_placeholder.markdown(streaming_html, unsafe_allow_html=True)
-                    time.sleep(0.5)  # Slightly longer pause after code block
-        else:                # Stream by paragraphs for better markdown rendering
-                paragraphs = message_content.split('\n\n')
-                current_msg = ""
-                
-                for i, paragraph in enumerate(paragraphs):
-                    # For first paragraph or short paragraphs, stream character by character
-                    if i == 0 or len(paragraph) < 80:
-                        for char in paragraph:
-                            current_msg += char
-                            full_message = tool_prefix + current_msg
-                            streaming_html = f"""
-                                <div class="stChatMessage" data-testid="stChatMessage-Assistant">
-                                    <div class="avatar">{avatar}</div>
-                                    <div class="message-content">{full_message}</div>
-                                </div>
-                            """
-                            message_placeholder.markdown(streaming_html, unsafe_allow_html=True)
-                            time.sleep(typing_speed)
-                    else:
-                        # For longer paragraphs, stream word by word for better performance
-                        words = paragraph.split(' ')
-                        for word in words:
-                            current_msg += word + ' '
-                            full_message = tool_prefix + current_msg
-                            streaming_html = f"""
-                                <div class="stChatMessage" data-testid="stChatMessage-Assistant">
-                                    <div class="avatar">{avatar}</div>
-                                    <div class="message-content">{full_message}</div>
-                                </div>
-                            """
-                            message_placeholder.markdown(streaming_html, unsafe_allow_html=True)
-                            time.sleep(typing_speed * 5)  # Slightly longer pause between words
-                    
-                    # Add paragraph break
-                    if i < len(paragraphs) - 1:
-                        current_msg += '\n\n'
+    renderer = IncrementalRenderer()
+    stats = renderer.render(message_content, prefix=tool_prefix, typing_speed=typing_speed)
+    message_container = renderer.container
             
     # Display image if available
-    if image_path and os.path.exists(image_path):
+    if image_path:
         with message_container:
-            st.image(image_path, caption="Generated Image", width=400)
+            display_image(image_path)
+
+    return stats
+
+def display_message_stream(chunks, prefix=""):
+    """
+    Display an assistant reply while it is still being generated.
+    
+    Args:
+        chunks (iterable): Text chunks of the reply
+        prefix (str): Shown immediately, e.g. the "Tool used:" line
+        
+    Returns:
+        dict: Render statistics (deltas, seconds, chars) and the full text
+    """
+    return IncrementalRenderer().render_stream(chunks, prefix=prefix)
 
-        # Same image management as in display_message
-        project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-        static_dir = os.path.join(project_root, "server")
-        image_dir = os.path.join(static_dir, "image")
-        if os.path.exists(image_dir):
-            image_files = [f for f in os.listdir(image_dir) if os.path.isfile(os.path.join(image_dir, f))]
-            if len(image_files) > 5:
-                # Sort by modification time and remove the oldest
-                image_files.sort(key=lambda x: os.path.getmtime(os.path.join(image_dir, x)))
-                for img_file in image_files[:-5]:  # Keep the 5 most recent
-                    os.remove(os.path.join(image_dir, img_file))
+def display_trace_waterfall(spans):
+    """
+    Display the spans of one trace as a waterfall chart.
+    
+    Args:
+        spans (list): Finished spans of a single trace, ordered by start time
+    """
+    if not spans:
+        st.caption("No trace recorded yet.")
+        return
+    
+    trace_start = min(span.start for span in spans)
+    trace_end = max(span.start + (span.duration or 0) for span in spans)
+    total = max(trace_end - trace_start, 1e-6)
+    depths = {}
+    rows = []
+    for span in spans:
+        depth = depths.get(span.parent_id, -1) + 1
+        depths[span.span_id] = depth
+        offset = (span.start - trace_start) / total * 100
+        width = max((span.duration or 0) / total * 100, 0.5)
+        color = "#d9534f" if "error" in span.tags else "#10a37f"
+        rows.append(
+            f"<div style='display: flex; align-items: center; font-size: 11px; margin: 2px 0;'>"
+            f"<div style='width: 45%; padding-left: {depth * 8}px; overflow: hidden; white-space: nowrap;'>{span.name}</div>"
+            f"<div style='width: 55%; position: relative; height: 10px;'>"
+            f"<div style='position: absolute; left: {offset:.2f}%; width: {width:.2f}%; height: 10px; background-color: {color}; border-radius: 2px;'></div>"
+            f"</div></div>"
+            f"<div style='font-size: 10px; color: #888; padding-left: {depth * 8}px;'>{(span.duration or 0) * 1000:.0f} ms</div>"
+        )
+    st.markdown(f"<small>Total: {total * 1000:.0f} ms</small>" + "".join(rows), unsafe_allow_html=True)
 
 def format_timestamp(timestamp):
     """
@@ -227,36 +173,49 @@ def format_timestamp(timestamp):
         dt = timestamp
     return dt.strftime("%b %d, %Y, %I:%M %p")
 
-def extract_image_path(result_text):
+def get_session_preview(title):
     """
-    Extract the image path from a result text containing "Saved as:" marker.
+    Get a preview of a chat session from its stored title.
     
     Args:
-        result_text (str): The text containing an image path
+        title (str or None): The session title (its first question)
         
     Returns:
-        str or None: The extracted path or None if not found
+        str: A preview of the first chat message or "Empty chat" if none
     """
-    if "Saved as:" in result_text:
-        return result_text.split("Saved as:")[1].strip()
-    return None
+    if title:
+        return title[:37] + "..." if len(title) > 40 else title
+    return "Empty chat"
 
-def get_session_preview(session_id, get_chat_interactions_func):
+def format_search_snippet(snippet, start_marker, stop_marker):
     """
-    Get a preview of the first message in a chat session.
+    Turn a search headline into safe HTML with the matches highlighted.
     
     Args:
-        session_id (str): The ID of the chat session
-        get_chat_interactions_func (callable): Function to get chat interactions
+        snippet (str): Headline text from the database
+        start_marker (str): Marker placed before each match
+        stop_marker (str): Marker placed after each match
         
     Returns:
-        str: A preview of the first chat message or "Empty chat" if none
+        str: Escaped HTML with <mark> around the matches
     """
-    interactions = get_chat_interactions_func(session_id)
-    if interactions:
-        first_question = interactions[0][0]
-        return first_question[:37] + "..." if len(first_question) > 40 else first_question
-    return "Empty chat"
+    escaped = html.escape(snippet or "").replace("\n", " ")
+    return escaped.replace(start_marker, "<mark>").replace(stop_marker, "</mark>")
+
+def scroll_to_anchor(anchor_id):
+    """
+    Scroll the chat to the element with the given HTML id.
+    
+    Args:
+        anchor_id (str): The id passed to display_message
+    """
+    components.html(
+        f"""<script>
+        const target = window.parent.document.getElementById({anchor_id!r});
+        if (target) {{ target.scrollIntoView({{behavior: "smooth", block: "center"}}); }}
+        </script>""",
+        height=0,
+    )
 
 def load_css(css_path):
     """